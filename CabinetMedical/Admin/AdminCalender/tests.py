@@ -1,3 +1,152 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from users.booking import book_consultation
+from users.models import Consultation, ConsultationTombstone, Doctor, User
+from users.tests import ROLLUP_QUERIES, BookingTestMixin, data_queries, next_monday_at
+
+
+class CalendarSyncTests(BookingTestMixin, TestCase):
+    url = '/api/Admin/calendar/'
+
+    def test_since_returns_only_changes(self):
+        client = self.client_for(self.admin)
+        kept = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        removed = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        token = client.get(self.url).data['token']
+
+        # les modifications datent d'avant le token: les sortir de la marge de relecture
+        Consultation.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        created = book_consultation(self.doctor, self.patient, next_monday_at(11))
+        removed_id = removed.id
+        removed.delete()
+
+        response = client.get(self.url, {'since': token})
+        self.assertFalse(response.data['full'])
+        self.assertEqual([c['id'] for c in response.data['consultations']], [created.id])
+        self.assertEqual(response.data['deleted'], [removed_id])
+        self.assertNotIn(kept.id, response.data['deleted'])
+        self.assertNotIn('patients', response.data)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client_for(self.admin).get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client_for(self.admin).get(self.url, {'doctor_id': 'abc'}).status_code, 400)
+
+    def other_doctor(self):
+        return Doctor.objects.create(
+            user=User.objects.create_user(
+                username='doc2', email='doc2@test.com', password='x', role='DOCTOR', is_approved=True
+            ),
+            nom='Grey', prenom='Meredith', specialty='Chirurgie', phone='0600000001', schedule='Lun-Ven 9:00-17:00'
+        )
+
+    def test_changes_are_limited_to_the_client_view(self):
+        other = self.other_doctor()
+        client = self.client_for(self.admin)
+        mine = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        theirs = book_consultation(other, self.patient, next_monday_at(10))
+        moved = book_consultation(self.doctor, self.patient, next_monday_at(11))
+        params = {'doctor_id': self.doctor.id}
+        token = client.get(self.url, params).data['token']
+        Consultation.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        theirs_id, mine_id = theirs.id, mine.id
+        theirs.delete()
+        mine.delete()
+        book_consultation(other, self.patient, next_monday_at(14), consultation=moved)
+        book_consultation(other, self.patient, next_monday_at(15))
+
+        response = client.get(self.url, {**params, 'since': token})
+        self.assertEqual(response.data['consultations'], [])
+        # pas d'id d'un autre médecin; la consultation partie chez lui sort de la vue
+        self.assertEqual(response.data['deleted'], sorted([mine_id, moved.id]))
+        self.assertNotIn(theirs_id, response.data['deleted'])
+
+        # vue de l'autre médecin: la consultation arrivée est une mise à jour, pas une suppression
+        response = client.get(self.url, {'doctor_id': other.id, 'since': token})
+        self.assertIn(moved.id, [c['id'] for c in response.data['consultations']])
+        self.assertEqual(response.data['deleted'], [theirs_id])
+
+    def test_changes_are_limited_to_the_period(self):
+        client = self.client_for(self.admin)
+        day = next_monday_at(9).date()
+        params = {'start': day.isoformat(), 'end': day.isoformat()}
+        token = client.get(self.url, params).data['token']
+
+        book_consultation(self.doctor, self.patient, next_monday_at(9) + timedelta(days=1))
+        other_day = book_consultation(self.doctor, self.patient, next_monday_at(10) + timedelta(days=1))
+        other_day.delete()
+
+        response = client.get(self.url, {**params, 'since': token})
+        self.assertEqual((response.data['consultations'], response.data['deleted']), ([], []))
+
+    def test_read_does_not_purge_tombstones(self):
+        ConsultationTombstone.objects.create(consultation_id=1, doctor_id=self.doctor.id)
+        ConsultationTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        self.client_for(self.admin).get(self.url)
+        self.assertEqual(ConsultationTombstone.objects.count(), 1)
+
+        out = StringIO()
+        call_command('purge_consultation_tombstones', stdout=out)
+        self.assertIn('1 trace(s)', out.getvalue())
+        self.assertFalse(ConsultationTombstone.objects.exists())
+
+
+class CalendarReferenceDataTests(BookingTestMixin, TestCase):
+    def test_doctors_are_revalidated_with_etag(self):
+        client = self.client_for(self.admin)
+        response = client.get('/api/Admin/calendar/doctors/')
+        self.assertEqual(len(response.data), 1)
+
+        cached = client.get('/api/Admin/calendar/doctors/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.doctor.schedule = 'Lun-Sam 8:00-12:00'
+        self.doctor.save()
+        changed = client.get('/api/Admin/calendar/doctors/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_patient_picker_is_paginated_and_searchable(self):
+        client = self.client_for(self.admin)
+        response = client.get('/api/Admin/calendar/patients/', {'q': 'do', 'page_size': 10})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['nom_complet'], 'John Doe')
+
+    def test_calendar_returns_consultations_only_unless_legacy(self):
+        client = self.client_for(self.admin)
+        self.assertNotIn('patients', client.get('/api/Admin/calendar/').data)
+        legacy = client.get('/api/Admin/calendar/', {'legacy': '1'}).data
+        self.assertEqual(len(legacy['doctors']), 1)
+        self.assertEqual(len(legacy['patients']), 1)
+
+
+class BatchBookingTests(BookingTestMixin, TestCase):
+    url = '/api/Admin/calendar/consultations/batch/'
+
+    def test_recurrence_reports_per_item_results(self):
+        book_consultation(self.doctor.id, self.patient.id, next_monday_at(10) + timedelta(weeks=1))
+        response = self.client_for(self.admin).post(self.url, {
+            'doctor': self.doctor.id, 'patient': self.patient.id,
+            'start_time': next_monday_at(10).isoformat(),
+            'recurrence': {'frequency': 'weekly', 'count': 3}
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'conflict', 'created'])
+        self.assertEqual(Consultation.objects.count(), 3)
 
-# Create your tests here.
+    def test_candidates_conflicting_with_each_other(self):
+        items = [
+            {'doctor': self.doctor.id, 'patient': self.patient.id, 'start_time': next_monday_at(9).isoformat()},
+            {'doctor': self.doctor.id, 'patient': self.patient.id, 'start_time': next_monday_at(9, 15).isoformat()},
+        ]
+        with self.capture_booking_queries() as ctx:
+            response = self.client_for(self.admin).post(self.url, {'consultations': items}, format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['results'][1]['status'], 'conflict')
+        # médecins, patients, intervalles existants, gardes, insertion groupée, puis l'agrégat du jour
+        self.assertEqual(len(data_queries(ctx)), 5 + ROLLUP_QUERIES)
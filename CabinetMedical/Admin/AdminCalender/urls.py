@@ -1,7 +1,16 @@
 from django.urls import path
-from .views import AdminCalendarView, AdminCalendarConsultationView
+from .views import (
+    AdminCalendarView,
+    AdminCalendarDoctorsView,
+    AdminCalendarPatientsView,
+    AdminCalendarConsultationView,
+    AdminCalendarConsultationBatchView
+)
 
 urlpatterns = [
     path('', AdminCalendarView.as_view(), name='admin-calendar'),
+    path('doctors/', AdminCalendarDoctorsView.as_view(), name='admin-calendar-doctors'),
+    path('patients/', AdminCalendarPatientsView.as_view(), name='admin-calendar-patients'),
     path('consultations/', AdminCalendarConsultationView.as_view(), name='admin-calendar-consultations'),
+    path('consultations/batch/', AdminCalendarConsultationBatchView.as_view(), name='admin-calendar-consultations-batch'),
 ]
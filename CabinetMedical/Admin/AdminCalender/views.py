@@ -1,14 +1,21 @@
-from rest_framework import status
+from rest_framework import generics, status
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.core import signing
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.dateparse import parse_date
+from django.utils.http import http_date, quote_etag
 from django.utils import timezone
 from datetime import datetime, timedelta
-import re
+import hashlib
 
-from users.models import Consultation, Doctor, Patient
+from users.booking import BookingError, book_consultation, book_many, expand_recurrence
+from users.models import Consultation, ConsultationTombstone, Doctor, Patient
 from users.permissions import IsAdminRole
+from users.waitlist import offer_freed_slot
 from .serializers import (
     CalendarConsultationSerializer,
     CalendarDoctorSerializer,
@@ -16,126 +23,200 @@ from .serializers import (
 )
 
 
-def parse_schedule(schedule_str):
-    """Parse schedule string like 'Lun-Ven 9:00-17:00'"""
-    if not schedule_str:
-        return None
-    try:
-        s = schedule_str.strip().lower()
-        parts = s.split()
-        if len(parts) < 2:
-            return None
-        day_part = parts[0]
-        time_part = parts[1]
-
-        fr_map = {'lun':0,'mar':1,'mer':2,'jeu':3,'ven':4,'sam':5,'dim':6}
-        en_map = {'mon':0,'tue':1,'wed':2,'thu':3,'fri':4,'sat':5,'sun':6}
-
-        def day_to_num(token):
-            t = token[:3]
-            if t in fr_map:
-                return fr_map[t]
-            if t in en_map:
-                return en_map[t]
-            return None
-
-        days = set()
-        if '-' in day_part:
-            a, b = day_part.split('-')
-            na = day_to_num(a)
-            nb = day_to_num(b)
-            if na is None or nb is None:
-                return None
-            if na <= nb:
-                rng = range(na, nb+1)
-            else:
-                rng = list(range(na, 7)) + list(range(0, nb+1))
-            days.update(rng)
-        else:
-            n = day_to_num(day_part)
-            if n is None:
-                return None
-            days.add(n)
-
-        m = re.match(r"(\d{1,2}:\d{2})-(\d{1,2}:\d{2})", time_part)
-        if not m:
-            return None
-        tstart = datetime.strptime(m.group(1), "%H:%M").time()
-        tend = datetime.strptime(m.group(2), "%H:%M").time()
-
-        return (days, tstart, tend)
-    except Exception:
-        return None
+def parse_start_time(value):
+    """Accepte l'ISO 8601 (avec 'T', 'Z' toléré) ou 'YYYY-MM-DD HH:MM:SS'"""
+    if 'T' in value:
+        start_time = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+        start_time = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time)
+    return start_time
+
+
+SYNC_TOKEN_SALT = 'admin-calendar-sync'
+# Relecture d'une petite marge avant le token: une transaction commencée avant
+# la dernière synchronisation peut être validée juste après
+SYNC_OVERLAP = timedelta(seconds=5)
 
 
-def is_within_schedule(start_dt, end_dt, schedule_str):
-    """Check if consultation is within doctor's working hours"""
-    parsed = parse_schedule(schedule_str)
-    if not parsed:
-        if not schedule_str or schedule_str.strip() == '':
-            return True
-        return True
-    
-    days, tstart, tend = parsed
-    start_local = timezone.localtime(start_dt) if timezone.is_aware(start_dt) else start_dt
-    end_local = timezone.localtime(end_dt) if timezone.is_aware(end_dt) else end_dt
-    
-    if start_local.weekday() not in days:
-        return False
-    if end_local.weekday() not in days:
-        return False
-    if start_local.time() < tstart:
-        return False
-    if end_local.time() > tend:
-        return False
-    return True
+def make_sync_token(moment):
+    return signing.dumps(moment.isoformat(), salt=SYNC_TOKEN_SALT)
+
+
+def read_sync_token(token):
+    """Date contenue dans un token de synchronisation, None s'il est invalide"""
+    try:
+        return datetime.fromisoformat(signing.loads(token, salt=SYNC_TOKEN_SALT))
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
 
 
 class AdminCalendarView(APIView):
     """
     Vue principale du calendrier admin.
     GET: Récupère les consultations + listes patients/doctors pour le calendrier
+
+    Query Parameters:
+    - start, end: Période (YYYY-MM-DD)
+    - doctor_id: Filtrer par médecin
+    - legacy=1: Ajouter les listes doctors/patients (ancien format). Sinon,
+      utiliser doctors/ (avec ETag) et patients/ (paginé)
+    - since: Token renvoyé par l'appel précédent. Seules les consultations
+      créées ou modifiées depuis sont retournées, avec les ids à retirer
+      (supprimées ou sorties de la période) dans "deleted". "full" indique
+      si la réponse remplace tout le calendrier (token expiré) ou le complète.
     """
     permission_classes = [IsAuthenticated, IsAdminRole]
 
     def get(self, request):
+        # Lu avant les requêtes: rien de ce qui suit ne peut être manqué au prochain appel
+        now = timezone.now()
+
         # Paramètres de période
-        start_date = request.query_params.get('start')
-        end_date = request.query_params.get('end')
+        parsed_start = parse_date(request.query_params.get('start') or '')
+        parsed_end = parse_date(request.query_params.get('end') or '')
         doctor_id = request.query_params.get('doctor_id')
+        if doctor_id:
+            try:
+                doctor_id = int(doctor_id)
+            except ValueError:
+                return Response({'error': 'doctor_id invalide'}, status=status.HTTP_400_BAD_REQUEST)
+
+        since_token = request.query_params.get('since')
+        if since_token:
+            since = read_sync_token(since_token)
+            if since is None:
+                return Response(
+                    {'error': 'Token de synchronisation invalide'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Token trop ancien (traces de suppression purgées): rechargement complet
+            if since > now - ConsultationTombstone.RETENTION:
+                return self.get_changes(since, now, parsed_start, parsed_end, doctor_id)
 
         # Récupérer les consultations
         consultations = Consultation.objects.select_related(
             'doctor', 'patient'
         ).all()
 
-        if start_date:
-            parsed_start = parse_date(start_date)
-            if parsed_start:
-                consultations = consultations.filter(start_time__date__gte=parsed_start)
+        if parsed_start:
+            consultations = consultations.filter(start_time__date__gte=parsed_start)
 
-        if end_date:
-            parsed_end = parse_date(end_date)
-            if parsed_end:
-                consultations = consultations.filter(start_time__date__lte=parsed_end)
+        if parsed_end:
+            consultations = consultations.filter(start_time__date__lte=parsed_end)
 
         if doctor_id:
             consultations = consultations.filter(doctor_id=doctor_id)
 
         consultations = consultations.order_by('start_time')
 
-        # Récupérer patients et doctors pour les selects
-        # Retourner tous les médecins (même ceux non approuvés) pour le calendrier admin
-        doctors = Doctor.objects.select_related('user').all()
-        patients = Patient.objects.select_related('user').all()
+        data = {
+            'consultations': CalendarConsultationSerializer(consultations, many=True).data,
+            'full': True,
+            'token': make_sync_token(now)
+        }
+
+        if request.query_params.get('legacy') in ('1', 'true'):
+            # Retourner tous les médecins (même ceux non approuvés) pour le calendrier admin
+            data['doctors'] = CalendarDoctorSerializer(Doctor.objects.all(), many=True).data
+            data['patients'] = CalendarPatientSerializer(Patient.objects.all(), many=True).data
+
+        return Response(data)
+
+    def get_changes(self, since, now, parsed_start, parsed_end, doctor_id):
+        """
+        Différences depuis ``since`` dans la vue du client (médecin, période):
+        consultations ajoutées ou modifiées, et ids à retirer (supprimées, ou
+        déplacées hors de la vue: trace de leur ancien créneau)
+        """
+        changed_since = since - SYNC_OVERLAP
+        changed = Consultation.objects.select_related('doctor', 'patient').filter(updated_at__gte=changed_since)
+        tombstones = ConsultationTombstone.objects.filter(deleted_at__gte=changed_since)
+        if doctor_id:
+            changed = changed.filter(doctor_id=doctor_id)
+            tombstones = tombstones.filter(doctor_id=doctor_id)
+        # Les traces sans créneau (antérieures au champ) sont gardées par prudence
+        if parsed_start:
+            changed = changed.filter(start_time__date__gte=parsed_start)
+            tombstones = tombstones.filter(Q(start_time__isnull=True) | Q(start_time__date__gte=parsed_start))
+        if parsed_end:
+            changed = changed.filter(start_time__date__lte=parsed_end)
+            tombstones = tombstones.filter(Q(start_time__isnull=True) | Q(start_time__date__lte=parsed_end))
+
+        visible = list(changed.order_by('start_time'))
+        # Déplacée dans la vue: mise à jour, pas suppression
+        deleted = set(tombstones.values_list('consultation_id', flat=True)) - {c.id for c in visible}
 
         return Response({
-            'consultations': CalendarConsultationSerializer(consultations, many=True).data,
-            'doctors': CalendarDoctorSerializer(doctors, many=True).data,
-            'patients': CalendarPatientSerializer(patients, many=True).data
+            'consultations': CalendarConsultationSerializer(visible, many=True).data,
+            'deleted': sorted(deleted),
+            'full': False,
+            'token': make_sync_token(now)
         })
 
 
+class AdminCalendarDoctorsView(APIView):
+    """
+    Médecins pour les selects du calendrier (tous, même non approuvés)
+
+    Réponse avec ETag/Last-Modified: un client qui renvoie If-None-Match ou
+    If-Modified-Since reçoit 304 tant qu'aucun médecin n'a changé.
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def get(self, request):
+        # Une requête d'agrégat suffit à savoir si la liste a changé
+        version = Doctor.objects.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+        last_modified = version['last_modified']
+        etag = quote_etag(hashlib.md5(f"{version['count']}:{last_modified}".encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        doctors = Doctor.objects.order_by('nom', 'prenom', 'id')
+        response = Response(CalendarDoctorSerializer(doctors, many=True).data)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # Le navigateur garde la réponse mais revalide à chaque chargement
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class CalendarPatientPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class AdminCalendarPatientsView(generics.ListAPIView):
+    """
+    Sélecteur de patients du calendrier, paginé
+
+    Query Parameters:
+    - q: Recherche par nom, prénom ou téléphone
+    - page, page_size (20 par défaut, 100 max)
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    serializer_class = CalendarPatientSerializer
+    pagination_class = CalendarPatientPagination
+
+    def get_queryset(self):
+        patients = Patient.objects.order_by('nom', 'prenom', 'id')
+        q = self.request.query_params.get('q')
+        if q:
+            patients = patients.filter(
+                Q(nom__icontains=q) |
+                Q(prenom__icontains=q) |
+                Q(telephone__icontains=q)
+            )
+        return patients
+
+
 class AdminCalendarConsultationView(APIView):
     """
     CRUD pour les consultations depuis le calendrier admin
@@ -161,72 +242,19 @@ class AdminCalendarConsultationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Vérifier que le médecin existe et est approuvé
-        try:
-            doctor = Doctor.objects.select_related('user').get(id=doctor_id)
-            if not doctor.user.is_approved:
-                return Response(
-                    {'error': 'Ce médecin n\'est pas encore approuvé'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Doctor.DoesNotExist:
-            return Response(
-                {'error': 'Médecin non trouvé'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Vérifier que le patient existe
-        try:
-            patient = Patient.objects.get(id=patient_id)
-        except Patient.DoesNotExist:
-            return Response(
-                {'error': 'Patient non trouvé'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Parser start_time
         try:
-            if 'T' in start_time_str:
-                start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-            else:
-                start_time = datetime.strptime(start_time_str, '%Y-%m-%d %H:%M:%S')
-            
-            if timezone.is_naive(start_time):
-                start_time = timezone.make_aware(start_time)
+            start_time = parse_start_time(start_time_str)
         except (ValueError, TypeError) as e:
             return Response(
                 {'error': f'Format de date invalide: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Calculer end_time (+30 min)
-        end_time = start_time + timedelta(minutes=30)
-
-        # Vérifier les horaires de travail du médecin
-        if not is_within_schedule(start_time, end_time, doctor.schedule):
-            return Response({
-                'error': f'Consultation hors des heures de travail du médecin. Horaires: {doctor.schedule}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Vérifier les conflits d'horaire
-        conflicting = Consultation.objects.filter(
-            doctor_id=doctor_id,
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        )
-        if conflicting.exists():
-            return Response({
-                'error': 'Conflit d\'horaire: ce médecin a déjà un rendez-vous à cette heure'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Créer la consultation
-        consultation = Consultation.objects.create(
-            doctor=doctor,
-            patient=patient,
-            start_time=start_time,
-            end_time=end_time,
-            motif=motif
-        )
+        # Approbation, horaires et conflits sont vérifiés par le service de réservation
+        try:
+            consultation = book_consultation(doctor_id, patient_id, start_time, motif, user=request.user)
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
 
         return Response(
             CalendarConsultationSerializer(consultation).data,
@@ -243,7 +271,9 @@ class AdminCalendarConsultationView(APIView):
             )
 
         try:
-            consultation = Consultation.objects.get(id=consultation_id)
+            consultation = Consultation.objects.select_related(
+                'doctor__user', 'patient'
+            ).get(id=consultation_id)
         except Consultation.DoesNotExist:
             return Response(
                 {'error': 'Consultation non trouvée'},
@@ -252,61 +282,25 @@ class AdminCalendarConsultationView(APIView):
 
         data = request.data
 
-        # Mettre à jour les champs si fournis
-        if 'doctor' in data:
-            try:
-                doctor = Doctor.objects.get(id=data['doctor'])
-                consultation.doctor = doctor
-            except Doctor.DoesNotExist:
-                return Response({'error': 'Médecin non trouvé'}, status=status.HTTP_404_NOT_FOUND)
-
-        if 'patient' in data:
-            try:
-                patient = Patient.objects.get(id=data['patient'])
-                consultation.patient = patient
-            except Patient.DoesNotExist:
-                return Response({'error': 'Patient non trouvé'}, status=status.HTTP_404_NOT_FOUND)
-
+        # Les champs non fournis gardent leur valeur actuelle
+        start_time = consultation.start_time
         if 'start_time' in data:
             try:
-                start_time_str = data['start_time']
-                if 'T' in start_time_str:
-                    start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-                else:
-                    start_time = datetime.strptime(start_time_str, '%Y-%m-%d %H:%M:%S')
-                
-                if timezone.is_naive(start_time):
-                    start_time = timezone.make_aware(start_time)
-                
-                end_time = start_time + timedelta(minutes=30)
-
-                # Vérifier les horaires de travail
-                if not is_within_schedule(start_time, end_time, consultation.doctor.schedule):
-                    return Response({
-                        'error': f'Consultation hors des heures de travail. Horaires: {consultation.doctor.schedule}'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Vérifier les conflits
-                conflicting = Consultation.objects.filter(
-                    doctor=consultation.doctor,
-                    start_time__lt=end_time,
-                    end_time__gt=start_time
-                ).exclude(id=consultation_id)
-                
-                if conflicting.exists():
-                    return Response({
-                        'error': 'Conflit d\'horaire avec un autre rendez-vous'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                consultation.start_time = start_time
-                consultation.end_time = end_time
+                start_time = parse_start_time(data['start_time'])
             except (ValueError, TypeError) as e:
                 return Response({'error': f'Format de date invalide: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if 'motif' in data:
-            consultation.motif = data['motif']
-
-        consultation.save()
+        try:
+            consultation = book_consultation(
+                data.get('doctor', consultation.doctor),
+                data.get('patient', consultation.patient),
+                start_time,
+                data.get('motif'),
+                consultation=consultation,
+                user=request.user
+            )
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
         return Response(CalendarConsultationSerializer(consultation).data)
 
     def delete(self, request):
@@ -321,6 +315,8 @@ class AdminCalendarConsultationView(APIView):
         try:
             consultation = Consultation.objects.get(id=consultation_id)
             consultation.delete()
+            # Proposer le créneau libéré à la liste d'attente du docteur
+            offer_freed_slot(consultation.doctor_id, consultation.start_time, exclude_patient_id=consultation.patient_id)
             return Response({'message': 'Consultation supprimée'}, status=status.HTTP_204_NO_CONTENT)
         except Consultation.DoesNotExist:
             return Response(
@@ -328,3 +324,72 @@ class AdminCalendarConsultationView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+
+
+class AdminCalendarConsultationBatchView(APIView):
+    """
+    Réservation en lot depuis le calendrier admin
+
+    POST avec une liste:
+        {"consultations": [{"doctor": 1, "patient": 2, "start_time": "...", "motif": "..."}, ...]}
+    ou une série récurrente:
+        {"doctor": 1, "patient": 2, "start_time": "...", "motif": "Kiné",
+         "recurrence": {"frequency": "weekly", "interval": 1, "count": 12}}
+
+    Retourne un résultat par consultation (créée ou motif du refus).
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def post(self, request):
+        data = request.data
+        try:
+            items = self.build_items(data)
+            results = book_many(items, user=request.user)
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            return Response(
+                {'error': f'Données invalides: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        for result in results:
+            consultation = result.pop('consultation', None)
+            if consultation is not None:
+                result['consultation'] = CalendarConsultationSerializer(consultation).data
+
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'rejected': len(results) - created,
+            'results': results
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    def build_items(self, data):
+        if 'recurrence' in data:
+            if not all([data.get('doctor'), data.get('patient'), data.get('start_time')]):
+                raise BookingError('invalid', 'Les champs doctor, patient et start_time sont requis')
+            recurrence = data['recurrence']
+            starts = expand_recurrence(
+                parse_start_time(data['start_time']),
+                recurrence.get('frequency', 'weekly'),
+                int(recurrence.get('count', 1)),
+                int(recurrence.get('interval', 1))
+            )
+            return [
+                {'doctor': data['doctor'], 'patient': data['patient'], 'start_time': start, 'motif': data.get('motif', '')}
+                for start in starts
+            ]
+
+        consultations = data.get('consultations')
+        if not isinstance(consultations, list) or not consultations:
+            raise BookingError('invalid', 'Fournir une liste "consultations" ou une "recurrence"')
+        return [
+            {
+                'doctor': item['doctor'],
+                'patient': item['patient'],
+                'start_time': parse_start_time(item['start_time']),
+                'motif': item.get('motif', '')
+            }
+            for item in consultations
+        ]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from users.models import Consultation
+from users.models import Consultation, Doctor, Patient
 
 
 class ConsultationSerializer(serializers.ModelSerializer):
@@ -19,3 +19,8 @@ class ConsultationSerializer(serializers.ModelSerializer):
             'motif'
         ]
         read_only_fields = ['end_time']
+        # Médecin et patient chargés avec leur user pour le service de réservation
+        extra_kwargs = {
+            'doctor': {'queryset': Doctor.objects.select_related('user')},
+            'patient': {'queryset': Patient.objects.select_related('user')},
+        }
@@ -1,3 +1,29 @@
 from django.test import TestCase
 
-# Create your tests here.
+from users.booking import book_consultation
+from users.tests import BookingTestMixin, next_monday_at
+
+
+class ConsultationExportTests(BookingTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        book_consultation(self.doctor, self.patient, next_monday_at(9), motif='Fièvre')
+        book_consultation(self.doctor, self.patient, next_monday_at(10), motif='Contrôle')
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_streams_lazily_with_list_filters(self):
+        client = self.client_for(self.admin)
+        with self.assertNumQueries(0):
+            response = client.get('/api/Admin/consultations/export/csv/', {'date': next_monday_at(9).date().isoformat()})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="consultations-', response['Content-Disposition'])
+        lines = self.read(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'start_time', 'end_time'])
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Fièvre,fievre', lines[1])
+
+        response = client.get('/api/Admin/consultations/export/csv/', {'patient_id': self.patient.id + 1})
+        self.assertEqual(len(self.read(response).splitlines()), 1)
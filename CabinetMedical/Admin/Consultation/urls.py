@@ -2,6 +2,7 @@ from django.urls import path
 from .views import *
 from .views import (
     ConsultationListCreateView,
+    ConsultationExportView,
     ConsultationDetailView,
     ConsultationsByDateView,
     ConsultationsByPatientView,
@@ -12,6 +13,7 @@ from .views import (
 urlpatterns = [
     # Consultations / Rendez-vous
     path('', ConsultationListCreateView.as_view(), name='consultation-list'),
+    path('export/<str:export_format>/', ConsultationExportView.as_view(), name='consultation-export'),
     path('<int:pk>/', ConsultationDetailView.as_view(), name='consultation-detail'),
     path('date/<str:date>/', ConsultationsByDateView.as_view(), name='consultations-by-date'),
     path('patient/<int:patient_id>/', ConsultationsByPatientView.as_view(), name='consultations-by-patient'),
@@ -5,95 +5,12 @@ from rest_framework.views import APIView
 from django.db.models import Q
 from django.utils.dateparse import parse_date
 
+from users.booking import BookingError, book_consultation
+from users.exports import ExportMixin
 from users.models import Consultation, Doctor, Patient
 from .serializers import ConsultationSerializer
 from users.permissions import IsAdminOrDoctor
-from django.utils import timezone
-from datetime import datetime, time as dtime
-import re
-
-
-def parse_schedule(schedule_str):
-    """Module-level parser for schedule strings.
-    Supports formats like "Lun-Ven 9:00-17:00" or "Mon-Fri 09:00-17:00".
-    Returns (set_of_weekdays, start_time_obj, end_time_obj) or None if unparsable.
-    """
-    if not schedule_str:
-        return None
-    try:
-        s = schedule_str.strip().lower()
-        parts = s.split()
-        if len(parts) < 2:
-            return None
-        day_part = parts[0]
-        time_part = parts[1]
-
-        fr_map = {'lun':0,'mar':1,'mer':2,'jeu':3,'ven':4,'sam':5,'dim':6}
-        en_map = {'mon':0,'tue':1,'wed':2,'thu':3,'fri':4,'sat':5,'sun':6}
-
-        def day_to_num(token):
-            t = token[:3]
-            if t in fr_map:
-                return fr_map[t]
-            if t in en_map:
-                return en_map[t]
-            return None
-
-        days = set()
-        if '-' in day_part:
-            a,b = day_part.split('-')
-            na = day_to_num(a)
-            nb = day_to_num(b)
-            if na is None or nb is None:
-                return None
-            if na <= nb:
-                rng = range(na, nb+1)
-            else:
-                rng = list(range(na,7)) + list(range(0, nb+1))
-            days.update(rng)
-        elif ',' in day_part:
-            for tok in day_part.split(','):
-                n = day_to_num(tok)
-                if n is not None:
-                    days.add(n)
-        else:
-            n = day_to_num(day_part)
-            if n is None:
-                return None
-            days.add(n)
-
-        m = re.match(r"(\d{1,2}:\d{2})-(\d{1,2}:\d{2})", time_part)
-        if not m:
-            return None
-        tstart = datetime.strptime(m.group(1), "%H:%M").time()
-        tend = datetime.strptime(m.group(2), "%H:%M").time()
-
-        return (days, tstart, tend)
-    except Exception:
-        return None
-
-
-def is_within_schedule(start_dt, end_dt, schedule_str):
-    parsed = parse_schedule(schedule_str)
-    if not parsed:
-        # if no schedule provided, allow; if schedule exists but unparsable, block to be safe
-        if not schedule_str or schedule_str.strip() == '':
-            return True
-        if re.search(r'[a-zA-Z]', schedule_str):
-            return False
-        return True
-    days, tstart, tend = parsed
-    start_local = timezone.localtime(start_dt)
-    end_local = timezone.localtime(end_dt)
-    if start_local.weekday() not in days:
-        return False
-    if end_local.weekday() not in days:
-        return False
-    if start_local.time() < tstart:
-        return False
-    if end_local.time() > tend:
-        return False
-    return True
+from users.waitlist import offer_freed_slot
 
 
 class ConsultationListCreateView(generics.ListCreateAPIView):
@@ -126,42 +43,44 @@ class ConsultationListCreateView(generics.ListCreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        
-        # Vérifier les conflits d'horaire pour le médecin
-        doctor_id = serializer.validated_data['doctor'].id
-        start_time = serializer.validated_data['start_time']
-        end_time = serializer.validated_data.get('end_time')
-        
-        # Calculer end_time si non fourni (30 min par défaut)
-        if not end_time:
-            from datetime import timedelta
-            end_time = start_time + timedelta(minutes=30)
-
-        # Vérifier que l'horaire est dans le schedule du médecin
-        schedule = serializer.validated_data['doctor'].schedule
-        if not is_within_schedule(start_time, end_time, schedule):
-            return Response({'error': 'Consultation hors des heures de travail du médecin.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Chercher les conflits
-        conflicting = Consultation.objects.filter(
-            doctor_id=doctor_id,
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        )
-        
-        if conflicting.exists():
-            return Response({
-                'error': 'Conflit d\'horaire: ce médecin a déjà un rendez-vous à cette heure.'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        self.perform_create(serializer)
+        data = serializer.validated_data
+
+        # Approbation, horaires et conflits sont vérifiés par le service de réservation
+        try:
+            consultation = book_consultation(
+                data['doctor'], data['patient'], data['start_time'], data.get('motif', ''),
+                user=request.user
+            )
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
+
+        serializer = self.get_serializer(consultation)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+class ConsultationExportView(ExportMixin, ConsultationListCreateView):
+    """Export CSV/JSONL en flux des consultations, mêmes filtres que la liste"""
+    export_name = 'consultations'
+    export_columns = (
+        ('id', 'id'),
+        ('start_time', 'start_time'),
+        ('end_time', 'end_time'),
+        ('doctor_id', 'doctor_id'),
+        ('doctor_nom', 'doctor__nom'),
+        ('doctor_prenom', 'doctor__prenom'),
+        ('specialty', 'doctor__specialty'),
+        ('patient_id', 'patient_id'),
+        ('patient_nom', 'patient__nom'),
+        ('patient_prenom', 'patient__prenom'),
+        ('motif', 'motif'),
+        ('motif_code', 'motif_code'),
+    )
+
+
 class ConsultationDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Détails, modification et suppression d'une consultation"""
-    queryset = Consultation.objects.all()
+    queryset = Consultation.objects.select_related('doctor__user', 'patient__user')
     serializer_class = ConsultationSerializer
     permission_classes = [IsAuthenticated, IsAdminOrDoctor]
 
@@ -170,33 +89,26 @@ class ConsultationDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        
-        # Vérifier les conflits si on modifie l'horaire
-        if 'start_time' in serializer.validated_data or 'end_time' in serializer.validated_data:
-            doctor_id = serializer.validated_data.get('doctor', instance.doctor).id
-            start_time = serializer.validated_data.get('start_time', instance.start_time)
-            end_time = serializer.validated_data.get('end_time', instance.end_time)
-            
-            conflicting = Consultation.objects.filter(
-                doctor_id=doctor_id,
-                start_time__lt=end_time,
-                end_time__gt=start_time
-            ).exclude(pk=instance.pk)
-            
-            if conflicting.exists():
-                return Response({
-                    'error': 'Conflit d\'horaire: ce médecin a déjà un rendez-vous à cette heure.'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            # Vérifier que l'horaire modifié est dans le schedule du médecin
-            schedule = serializer.validated_data.get('doctor', instance.doctor).schedule
-            if not is_within_schedule(start_time, end_time, schedule):
-                return Response({'error': 'Consultation hors des heures de travail du médecin.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        self.perform_update(serializer)
-        return Response(serializer.data)
+        data = serializer.validated_data
+
+        try:
+            consultation = book_consultation(
+                data.get('doctor', instance.doctor),
+                data.get('patient', instance.patient),
+                data.get('start_time', instance.start_time),
+                data.get('motif'),
+                consultation=instance,
+                user=request.user
+            )
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
+        return Response(self.get_serializer(consultation).data)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        # Proposer le créneau libéré à la liste d'attente du docteur
+        offer_freed_slot(instance.doctor_id, instance.start_time, exclude_patient_id=instance.patient_id)
 
-    
 
 
 class ConsultationsByDateView(APIView):
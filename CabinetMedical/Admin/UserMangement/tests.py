@@ -1,3 +1,13 @@
+import json
+
 from django.test import TestCase
 
-# Create your tests here.
+from users.tests import BookingTestMixin
+
+
+class PatientExportTests(BookingTestMixin, TestCase):
+    def test_jsonl_with_list_filters(self):
+        response = self.client_for(self.admin).get('/api/Admin/patients/export/jsonl/', {'status': 'actif'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([(r['id'], r['email']) for r in rows], [(self.patient.id, 'pat@test.com')])
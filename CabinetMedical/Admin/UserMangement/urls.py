@@ -5,6 +5,7 @@ from .views import AdminReclamationsListView
 urlpatterns = [
     # Patients (CBV)
     path('patients/', views.PatientListCreateView.as_view(), name='admin-patients-list'),
+    path('patients/export/<str:export_format>/', views.PatientExportView.as_view(), name='admin-patients-export'),
     path('patients/<int:pk>/', views.PatientDetailView.as_view(), name='admin-patient-detail'),
 
     path('reclamations/', AdminReclamationsListView.as_view()),
@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 
 from DoctorPatient.models import Reclamation
 from users.models import Patient, Doctor, User
+from users.exports import ExportMixin
 from users.permissions import IsAdminRole
 from .serializers import (
 	PatientSerializer as AdminPatientSerializer,
@@ -44,6 +45,22 @@ class PatientListCreateView(generics.ListCreateAPIView):
 		return AdminPatientSerializer
 
 
+class PatientExportView(ExportMixin, PatientListCreateView):
+	"""Export CSV/JSONL en flux des patients, mêmes filtres que la liste"""
+	export_name = 'patients'
+	export_columns = (
+		('id', 'id'),
+		('username', 'user__username'),
+		('email', 'user__email'),
+		('nom', 'nom'),
+		('prenom', 'prenom'),
+		('age', 'age'),
+		('address', 'address'),
+		('telephone', 'telephone'),
+		('status', 'status'),
+	)
+
+
 class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
 	queryset = Patient.objects.all()
 	permission_classes = [IsAuthenticated, IsAdminRole]
@@ -0,0 +1,60 @@
+"""
+Génération du flux iCalendar (RFC 5545) des consultations d'un médecin.
+
+Les lignes sont produites une par une pour être envoyées en streaming.
+"""
+from datetime import timezone as dt_timezone
+
+PRODID = '-//Cabinet Medical//Calendrier Docteur//FR'
+
+
+def escape_text(value):
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Coupe une ligne à 75 octets, les suites commençant par un espace"""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        # Ne pas couper au milieu d'un caractère UTF-8
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode('utf-8'))
+        data = data[size:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def calendar_lines(name, consultations):
+    """Lignes du calendrier pour un itérable de consultations (patient chargé)"""
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold(f'PRODID:{PRODID}')
+    yield fold('CALSCALE:GREGORIAN')
+    yield fold(f'X-WR-CALNAME:{escape_text(name)}')
+    for consultation in consultations:
+        patient = consultation.patient
+        yield fold('BEGIN:VEVENT')
+        yield fold(f'UID:consultation-{consultation.id}@cabinet-medical')
+        yield fold(f'DTSTAMP:{format_datetime(consultation.updated_at)}')
+        yield fold(f'LAST-MODIFIED:{format_datetime(consultation.updated_at)}')
+        yield fold(f'DTSTART:{format_datetime(consultation.start_time)}')
+        yield fold(f'DTEND:{format_datetime(consultation.end_time)}')
+        yield fold(f'SUMMARY:{escape_text(f"Consultation - {patient.prenom} {patient.nom}".strip())}')
+        if consultation.motif:
+            yield fold(f'DESCRIPTION:{escape_text(consultation.motif)}')
+        yield fold('END:VEVENT')
+    yield fold('END:VCALENDAR')
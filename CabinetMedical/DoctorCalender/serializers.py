@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.utils import timezone
 from users.models import Consultation, Doctor, Patient
 
 
@@ -31,7 +32,9 @@ class CalendarConsultationSerializer(serializers.ModelSerializer):
         return f"Dr. {obj.doctor.nom} {obj.doctor.prenom}" if obj.doctor.nom else obj.doctor.user.username
     
     def get_date(self, obj):
-        return obj.start_time.date()
+        # Jour local (annoté par la vue quand disponible), pas le jour UTC
+        day = getattr(obj, 'day', None)
+        return day or timezone.localtime(obj.start_time).date()
 
 
 class DoctorCalendarSerializer(serializers.Serializer):
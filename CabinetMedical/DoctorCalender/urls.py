@@ -1,6 +1,18 @@
 from django.urls import path
-from .views import DoctorCalendarView
+from .views import (
+    DoctorCalendarView,
+    DoctorAvailabilityView,
+    SlotHoldView,
+    SlotHoldDetailView,
+    DoctorCalendarFeedLinkView,
+    DoctorCalendarFeedView
+)
 
 urlpatterns = [
     path('consultations/', DoctorCalendarView.as_view(), name='doctor-calendar'),
+    path('<int:doctor_id>/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
+    path('<int:doctor_id>/holds/', SlotHoldView.as_view(), name='doctor-slot-holds'),
+    path('holds/<int:hold_id>/', SlotHoldDetailView.as_view(), name='doctor-slot-hold-detail'),
+    path('feed/', DoctorCalendarFeedLinkView.as_view(), name='doctor-calendar-feed-link'),
+    path('feed/<str:token>.ics', DoctorCalendarFeedView.as_view(), name='doctor-calendar-feed'),
 ]
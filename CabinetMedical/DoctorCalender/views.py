@@ -2,10 +2,26 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
-from datetime import datetime, timedelta
+from django.core import signing
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import TruncDate
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from datetime import date, datetime, time, timedelta
 from calendar import monthrange
+from heapq import merge
+import hashlib
+from users.booking import BookingError
+from users.holds import create_hold, release_hold, held_intervals
+from users.intervals import busy_intervals
 from users.models import Consultation, Doctor
+from users.schedule import SLOT_DURATION, free_slots, get_doctor_schedule, window_bounds
+from .ics import calendar_lines
 from .serializers import CalendarConsultationSerializer, DoctorCalendarSerializer
 
 
@@ -51,8 +67,8 @@ class DoctorCalendarView(APIView):
         if start_date and end_date:
             # Utiliser la plage de dates fournie
             try:
-                start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-                end_datetime = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+                start_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+                end_day = datetime.strptime(end_date, '%Y-%m-%d').date()
             except ValueError:
                 return Response(
                     {'error': 'Format de date invalide. Utilisez YYYY-MM-DD'},
@@ -66,11 +82,9 @@ class DoctorCalendarView(APIView):
                 if month < 1 or month > 12:
                     raise ValueError("Le mois doit être entre 1 et 12")
                 
-                # Premier jour du mois
-                start_datetime = datetime(year, month, 1)
-                # Dernier jour du mois
-                last_day = monthrange(year, month)[1]
-                end_datetime = datetime(year, month, last_day, 23, 59, 59)
+                # Premier et dernier jour du mois
+                start_day = date(year, month, 1)
+                end_day = date(year, month, monthrange(year, month)[1])
             except (ValueError, TypeError) as e:
                 return Response(
                     {'error': f'Paramètres invalides: {str(e)}'},
@@ -78,35 +92,253 @@ class DoctorCalendarView(APIView):
                 )
         else:
             # Par défaut: mois en cours
-            now = datetime.now()
-            start_datetime = datetime(now.year, now.month, 1)
-            last_day = monthrange(now.year, now.month)[1]
-            end_datetime = datetime(now.year, now.month, last_day, 23, 59, 59)
-        
-        # Récupérer les consultations du docteur pour la période
+            today = timezone.localdate()
+            start_day = today.replace(day=1)
+            end_day = today.replace(day=monthrange(today.year, today.month)[1])
+
+        # Jours du cabinet: bornes et regroupement dans le fuseau local, pas en UTC
+        tz = timezone.get_current_timezone()
+        start_datetime = timezone.make_aware(datetime.combine(start_day, time()), tz)
+        end_datetime = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time()), tz)
+
+        # Récupérer les consultations du docteur pour la période, avec leur jour local calculé par la base
         consultations = Consultation.objects.filter(
             doctor=doctor,
             start_time__gte=start_datetime,
-            start_time__lte=end_datetime
+            start_time__lt=end_datetime
+        ).annotate(
+            day=TruncDate('start_time', tzinfo=tz)
         ).select_related('patient', 'patient__user', 'doctor', 'doctor__user').order_by('start_time')
-        
-        # Sérialiser les données
+
+        # Sérialiser les données une seule fois
         serializer = CalendarConsultationSerializer(consultations, many=True)
-        
-        # Organiser les données par date pour faciliter l'affichage dans le calendrier
+
+        # Index {date: [ids]} pour l'affichage par jour
         calendar_data = {}
-        for consultation in serializer.data:
-            date_key = consultation['start_time'][:10]  # YYYY-MM-DD
-            if date_key not in calendar_data:
-                calendar_data[date_key] = []
-            calendar_data[date_key].append(consultation)
-        
+        for consultation in consultations:
+            calendar_data.setdefault(consultation.day.strftime('%Y-%m-%d'), []).append(consultation.id)
+
         return Response({
             'period': {
-                'start': start_datetime.strftime('%Y-%m-%d'),
-                'end': end_datetime.strftime('%Y-%m-%d'),
+                'start': start_day.strftime('%Y-%m-%d'),
+                'end': end_day.strftime('%Y-%m-%d'),
             },
             'total_consultations': len(serializer.data),
             'consultations_by_date': calendar_data,
-            'all_consultations': serializer.data
+            'consultations': serializer.data
         }, status=status.HTTP_200_OK)
+
+
+class DoctorAvailabilityView(APIView):
+    """
+    Créneaux libres (30 min) d'un médecin sur une période
+
+    GET: /api/doctor-calendar/<doctor_id>/availability/?start=YYYY-MM-DD&end=YYYY-MM-DD
+
+    Par défaut: les 7 prochains jours. La période est limitée à 31 jours.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 31
+
+    def get(self, request, doctor_id):
+        try:
+            doctor = Doctor.objects.select_related('user').get(id=doctor_id)
+        except Doctor.DoesNotExist:
+            return Response(
+                {'error': 'Médecin non trouvé'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not doctor.user.is_approved:
+            return Response(
+                {'error': 'Ce médecin n\'est pas encore approuvé'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        start_date = request.query_params.get('start')
+        end_date = request.query_params.get('end')
+        try:
+            start_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.localdate()
+            end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else start_day + timedelta(days=6)
+        except ValueError:
+            return Response(
+                {'error': 'Format de date invalide. Utilisez YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_day < start_day or (end_day - start_day).days >= self.MAX_DAYS:
+            return Response(
+                {'error': f'La période doit être comprise entre 1 et {self.MAX_DAYS} jours'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        window_start, window_end = window_bounds(start_day, end_day)
+
+        # Créneaux occupés lus dans l'index en mémoire (aucune requête une fois chargé)
+        busy = busy_intervals([doctor.id], window_start, window_end)[doctor.id]
+        # Créneaux gardés par d'autres utilisateurs en cours de réservation (une requête)
+        held = held_intervals([doctor.id], window_start, window_end, exclude_user=request.user)[doctor.id]
+        busy = list(merge(busy, held))
+
+        # Horaire vide ou inexploitable: aucun créneau proposé (la réservation serait refusée)
+        schedule = get_doctor_schedule(doctor)
+        slots = [
+            {'start_time': slot, 'end_time': slot + SLOT_DURATION}
+            for slot in free_slots(schedule, busy, window_start, window_end)
+        ]
+
+        return Response({
+            'doctor_id': doctor.id,
+            'schedule_valid': schedule is not None,
+            'period': {
+                'start': start_day.strftime('%Y-%m-%d'),
+                'end': end_day.strftime('%Y-%m-%d'),
+            },
+            'slot_minutes': int(SLOT_DURATION.total_seconds() // 60),
+            'total_slots': len(slots),
+            'slots': slots
+        }, status=status.HTTP_200_OK)
+
+
+
+class SlotHoldView(APIView):
+    """
+    Garder un créneau quelques minutes pendant la réservation
+
+    POST: /api/doctor-calendar/<doctor_id>/holds/  {"start_time": "2026-01-12T09:00:00Z"}
+    Le créneau apparaît occupé pour les autres utilisateurs et ne peut être
+    réservé que par le détenteur de la garde jusqu'à expires_at. Une seule
+    garde active par utilisateur: la nouvelle remplace la précédente.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, doctor_id):
+        try:
+            # ValueError: format correct mais date impossible (2030-02-30)
+            start_time = parse_datetime(request.data.get('start_time') or '')
+        except (TypeError, ValueError):
+            start_time = None
+        if start_time is None:
+            return Response(
+                {'error': 'start_time requis (ISO 8601)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            hold = create_hold(doctor_id, start_time, request.user)
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
+        return Response({
+            'id': hold.id,
+            'doctor_id': hold.doctor_id,
+            'start_time': hold.start_time,
+            'end_time': hold.end_time,
+            'expires_at': hold.expires_at
+        }, status=status.HTTP_201_CREATED)
+
+
+class SlotHoldDetailView(APIView):
+    """Libérer sa garde: DELETE /api/doctor-calendar/holds/<hold_id>/"""
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, hold_id):
+        if not release_hold(hold_id, request.user):
+            return Response(
+                {'error': 'Garde non trouvée'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+FEED_TOKEN_SALT = 'doctor-calendar-feed'
+
+
+class DoctorCalendarFeedLinkView(APIView):
+    """
+    Lien d'abonnement iCalendar du docteur connecté
+
+    GET: /api/doctor-calendar/feed/ -> {"token": "...", "url": "https://.../feed/<token>.ics"}
+    POST: /api/doctor-calendar/feed/ -> nouveau lien; les liens précédents renvoient 404
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_doctor(self, request):
+        if request.user.role != 'DOCTOR':
+            return None, Response(
+                {'error': 'Seuls les docteurs peuvent accéder à ce calendrier'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            return Doctor.objects.get(user=request.user), None
+        except Doctor.DoesNotExist:
+            return None, Response(
+                {'error': 'Profil docteur non trouvé'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+    def link(self, request, doctor):
+        token = signing.dumps([doctor.id, doctor.feed_version], salt=FEED_TOKEN_SALT)
+        return Response({
+            'token': token,
+            'url': request.build_absolute_uri(reverse('doctor-calendar-feed', args=[token]))
+        })
+
+    def get(self, request):
+        doctor, error = self.get_doctor(request)
+        if error is not None:
+            return error
+        return self.link(request, doctor)
+
+    def post(self, request):
+        doctor, error = self.get_doctor(request)
+        if error is not None:
+            return error
+        # update(): sans toucher updated_at (ETag du calendrier)
+        Doctor.objects.filter(pk=doctor.pk).update(feed_version=F('feed_version') + 1)
+        doctor.refresh_from_db(fields=['feed_version'])
+        return self.link(request, doctor)
+
+
+class DoctorCalendarFeedView(View):
+    """
+    Flux .ics des consultations d'un docteur (sans JWT: le token signé fait foi,
+    tant que sa version est celle du docteur)
+
+    Les applications de calendrier interrogent le flux toutes les quelques
+    minutes: l'ETag (nombre + dernière modification) leur renvoie 304 tant
+    que rien n'a changé, sans charger les consultations.
+    """
+    # Consultations passées gardées dans le flux
+    HISTORY = timedelta(days=90)
+
+    def get(self, request, token):
+        try:
+            doctor_id, version = signing.loads(token, salt=FEED_TOKEN_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise Http404('Flux introuvable')
+        doctor = Doctor.objects.filter(id=doctor_id, feed_version=version).first()
+        if doctor is None:
+            raise Http404('Flux introuvable')
+
+        consultations = Consultation.objects.filter(
+            doctor=doctor,
+            start_time__gte=timezone.now() - self.HISTORY
+        )
+        version = consultations.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+        last_modified = version['last_modified']
+        etag = quote_etag(hashlib.md5(f"{version['count']}:{last_modified}".encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        rows = consultations.select_related('patient').only(
+            'id', 'start_time', 'end_time', 'motif', 'updated_at', 'patient__nom', 'patient__prenom'
+        ).order_by('start_time').iterator(chunk_size=500)
+        lines = calendar_lines(f'Consultations - Dr. {doctor.prenom} {doctor.nom}', rows)
+
+        response = StreamingHttpResponse(lines, content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = f'inline; filename="consultations-{doctor.id}.ics"'
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -6,6 +6,7 @@ from django.db.models import Q
 from django.utils.dateparse import parse_date
 
 from users.models import Patient, Doctor, Consultation, DossierMedical
+from users.motifs import motif_code, normalize_motif
 from users.permissions import IsDoctorRole
 from .models import Reclamation, Message
 from .serializers import (
@@ -136,7 +137,16 @@ class DoctorConsultationsListView(APIView):
                 consultations = consultations.filter(start_time__date__lte=parsed_fin)
         
         if motif:
-            consultations = consultations.filter(motif__icontains=motif)
+            # Uniquement sur la colonne indexée motif_code: synonyme exact ("Température"
+            # trouve "Fièvre") ou début du code, sans accents ni casse ("fièv" trouve
+            # "fièvre."). Un motif sans lettre ni chiffre ne trouve rien.
+            fragment = normalize_motif(motif).replace(' ', '-')
+            if fragment:
+                consultations = consultations.filter(
+                    Q(motif_code=motif_code(motif)) | Q(motif_code__startswith=fragment)
+                )
+            else:
+                consultations = consultations.none()
         
         consultations = consultations.order_by('-start_time')
         serializer = DoctorConsultationSerializer(consultations, many=True)
@@ -0,0 +1,141 @@
+"""
+Analyse des factures pour la finance: chiffre d'affaires par période, par
+médecin et par méthode de paiement, et ancienneté des factures impayées.
+
+Chaque section est une seule requête groupée. Le chiffre d'affaires est celui
+des factures payées, daté par ``date_paiement`` (``date_creation`` si la
+facture a été saisie directement comme payée). L'ancienneté porte sur les
+factures en attente à l'instant présent, quelle que soit la période.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from users.rollup import day_bounds
+from users.stats import period_buckets
+
+from .models import Facture
+
+GRANULARITIES = ('day', 'week', 'month')
+# Période par défaut (en jours avant aujourd'hui) selon la granularité
+DEFAULT_SPANS = {'day': 29, 'week': 7 * 11, 'month': 334}
+MAX_BUCKETS = 1000
+# (clé, âge minimal, âge maximal exclu) en jours depuis la création
+AGING_BUCKETS = (
+    ('0-30', 0, 30),
+    ('30-60', 30, 60),
+    ('60-90', 60, 90),
+    ('90+', 90, None),
+)
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _amount(condition=None):
+    return Coalesce(Sum('montant', filter=condition), Value(Decimal('0')), output_field=MONEY)
+
+
+def paid_in_period(start, end):
+    """Factures payées dont la date de paiement tombe dans [start, end] (dates locales)"""
+    range_start, _ = day_bounds(start)
+    _, range_end = day_bounds(end)
+    return Facture.objects.filter(
+        Q(date_paiement__gte=range_start, date_paiement__lt=range_end)
+        | Q(date_paiement__isnull=True, date_creation__gte=range_start, date_creation__lt=range_end),
+        statut='PAYEE',
+    )
+
+
+def revenue_series(granularity, start, end):
+    """Montant encaissé et nombre de factures payées par jour, semaine (lundi) ou mois, périodes vides à 0"""
+    buckets = period_buckets(granularity, start, end)
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f'Trop de périodes ({len(buckets)}), maximum {MAX_BUCKETS}: réduire la plage')
+
+    trunc = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}[granularity]
+    rows = paid_in_period(start, end).annotate(
+        bucket=trunc(Coalesce('date_paiement', 'date_creation'), tzinfo=timezone.get_default_timezone())
+    ).values('bucket').annotate(montant=_amount(), factures=Count('id')).order_by()
+
+    values = defaultdict(lambda: (Decimal('0'), 0))
+    for row in rows:
+        values[row['bucket'].date()] = (row['montant'], row['factures'])
+    return {
+        'periodes': [b.isoformat() for b in buckets],
+        'montants': [float(values[b][0]) for b in buckets],
+        'factures': [values[b][1] for b in buckets],
+    }
+
+
+def revenue_by_doctor(start, end):
+    """Montant encaissé par médecin de la consultation facturée (None: facture sans consultation)"""
+    rows = paid_in_period(start, end).values(
+        'consultation__doctor_id', 'consultation__doctor__nom',
+        'consultation__doctor__prenom', 'consultation__doctor__specialty',
+    ).annotate(montant=_amount(), factures=Count('id')).order_by('-montant')
+    return [
+        {
+            'doctor_id': row['consultation__doctor_id'],
+            'nom': row['consultation__doctor__nom'],
+            'prenom': row['consultation__doctor__prenom'],
+            'specialty': row['consultation__doctor__specialty'],
+            'montant': float(row['montant']),
+            'factures': row['factures'],
+        }
+        for row in rows
+    ]
+
+
+def payment_methods(start, end):
+    """Montant encaissé par méthode de paiement ('' si non renseignée)"""
+    labels = dict(Facture.PAYMENT_METHOD_CHOICES)
+    rows = paid_in_period(start, end).values('methode_paiement').annotate(
+        montant=_amount(), factures=Count('id')
+    ).order_by('-montant')
+    return [
+        {
+            'methode': row['methode_paiement'],
+            'label': labels.get(row['methode_paiement'], 'Non renseignée'),
+            'montant': float(row['montant']),
+            'factures': row['factures'],
+        }
+        for row in rows
+    ]
+
+
+def aging():
+    """Factures en attente par ancienneté (jours depuis la création): nombre et montant"""
+    now = timezone.now()
+    aggregates = {}
+    for index, (_, low, high) in enumerate(AGING_BUCKETS):
+        age = Q(date_creation__lte=now - timedelta(days=low))
+        if high is not None:
+            age &= Q(date_creation__gt=now - timedelta(days=high))
+        aggregates[f'factures_{index}'] = Count('id', filter=age)
+        aggregates[f'montant_{index}'] = _amount(age)
+    counts = Facture.objects.filter(statut='EN_ATTENTE').aggregate(**aggregates)
+    return [
+        {
+            'tranche': key,
+            'factures': counts[f'factures_{index}'],
+            'montant': float(counts[f'montant_{index}']),
+        }
+        for index, (key, _, _) in enumerate(AGING_BUCKETS)
+    ]
+
+
+def analytics(granularity, start, end):
+    """Les quatre sections de l'analyse, quatre requêtes"""
+    return {
+        'granularity': granularity,
+        'debut': start.isoformat(),
+        'fin': end.isoformat(),
+        'chiffre_affaires': revenue_series(granularity, start, end),
+        'par_medecin': revenue_by_doctor(start, end),
+        'methodes_paiement': payment_methods(start, end),
+        'anciennete_impayes': aging(),
+    }
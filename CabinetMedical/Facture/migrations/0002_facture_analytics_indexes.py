@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facture', '0001_initial'),
+        ('users', '0012_consultation_motif_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['statut', 'date_paiement'], name='facture_statut_paiement_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['statut', 'date_creation'], name='facture_statut_creation_idx'),
+        ),
+    ]
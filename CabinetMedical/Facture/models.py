@@ -39,6 +39,11 @@ class Facture(models.Model):
     
     class Meta:
         ordering = ['-date_creation']
+        indexes = [
+            # Analyse des factures (voir analytics.py): encaissements par date, impayés par ancienneté
+            models.Index(fields=['statut', 'date_paiement'], name='facture_statut_paiement_idx'),
+            models.Index(fields=['statut', 'date_creation'], name='facture_statut_creation_idx'),
+        ]
     
     def __str__(self):
         return f"Facture {self.numero_facture} - {self.patient.user.username}"
@@ -1,3 +1,90 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+
+from users.booking import book_consultation
+from users.tests import BookingTestMixin, next_monday_at
+
+from . import analytics
+from .models import Facture
+
+
+class FactureAnalyticsTests(BookingTestMixin, TestCase):
+    url = '/api/factures/analytics/'
+
+    def setUp(self):
+        super().setUp()
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        self.today = timezone.localdate()
+        now = timezone.now()
+        Facture.objects.create(
+            patient=self.patient, consultation=consultation, montant=Decimal('60.00'),
+            statut='PAYEE', methode_paiement='CARTE', date_paiement=now
+        )
+        Facture.objects.create(
+            patient=self.patient, montant=Decimal('15.00'), statut='PAYEE', methode_paiement='ESPECES',
+            date_paiement=now - timedelta(days=1)
+        )
+        Facture.objects.create(patient=self.patient, montant=Decimal('99.00'), statut='ANNULEE')
+        for days, montant in ((5, '10.00'), (45, '20.00'), (120, '30.00'), (200, '40.00')):
+            facture = Facture.objects.create(patient=self.patient, montant=Decimal(montant))
+            Facture.objects.filter(pk=facture.pk).update(date_creation=now - timedelta(days=days))
+
+    def test_sections_one_query_each(self):
+        with self.assertNumQueries(4):
+            data = analytics.analytics('day', self.today - timedelta(days=2), self.today)
+        self.assertEqual(data['chiffre_affaires']['montants'], [0.0, 15.0, 60.0])
+        self.assertEqual(data['chiffre_affaires']['factures'], [0, 1, 1])
+        self.assertEqual(
+            [(d['doctor_id'], d['montant']) for d in data['par_medecin']],
+            [(self.doctor.id, 60.0), (None, 15.0)]
+        )
+        self.assertEqual(
+            [(m['methode'], m['label'], m['montant']) for m in data['methodes_paiement']],
+            [('CARTE', 'Carte bancaire', 60.0), ('ESPECES', 'Espèces', 15.0)]
+        )
+        self.assertEqual(
+            [(a['tranche'], a['factures'], a['montant']) for a in data['anciennete_impayes']],
+            [('0-30', 1, 10.0), ('30-60', 1, 20.0), ('60-90', 0, 0.0), ('90+', 2, 70.0)]
+        )
+
+    def test_endpoint_cached_until_facture_changes(self):
+        client = self.client_for(self.admin)
+        response = client.get(self.url)
+        self.assertEqual(response.data['granularity'], 'month')
+        self.assertEqual(sum(response.data['chiffre_affaires']['montants']), 75.0)
+        with self.assertNumQueries(0):
+            client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Facture.objects.create(
+                patient=self.patient, montant=Decimal('5.00'), statut='PAYEE', date_paiement=timezone.now()
+            )
+        response = client.get(self.url, {'granularity': 'week'})
+        self.assertEqual(sum(response.data['chiffre_affaires']['montants']), 80.0)
+        self.assertEqual(client.get(self.url, {'granularity': 'year'}).status_code, 400)
+        self.assertEqual(client.get(self.url, {'date_debut': 'hier'}).status_code, 400)
+        self.assertEqual(self.client_for(self.patient.user).get(self.url).status_code, 403)
+
+
+class FactureExportTests(BookingTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9), motif='Fièvre')
+        Facture.objects.create(patient=self.patient, consultation=consultation, montant=Decimal('60.00'), statut='PAYEE')
+        Facture.objects.create(patient=self.patient, montant=Decimal('15.50'))
+
+    def test_jsonl_with_list_filters(self):
+        response = self.client_for(self.admin).get('/api/factures/export/jsonl/', {'statut': 'PAYEE'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['montant'], rows[0]['doctor_id']), ('60.00', self.doctor.id))
 
-# Create your tests here.
+    def test_rejected_requests(self):
+        client = self.client_for(self.admin)
+        self.assertEqual(client.get('/api/factures/export/xlsx/').status_code, 400)
+        self.assertEqual(client.post('/api/factures/export/csv/', {}).status_code, 405)
+        self.assertEqual(self.client_for(self.patient.user).get('/api/factures/export/csv/').status_code, 403)
@@ -1,19 +1,23 @@
 from django.urls import path
 from .views import (
     FactureListCreateView,
+    FactureExportView,
     FactureDetailView,
     FacturePaymentView,
     PatientFacturesListView,
     PatientFactureDetailView,
-    FactureStatsView
+    FactureStatsView,
+    FactureAnalyticsView
 )
 
 urlpatterns = [
     # Admin routes
     path('', FactureListCreateView.as_view(), name='facture-list-create'),
+    path('export/<str:export_format>/', FactureExportView.as_view(), name='facture-export'),
     path('<int:pk>/', FactureDetailView.as_view(), name='facture-detail'),
     path('<int:pk>/payer/', FacturePaymentView.as_view(), name='facture-payment'),
     path('stats/', FactureStatsView.as_view(), name='facture-stats'),
+    path('analytics/', FactureAnalyticsView.as_view(), name='facture-analytics'),
     
     # Patient routes
     path('patient/mes-factures/', PatientFacturesListView.as_view(), name='patient-factures'),
@@ -1,9 +1,19 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import generics, status
-from rest_framework.views import APIView
-from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Sum
-from datetime import datetime
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users import dashboard_cache, stats
+from users.exports import ExportMixin
+from users.models import Patient
+from users.permissions import IsAdminRole
+from users.rapport_views import parse_period
+
+from . import analytics
 from .models import Facture
 from .serializers import (
     FactureSerializer,
@@ -11,8 +21,6 @@ from .serializers import (
     FacturePaymentSerializer,
     PatientFactureSerializer
 )
-from users.models import Patient
-from users.permissions import IsAdminRole
 
 
 class FactureListCreateView(generics.ListCreateAPIView):
@@ -67,6 +75,28 @@ class FactureListCreateView(generics.ListCreateAPIView):
         return queryset
 
 
+class FactureExportView(ExportMixin, FactureListCreateView):
+    """
+    GET: Export CSV/JSONL en flux des factures (Admin), mêmes filtres que la liste
+    """
+    export_name = 'factures'
+    export_columns = (
+        ('id', 'id'),
+        ('numero_facture', 'numero_facture'),
+        ('date_creation', 'date_creation'),
+        ('patient_id', 'patient_id'),
+        ('patient_nom', 'patient__nom'),
+        ('patient_prenom', 'patient__prenom'),
+        ('consultation_id', 'consultation_id'),
+        ('doctor_id', 'consultation__doctor_id'),
+        ('montant', 'montant'),
+        ('statut', 'statut'),
+        ('methode_paiement', 'methode_paiement'),
+        ('date_paiement', 'date_paiement'),
+        ('description', 'description'),
+    )
+
+
 class FactureDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Récupérer une facture
@@ -172,25 +202,52 @@ class FactureStatsView(APIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
     
     def get(self, request):
-        total_factures = Facture.objects.count()
-        factures_payees = Facture.objects.filter(statut='PAYEE').count()
-        factures_en_attente = Facture.objects.filter(statut='EN_ATTENTE').count()
-        factures_annulees = Facture.objects.filter(statut='ANNULEE').count()
-        
-        montant_total = Facture.objects.aggregate(Sum('montant'))['montant__sum'] or 0
-        montant_paye = Facture.objects.filter(statut='PAYEE').aggregate(Sum('montant'))['montant__sum'] or 0
-        montant_en_attente = Facture.objects.filter(statut='EN_ATTENTE').aggregate(Sum('montant'))['montant__sum'] or 0
+        # Une seule requête (agrégation conditionnelle), mise en cache jusqu'à la prochaine facture modifiée
+        counts = dashboard_cache.cached('factures', dashboard_cache.FACTURES, stats.facture_counts)
         
         return Response({
             'factures_count': {
-                'total': total_factures,
-                'payees': factures_payees,
-                'en_attente': factures_en_attente,
-                'annulees': factures_annulees
+                'total': counts['total'],
+                'payees': counts['payees'],
+                'en_attente': counts['en_attente'],
+                'annulees': counts['annulees']
             },
             'montants': {
-                'total': float(montant_total),
-                'paye': float(montant_paye),
-                'en_attente': float(montant_en_attente)
+                'total': float(counts['montant_total']),
+                'paye': float(counts['montant_paye']),
+                'en_attente': float(counts['montant_en_attente'])
             }
         }, status=status.HTTP_200_OK)
+
+
+class FactureAnalyticsView(APIView):
+    """
+    GET: Analyse des factures (Admin): chiffre d'affaires par période, par
+    médecin et par méthode de paiement, ancienneté des impayés
+
+    Query Parameters:
+    - granularity: day, week ou month (défaut: month)
+    - date_debut / date_fin: période (YYYY-MM-DD, défaut selon la granularité jusqu'à aujourd'hui)
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def get(self, request):
+        granularity = request.query_params.get('granularity') or 'month'
+        if granularity not in analytics.GRANULARITIES:
+            return Response(
+                {'error': f"granularity invalide ({', '.join(analytics.GRANULARITIES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            start, end = parse_period(request)
+            end = end or timezone.localdate()
+            start = start or end - timedelta(days=analytics.DEFAULT_SPANS[granularity])
+            # Quatre requêtes groupées, mises en cache jusqu'à la prochaine facture modifiée
+            data = dashboard_cache.cached(
+                'factures_analytics', dashboard_cache.FACTURES,
+                lambda: analytics.analytics(granularity, start, end),
+                variant=f'{granularity}:{start}:{end}'
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_200_OK)
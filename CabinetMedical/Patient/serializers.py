@@ -1,5 +1,6 @@
+from django.utils import timezone
 from rest_framework import serializers
-from users.models import Consultation, DossierMedical, Patient, Doctor
+from users.models import Consultation, DossierMedical, Patient, Doctor, WaitlistEntry
 from DoctorPatient.models import Reclamation, Message
 
 
@@ -23,15 +24,39 @@ class PatientConsultationCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Consultation
         fields = ['doctor', 'start_time', 'motif']
+        extra_kwargs = {'doctor': {'queryset': Doctor.objects.select_related('user')}}
     
     def validate_start_time(self, value):
         """Valider que la date est dans le futur"""
-        from django.utils import timezone
         if value < timezone.now():
             raise serializers.ValidationError("La date doit être dans le futur")
         return value
 
 
+class PatientWaitlistSerializer(serializers.ModelSerializer):
+    """Serializer pour les demandes de liste d'attente du patient"""
+    doctor_nom = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id', 'doctor', 'doctor_nom', 'window_start', 'window_end', 'motif',
+            'statut', 'offered_start_time', 'offer_expires_at', 'created_at'
+        ]
+        read_only_fields = ['id', 'statut', 'offered_start_time', 'offer_expires_at', 'created_at']
+        extra_kwargs = {'doctor': {'queryset': Doctor.objects.filter(user__is_approved=True)}}
+
+    def get_doctor_nom(self, obj):
+        return f"Dr. {obj.doctor.nom} {obj.doctor.prenom}"
+
+    def validate(self, data):
+        if data['window_end'] <= data['window_start']:
+            raise serializers.ValidationError("La fin de la fenêtre doit être après son début")
+        if data['window_end'] < timezone.now():
+            raise serializers.ValidationError("La fenêtre doit être dans le futur")
+        return data
+
+
 class PatientDossierMedicalSerializer(serializers.ModelSerializer):
     """Serializer pour les dossiers médicaux du patient"""
     doctor_nom = serializers.SerializerMethodField()
@@ -7,6 +7,10 @@ from .views import (
     DoctorsAvailableListView,
     PatientPrendreRendezVousView,
     PatientAnnulerRendezVousView,
+    # Liste d'attente
+    PatientWaitlistView,
+    PatientWaitlistDetailView,
+    PatientWaitlistOfferView,
     # Dossiers médicaux
     PatientDossiersListView,
     PatientDossierDetailView,
@@ -31,6 +35,12 @@ urlpatterns = [
     path('doctors/', DoctorsAvailableListView.as_view(), name='patient-doctors-list'),
     path('rendez-vous/', PatientPrendreRendezVousView.as_view(), name='patient-prendre-rdv'),
     path('rendez-vous/<int:consultation_id>/annuler/', PatientAnnulerRendezVousView.as_view(), name='patient-annuler-rdv'),
+
+    # Liste d'attente
+    path('liste-attente/', PatientWaitlistView.as_view(), name='patient-waitlist'),
+    path('liste-attente/<int:entry_id>/', PatientWaitlistDetailView.as_view(), name='patient-waitlist-detail'),
+    path('liste-attente/<int:entry_id>/accepter/', PatientWaitlistOfferView.as_view(), {'action': 'accepter'}, name='patient-waitlist-accept'),
+    path('liste-attente/<int:entry_id>/refuser/', PatientWaitlistOfferView.as_view(), {'action': 'refuser'}, name='patient-waitlist-decline'),
     
     # ========== DOSSIERS MÉDICAUX ==========
     
@@ -6,13 +6,19 @@ from django.db.models import Q
 from django.utils.dateparse import parse_date
 from django.utils import timezone
 from datetime import datetime, timedelta
-import re
-
-from users.models import Patient, Doctor, Consultation, DossierMedical
+from heapq import merge
+
+from users.booking import BookingError, book_consultation
+from users.holds import held_intervals
+from users.intervals import busy_intervals
+from users.models import Patient, Doctor, Consultation, DossierMedical, WaitlistEntry
+from users.waitlist import accept_offer, decline_offer, offer_freed_slot, withdraw
+from users.schedule import free_slots, get_doctor_schedule, window_bounds
 from DoctorPatient.models import Reclamation, Message
 from .serializers import (
     PatientConsultationSerializer,
     PatientConsultationCreateSerializer,
+    PatientWaitlistSerializer,
     PatientDossierMedicalSerializer,
     PatientDossierDeposeSerializer,
     PatientReclamationSerializer,
@@ -22,71 +28,6 @@ from .serializers import (
 )
 
 
-# ============ FONCTIONS UTILITAIRES POUR VALIDATION SCHEDULE ============
-# ============ UTILS SCHEDULE (CORRIGÉES) ============
-
-def parse_schedule(schedule_str):
-    """
-    Exemple accepté :
-    "Lun - Ven | 08:00 - 16:00"
-    """
-    if not schedule_str:
-        return None
-
-    try:
-        # Nettoyage
-        schedule_str = schedule_str.lower()
-        schedule_str = schedule_str.replace('|', '')
-        schedule_str = schedule_str.replace(' ', '')
-
-        # lun-ven08:00-16:00
-        day_part, time_part = schedule_str.split('08')[0], schedule_str.split('08')[1]
-        day_part = day_part.replace('-', '-')
-        time_part = '08' + time_part
-
-        fr_days = {
-            'lun': 0, 'mar': 1, 'mer': 2,
-            'jeu': 3, 'ven': 4, 'sam': 5, 'dim': 6
-        }
-
-        d1, d2 = day_part.split('-')
-        start_day = fr_days[d1[:3]]
-        end_day = fr_days[d2[:3]]
-
-        days = set(range(start_day, end_day + 1))
-
-        t1, t2 = time_part.split('-')
-        start_time = datetime.strptime(t1, "%H:%M").time()
-        end_time = datetime.strptime(t2, "%H:%M").time()
-
-        return days, start_time, end_time
-
-    except Exception as e:
-        print("Erreur parsing schedule:", e)
-        return None
-
-
-def is_within_schedule(start_dt, end_dt, schedule):
-    parsed = parse_schedule(schedule)
-    if not parsed:
-        return True
-
-    days, t_start, t_end = parsed
-
-    start_local = timezone.localtime(start_dt)
-    end_local = timezone.localtime(end_dt)
-
-    if start_local.weekday() not in days:
-        return False
-
-    if start_local.time() < t_start or end_local.time() > t_end:
-        return False
-
-    return True
-
-
-
-
 # ============ VUES POUR LES CONSULTATIONS DU PATIENT ============
 
 class PatientConsultationsListView(APIView):
@@ -113,13 +54,70 @@ class PatientConsultationDetailView(APIView):
 # ============ VUES POUR PRENDRE RENDEZ-VOUS ============
 
 class DoctorsAvailableListView(APIView):
+    """
+    Liste des docteurs approuvés
+
+    Query Parameters:
+    - specialty: Filtrer par spécialité
+    - q: Recherche par nom, prénom ou spécialité
+    - mode=earliest: Prochain créneau libre de chaque docteur, trié du plus proche
+      au plus lointain, entre start et end (YYYY-MM-DD, 14 jours par défaut)
+    """
     permission_classes = [IsAuthenticated]
+    MAX_DAYS = 31
 
     def get(self, request):
-        doctors = Doctor.objects.filter(user__is_approved=True)
+        doctors = Doctor.objects.filter(user__is_approved=True).select_related('user')
+
+        specialty = request.query_params.get('specialty')
+        if specialty:
+            doctors = doctors.filter(specialty__icontains=specialty)
+
+        q = request.query_params.get('q')
+        if q:
+            doctors = doctors.filter(
+                Q(nom__icontains=q) |
+                Q(prenom__icontains=q) |
+                Q(specialty__icontains=q)
+            )
+
+        if request.query_params.get('mode') == 'earliest':
+            return self.earliest_slots(request, list(doctors))
+
         serializer = DoctorListSerializer(doctors, many=True)
         return Response(serializer.data)
 
+    def earliest_slots(self, request, doctors):
+        start_date = request.query_params.get('start')
+        end_date = request.query_params.get('end')
+        try:
+            start_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.localdate()
+            end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else start_day + timedelta(days=13)
+        except ValueError:
+            return Response({'error': 'Format de date invalide (YYYY-MM-DD)'}, status=400)
+        if end_day < start_day or (end_day - start_day).days >= self.MAX_DAYS:
+            return Response({'error': f'La période doit être comprise entre 1 et {self.MAX_DAYS} jours'}, status=400)
+
+        window_start, window_end = window_bounds(start_day, end_day)
+
+        # Index en mémoire: au plus une requête pour charger les docteurs manquants
+        doctor_ids = [doctor.id for doctor in doctors]
+        busy_by_doctor = busy_intervals(doctor_ids, window_start, window_end)
+        # Créneaux gardés par d'autres patients en cours de réservation
+        held = held_intervals(doctor_ids, window_start, window_end, exclude_user=request.user)
+
+        results = []
+        for doctor, data in zip(doctors, DoctorListSerializer(doctors, many=True).data):
+            busy = list(merge(busy_by_doctor[doctor.id], held[doctor.id]))
+            slots = free_slots(get_doctor_schedule(doctor), busy, window_start, window_end)
+            # Horaire vide ou inexploitable: aucun créneau proposé (next_slot None)
+            data['next_slot'] = next(slots, None)
+            results.append(data)
+
+        # Les docteurs sans créneau libre sur la période en dernier; à égalité, par id
+        results.sort(key=lambda d: (d['next_slot'] is None, d['next_slot'] or window_end, d['id']))
+        return Response(results)
+
 
 class PatientPrendreRendezVousView(APIView):
     permission_classes = [IsAuthenticated]
@@ -131,40 +129,17 @@ class PatientPrendreRendezVousView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=400)
 
-        doctor = serializer.validated_data['doctor']
-        start_time = serializer.validated_data['start_time']
-
-        # 🔥 CORRECTION TIMEZONE (OBLIGATOIRE)
-        if timezone.is_naive(start_time):
-            start_time = timezone.make_aware(
-                start_time, timezone.get_current_timezone()
+        # Approbation, horaires et conflits sont vérifiés par le service de réservation
+        try:
+            consultation = book_consultation(
+                serializer.validated_data['doctor'],
+                patient,
+                serializer.validated_data['start_time'],
+                serializer.validated_data.get('motif', ''),
+                user=request.user
             )
-
-        end_time = start_time + timedelta(minutes=30)
-
-        if not is_within_schedule(start_time, end_time, doctor.schedule):
-            return Response({
-                "error": f"Le docteur n'est pas disponible à cet horaire. Horaires de travail: {doctor.schedule}"
-            }, status=400)
-
-        conflict = Consultation.objects.filter(
-            doctor=doctor,
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        )
-
-        if conflict.exists():
-            return Response({
-                "error": "Ce créneau horaire est déjà réservé"
-            }, status=400)
-
-        consultation = Consultation.objects.create(
-            doctor=doctor,
-            patient=patient,
-            start_time=start_time,
-            end_time=end_time,
-            motif=serializer.validated_data.get('motif', '')
-        )
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
 
         return Response(
             PatientConsultationSerializer(consultation).data,
@@ -198,7 +173,10 @@ class PatientAnnulerRendezVousView(APIView):
                     'error': 'Vous ne pouvez pas annuler ce rendez-vous moins de 24 heures avant'
                 }, status=400)
 
+            doctor_id, start_time = consultation.doctor_id, consultation.start_time
             consultation.delete()
+            # Proposer le créneau libéré à la liste d'attente du docteur
+            offer_freed_slot(doctor_id, start_time, exclude_patient_id=patient.id)
             return Response({'message': 'Rendez-vous annulé avec succès'}, status=200)
 
         except Patient.DoesNotExist:
@@ -207,6 +185,88 @@ class PatientAnnulerRendezVousView(APIView):
             return Response({'error': 'Rendez-vous introuvable'}, status=404)
 
 
+# ============ LISTE D'ATTENTE ============
+
+class PatientWaitlistView(APIView):
+    """
+    Liste d'attente du patient
+
+    GET: Mes demandes
+    POST: S'inscrire chez un docteur pour une fenêtre {doctor, window_start, window_end, motif}
+    Quand un rendez-vous de ce docteur est annulé dans la fenêtre, le créneau
+    est proposé et gardé au patient jusqu'à offer_expires_at (statut PROPOSE,
+    offered_start_time); sans réponse, il passe au suivant (commande
+    expire_waitlist_offers).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            patient = Patient.objects.get(user=request.user)
+        except Patient.DoesNotExist:
+            return Response({'error': 'Profil patient introuvable'}, status=404)
+        entries = WaitlistEntry.objects.filter(patient=patient).select_related('doctor')
+        return Response(PatientWaitlistSerializer(entries, many=True).data)
+
+    def post(self, request):
+        try:
+            patient = Patient.objects.get(user=request.user)
+        except Patient.DoesNotExist:
+            return Response({'error': 'Profil patient introuvable'}, status=404)
+        serializer = PatientWaitlistSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        serializer.save(patient=patient)
+        return Response(serializer.data, status=201)
+
+
+def get_waitlist_entry(request, entry_id):
+    return WaitlistEntry.objects.select_related('doctor', 'patient__user').get(
+        id=entry_id, patient__user=request.user
+    )
+
+
+class PatientWaitlistDetailView(APIView):
+    """Quitter la liste d'attente"""
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, entry_id):
+        try:
+            entry = get_waitlist_entry(request, entry_id)
+        except WaitlistEntry.DoesNotExist:
+            return Response({'error': 'Demande introuvable'}, status=404)
+        # Un créneau proposé et abandonné passe au suivant
+        withdraw(entry)
+        return Response({'message': 'Demande supprimée'}, status=200)
+
+
+class PatientWaitlistOfferView(APIView):
+    """
+    Réponse à un créneau proposé
+    POST .../accepter/: Réserver le créneau
+    POST .../refuser/: Refuser (la demande reste en attente, le créneau passe au suivant)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, entry_id, action):
+        try:
+            entry = get_waitlist_entry(request, entry_id)
+        except WaitlistEntry.DoesNotExist:
+            return Response({'error': 'Demande introuvable'}, status=404)
+
+        try:
+            if action == 'accepter':
+                consultation = accept_offer(entry)
+                return Response({
+                    'message': 'Rendez-vous pris avec succès',
+                    'consultation': PatientConsultationSerializer(consultation).data
+                }, status=201)
+            decline_offer(entry)
+        except BookingError as e:
+            return Response(e.as_dict(), status=e.status)
+        return Response(PatientWaitlistSerializer(entry).data)
+
+
 # ============ VUES POUR LES DOSSIERS MÉDICAUX ============
 
 class PatientDossiersListView(APIView):
@@ -143,6 +143,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# Les réponses des dashboards utilisent l'alias 'dashboard' (voir users/dashboard_cache.py);
+# le remplacer par FileBasedCache, Redis... pour partager le cache entre processus.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        # Les compteurs "aujourd'hui" / "à venir" changent aussi avec l'heure
+        'TIMEOUT': 60,
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,310 @@
+"""
+Service de réservation unique utilisé par toutes les vues qui créent ou
+déplacent une consultation.
+
+Approbation du médecin, horaires de travail et chevauchement sont validés
+dans une seule transaction; les erreurs sont retournées sous forme de
+``BookingError`` (code + message + statut HTTP).
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import dashboard_cache, intervals, rollup
+from .models import (
+    CONSULTATION_OVERLAP_CONSTRAINT,
+    CONSULTATION_PATIENT_OVERLAP_CONSTRAINT,
+    Consultation,
+    ConsultationConflict,
+    Doctor,
+    Patient,
+    PatientConsultationConflict,
+    SlotHold,
+    booking_atomic,
+)
+from .motifs import motif_code
+from .schedule import SLOT_DURATION, is_within_schedule
+
+CONFLICT_MESSAGE = 'Conflit d\'horaire: ce médecin a déjà un rendez-vous à cette heure'
+PATIENT_CONFLICT_MESSAGE = 'Conflit d\'horaire: ce patient a déjà un rendez-vous à cette heure'
+HELD_MESSAGE = 'Ce créneau est temporairement réservé par un autre utilisateur, réessayez dans quelques minutes'
+
+
+class BookingError(Exception):
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+    def as_dict(self):
+        return {'error': self.message, 'code': self.code}
+
+
+def _resolve(queryset, value, message):
+    if isinstance(value, queryset.model):
+        return value
+    try:
+        return queryset.get(pk=value)
+    except (queryset.model.DoesNotExist, ValueError, TypeError):
+        raise BookingError('not_found', message, status=404)
+
+
+def book_consultation(doctor, patient, start_time, motif=None, consultation=None, user=None):
+    """
+    Crée une consultation, ou déplace ``consultation`` si elle est fournie.
+
+    ``doctor`` et ``patient`` sont des instances ou des identifiants. Un médecin
+    passé en instance devrait avoir ``user`` déjà chargé (select_related).
+    ``user`` est l'utilisateur qui réserve: ses gardes de créneau (SlotHold)
+    sont consommées, celles des autres bloquent la réservation.
+    """
+    try:
+        with booking_atomic():
+            return _book(doctor, patient, start_time, motif, consultation, user)
+    except PatientConsultationConflict:
+        raise BookingError('patient_conflict', PATIENT_CONFLICT_MESSAGE)
+    except ConsultationConflict:
+        raise BookingError('conflict', CONFLICT_MESSAGE)
+
+
+def _book(doctor, patient, start_time, motif, consultation, user):
+    doctor = _resolve(Doctor.objects.select_related('user'), doctor, 'Médecin non trouvé')
+    patient = _resolve(Patient.objects.all(), patient, 'Patient non trouvé')
+
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time, timezone.get_current_timezone())
+    end_time = start_time + SLOT_DURATION
+
+    # Une consultation existante qui garde son créneau n'est pas revalidée
+    slot_changed = (
+        consultation is None
+        or consultation.doctor_id != doctor.id
+        or consultation.start_time != start_time
+    )
+    if slot_changed:
+        if not doctor.user.is_approved:
+            raise BookingError('doctor_not_approved', 'Ce médecin n\'est pas encore approuvé')
+        if not is_within_schedule(start_time, end_time, doctor):
+            raise BookingError(
+                'outside_schedule',
+                f'Consultation hors des heures de travail du médecin. Horaires: {doctor.schedule}'
+            )
+        own_holds = _check_holds(doctor, start_time, end_time, user)
+        exclude = consultation.pk if consultation is not None else None
+        if intervals.is_slot_free(doctor.id, start_time, end_time, exclude) is False:
+            _confirm_conflict(doctor, start_time, end_time, exclude)
+    else:
+        own_holds = []
+
+    if consultation is None:
+        consultation = Consultation()
+    consultation.doctor = doctor
+    consultation.patient = patient
+    consultation.start_time = start_time
+    consultation.end_time = end_time
+    if motif is not None:
+        consultation.motif = motif
+    consultation.save()
+    if own_holds:
+        SlotHold.objects.filter(id__in=own_holds).delete()
+    return consultation
+
+
+def _check_holds(doctor, start_time, end_time, user):
+    """Refuse un créneau gardé par quelqu'un d'autre; retourne les gardes de ``user`` à consommer"""
+    holds = SlotHold.objects.filter(
+        doctor=doctor,
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+        expires_at__gt=timezone.now()
+    ).values_list('id', 'user_id')
+    user_id = user.pk if user is not None else None
+    own = []
+    for hold_id, holder_id in holds:
+        if holder_id != user_id:
+            raise BookingError('slot_held', HELD_MESSAGE, status=409)
+        own.append(hold_id)
+    return own
+
+
+def _confirm_conflict(doctor, start_time, end_time, exclude):
+    """L'index signale un conflit: le confirmer en base avant de refuser"""
+    overlapping = Consultation.objects.filter(
+        doctor=doctor,
+        start_time__lt=end_time,
+        end_time__gt=start_time
+    ).exclude(pk=exclude)
+    if overlapping.exists():
+        raise BookingError('conflict', CONFLICT_MESSAGE)
+    # Index en retard sur la base (annulation faite par un autre processus)
+    intervals.invalidate(doctor.id)
+
+
+RECURRENCE_STEPS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+MAX_BATCH_SIZE = 200
+
+
+def expand_recurrence(start_time, frequency, count, interval=1):
+    """Dates de début d'une série (ex: hebdomadaire pendant 12 semaines)"""
+    if frequency not in RECURRENCE_STEPS:
+        raise BookingError('invalid_recurrence', 'Fréquence invalide (daily ou weekly)')
+    if not 1 <= count <= MAX_BATCH_SIZE or interval < 1:
+        raise BookingError(
+            'invalid_recurrence',
+            f'La série doit contenir entre 1 et {MAX_BATCH_SIZE} consultations'
+        )
+    step = RECURRENCE_STEPS[frequency] * interval
+    return [start_time + step * i for i in range(count)]
+
+
+def book_many(items, user=None):
+    """
+    Réserve un lot de consultations en une passe.
+
+    ``items`` est une liste de dicts {doctor, patient, start_time, motif}
+    (identifiants). Les médecins, patients et créneaux déjà occupés de la
+    période couverte sont chargés une seule fois, chaque candidat est validé
+    en mémoire (y compris contre les autres candidats du lot), puis les
+    candidats valides sont insérés avec ``bulk_create``.
+
+    Retourne un résultat par item, dans l'ordre: {'index', 'status', ...}.
+    """
+    if not items:
+        return []
+    if len(items) > MAX_BATCH_SIZE:
+        raise BookingError('batch_too_large', f'Maximum {MAX_BATCH_SIZE} consultations par lot')
+
+    for item in items:
+        if timezone.is_naive(item['start_time']):
+            item['start_time'] = timezone.make_aware(item['start_time'], timezone.get_current_timezone())
+
+    try:
+        with booking_atomic():
+            return _book_many(items, user)
+    except IntegrityError as e:
+        # Réservation concurrente pendant l'insertion: rien n'a été enregistré
+        if CONSULTATION_OVERLAP_CONSTRAINT in str(e) or CONSULTATION_PATIENT_OVERLAP_CONSTRAINT in str(e):
+            raise BookingError(
+                'conflict',
+                'Conflit d\'horaire avec une réservation concurrente, veuillez réessayer',
+                status=409
+            )
+        raise
+
+
+def _book_many(items, user):
+    doctors = Doctor.objects.select_related('user').in_bulk({item['doctor'] for item in items})
+    patients = Patient.objects.in_bulk({item['patient'] for item in items})
+    window_start = min(item['start_time'] for item in items)
+    window_end = max(item['start_time'] for item in items) + SLOT_DURATION
+
+    # Créneaux occupés de chaque médecin et de chaque patient, triés par début (une requête)
+    booked = defaultdict(list)
+    patient_booked = defaultdict(list)
+    existing = Consultation.objects.filter(
+        Q(doctor_id__in=list(doctors)) | Q(patient_id__in=list(patients)),
+        start_time__lt=window_end,
+        end_time__gt=window_start
+    ).order_by('start_time').values_list('doctor_id', 'patient_id', 'start_time', 'end_time')
+    for doctor_id, patient_id, start, end in existing:
+        if doctor_id in doctors:
+            booked[doctor_id].append((start, end))
+        if patient_id in patients:
+            patient_booked[patient_id].append((start, end))
+
+    # Créneaux gardés par d'autres utilisateurs
+    held = defaultdict(list)
+    holds = SlotHold.objects.filter(
+        doctor_id__in=list(doctors),
+        start_time__lt=window_end,
+        end_time__gt=window_start,
+        expires_at__gt=timezone.now()
+    )
+    if user is not None:
+        holds = holds.exclude(user=user)
+    for doctor_id, start, end in holds.values_list('doctor_id', 'start_time', 'end_time'):
+        held[doctor_id].append((start, end))
+
+    results = []
+    to_create = []
+    for index, item in enumerate(items):
+        doctor = doctors.get(_as_int(item['doctor']))
+        patient = patients.get(_as_int(item['patient']))
+        start_time = item['start_time']
+        end_time = start_time + SLOT_DURATION
+
+        error = None
+        if doctor is None:
+            error = BookingError('not_found', 'Médecin non trouvé', status=404)
+        elif patient is None:
+            error = BookingError('not_found', 'Patient non trouvé', status=404)
+        elif not doctor.user.is_approved:
+            error = BookingError('doctor_not_approved', 'Ce médecin n\'est pas encore approuvé')
+        elif not is_within_schedule(start_time, end_time, doctor):
+            error = BookingError(
+                'outside_schedule',
+                f'Consultation hors des heures de travail du médecin. Horaires: {doctor.schedule}'
+            )
+        elif any(start < end_time and end > start_time for start, end in held[doctor.id]):
+            error = BookingError('slot_held', HELD_MESSAGE, status=409)
+        elif _overlaps(booked[doctor.id], start_time, end_time):
+            error = BookingError('conflict', CONFLICT_MESSAGE)
+        elif _overlaps(patient_booked[patient.id], start_time, end_time):
+            error = BookingError('patient_conflict', PATIENT_CONFLICT_MESSAGE)
+
+        if error is not None:
+            results.append({'index': index, 'status': error.code, 'error': error.message})
+            continue
+
+        insort(booked[doctor.id], (start_time, end_time))
+        insort(patient_booked[patient.id], (start_time, end_time))
+        to_create.append(Consultation(
+            doctor=doctor,
+            patient=patient,
+            start_time=start_time,
+            end_time=end_time,
+            motif=item.get('motif') or '',
+            # bulk_create n'appelle pas save()
+            motif_code=motif_code(item.get('motif'))
+        ))
+        results.append({'index': index, 'status': 'created'})
+
+    created_list = Consultation.objects.bulk_create(to_create)
+    # bulk_create n'envoie pas post_save: mettre l'index et l'agrégat à jour nous-mêmes
+    def index_created():
+        for c in created_list:
+            intervals.record(c.pk, c.doctor_id, c.start_time, c.end_time)
+    transaction.on_commit(index_created)
+    rollup.refresh_on_commit((c.doctor_id, rollup.stat_day(c.start_time)) for c in created_list)
+    dashboard_cache.invalidate(
+        dashboard_cache.ADMIN,
+        *{dashboard_cache.doctor_scope(c.doctor_id) for c in created_list},
+        *{dashboard_cache.patient_scope(c.patient_id) for c in created_list}
+    )
+    created = iter(created_list)
+    for result in results:
+        if result['status'] == 'created':
+            consultation = next(created)
+            result['consultation'] = consultation
+    return results
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _overlaps(intervals, start_time, end_time):
+    """Chevauchement avec des intervalles triés et disjoints: seul le précédent compte"""
+    i = bisect_left(intervals, (end_time,))
+    return i > 0 and intervals[i - 1][1] > start_time
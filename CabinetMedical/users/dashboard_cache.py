@@ -0,0 +1,120 @@
+"""
+Cache des réponses des dashboards.
+
+Chaque réponse est rangée sous une portée: ``admin``, ``doctor:<id>``,
+``patient:<id>`` ou ``factures``. Les signaux (voir signals.py) invalident
+une portée en changeant sa version une fois la transaction validée; la clé
+d'une réponse contient la version de sa portée et la version globale
+(``ALL``, changée quand un médecin, un patient ou un utilisateur est modifié).
+Les anciennes entrées ne sont plus lues et expirent d'elles-mêmes.
+
+Le cache utilisé est l'alias ``dashboard`` de CACHES (``default`` s'il n'est
+pas configuré); sa durée (TIMEOUT) borne l'âge des compteurs qui dépendent
+de l'heure (aujourd'hui, à venir). Les compteurs de succès/échecs sont tenus
+par processus.
+"""
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'dashboard'
+
+ALL = 'all'
+ADMIN = 'admin'
+FACTURES = 'factures'
+
+
+def doctor_scope(doctor_id):
+    return f'doctor:{doctor_id}'
+
+
+def patient_scope(patient_id):
+    return f'patient:{patient_id}'
+
+
+_lock = threading.Lock()
+# dashboard -> [succès, échecs]
+_counters = defaultdict(lambda: [0, 0])
+
+
+def get_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def _version_key(scope):
+    return f'dashboard:version:{scope}'
+
+
+def _versions(cache, scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # Version perdue (éviction, redémarrage): en créer une jamais utilisée
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def version(*scopes):
+    """Version courante des portées: change à chaque invalidation de l'une d'elles"""
+    return ':'.join(_versions(get_cache(), scopes))
+
+
+def cached(dashboard, scope, build, variant=None):
+    """
+    Réponse du dashboard pour ``scope``, calculée par ``build()`` si absente.
+    ``variant`` distingue les réponses d'un même dashboard (paramètres de la requête).
+    """
+    cache = get_cache()
+    key = ':'.join(['dashboard', dashboard, scope, *_versions(cache, [ALL, scope])])
+    if variant:
+        key = f'{key}:{variant}'
+    payload = cache.get(key)
+    hit = payload is not None
+    if not hit:
+        payload = build()
+        cache.set(key, payload)
+    with _lock:
+        _counters[dashboard][0 if hit else 1] += 1
+    return payload
+
+
+def invalidate(*scopes):
+    """Invalide les portées une fois la transaction courante validée"""
+    scopes = set(scopes)
+
+    def bump():
+        get_cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def stats():
+    """Succès/échecs par dashboard depuis le démarrage du processus"""
+    with _lock:
+        counters = {dashboard: tuple(values) for dashboard, values in _counters.items()}
+    hits = sum(h for h, _ in counters.values())
+    misses = sum(m for _, m in counters.values())
+    return {
+        'backend': type(get_cache()).__name__,
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'dashboards': {
+            dashboard: {'hits': h, 'misses': m}
+            for dashboard, (h, m) in sorted(counters.items())
+        },
+    }
+
+
+def reset_stats():
+    with _lock:
+        _counters.clear()
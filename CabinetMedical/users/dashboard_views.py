@@ -2,10 +2,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count
-from datetime import datetime, timedelta
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, ExtractHour, ExtractIsoWeekDay, TruncDate
+from django.utils import timezone
+from datetime import datetime, time, timedelta
 from users.models import User, Doctor, Patient, Consultation
+from users import dashboard_cache, stats
 from users.permissions import IsAdminRole
+from users.schedule import SLOT_DURATION, compile_schedule, slots_per_hour
 
 
 class AdminDashboardStatsView(APIView):
@@ -17,44 +21,18 @@ class AdminDashboardStatsView(APIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
     
     def get(self, request):
-        # Compter les utilisateurs
-        total_patients = Patient.objects.count()
-        total_doctors = Doctor.objects.count()
-        total_consultations = Consultation.objects.count()
-        
-        # Patients actifs vs inactifs
-        active_patients = Patient.objects.filter(status='Actif').count()
-        inactive_patients = Patient.objects.filter(status='Inactif').count()
-        
-        # Docteurs approuvés vs non approuvés
-        approved_doctors = Doctor.objects.filter(user__is_approved=True).count()
-        pending_doctors = Doctor.objects.filter(user__is_approved=False).count()
-        
-        # Consultations par période
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        consultations_today = Consultation.objects.filter(
-            start_time__date=today
-        ).count()
-        
-        consultations_this_week = Consultation.objects.filter(
-            start_time__date__gte=week_ago
-        ).count()
-        
-        consultations_this_month = Consultation.objects.filter(
-            start_time__date__gte=month_ago
-        ).count()
-        
-        # Consultations à venir
-        upcoming_consultations = Consultation.objects.filter(
-            start_time__gte=datetime.now()
-        ).count()
+        data = dashboard_cache.cached('admin', dashboard_cache.ADMIN, self.build_payload)
+        return Response(data, status=status.HTTP_200_OK)
+    
+    def build_payload(self):
+        # Une requête par table (agrégation conditionnelle, voir users/stats.py)
+        patients = stats.patient_counts()
+        doctors = stats.doctor_counts()
+        counts = stats.consultation_counts()
         
         # Top 5 docteurs par nombre de consultations
-        top_doctors = Doctor.objects.annotate(
-            consultation_count=Count('consultations')
+        top_doctors = Doctor.objects.select_related('user').annotate(
+            consultation_count=Coalesce(Sum('daily_stats__count'), 0)
         ).order_by('-consultation_count')[:5]
         
         top_doctors_data = [
@@ -68,29 +46,29 @@ class AdminDashboardStatsView(APIView):
         ]
         
         # Consultations par spécialité
-        specialties = Doctor.objects.values('specialty').annotate(
-            count=Count('consultations')
-        ).order_by('-count')
+        specialties = stats.specialty_counts()
         
-        return Response({
+        return {
             'overview': {
-                'total_patients': total_patients,
-                'total_doctors': total_doctors,
-                'total_consultations': total_consultations,
-                'active_patients': active_patients,
-                'inactive_patients': inactive_patients,
-                'approved_doctors': approved_doctors,
-                'pending_doctors': pending_doctors
+                'total_patients': patients['total'],
+                'total_doctors': doctors['total'],
+                'total_consultations': counts['total'],
+                'active_patients': patients['actifs'],
+                'inactive_patients': patients['inactifs'],
+                'approved_doctors': doctors['approved'],
+                'pending_doctors': doctors['pending']
             },
             'consultations': {
-                'today': consultations_today,
-                'this_week': consultations_this_week,
-                'this_month': consultations_this_month,
-                'upcoming': upcoming_consultations
+                'today': counts['today'],
+                'this_week': counts['this_week'],
+                'this_month': counts['this_month'],
+                'upcoming': counts['upcoming']
             },
             'top_doctors': top_doctors_data,
-            'consultations_by_specialty': list(specialties)
-        }, status=status.HTTP_200_OK)
+            'consultations_by_specialty': [
+                {'specialty': row['specialty'], 'count': row['consultations']} for row in specialties
+            ]
+        }
 
 
 class DoctorDashboardStatsView(APIView):
@@ -116,33 +94,20 @@ class DoctorDashboardStatsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Statistiques de consultations
-        total_consultations = Consultation.objects.filter(doctor=doctor).count()
-        
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        consultations_today = Consultation.objects.filter(
-            doctor=doctor,
-            start_time__date=today
-        ).count()
-        
-        consultations_this_week = Consultation.objects.filter(
-            doctor=doctor,
-            start_time__date__gte=week_ago
-        ).count()
-        
-        consultations_this_month = Consultation.objects.filter(
-            doctor=doctor,
-            start_time__date__gte=month_ago
-        ).count()
+        data = dashboard_cache.cached(
+            'doctor', dashboard_cache.doctor_scope(doctor.id), lambda: self.build_payload(doctor)
+        )
+        return Response(data, status=status.HTTP_200_OK)
+    
+    def build_payload(self, doctor):
+        # Statistiques de consultations (agrégat journalier)
+        counts = stats.consultation_counts(doctor_id=doctor.id)
         
         # Consultations à venir
         upcoming_consultations = Consultation.objects.filter(
             doctor=doctor,
-            start_time__gte=datetime.now()
-        ).order_by('start_time')[:5]
+            start_time__gte=timezone.now()
+        ).select_related('patient__user').order_by('start_time')[:5]
         
         upcoming_data = [
             {
@@ -154,18 +119,19 @@ class DoctorDashboardStatsView(APIView):
             for consultation in upcoming_consultations
         ]
         
-        # Nombre de patients uniques
+        # Nombre de patients uniques: pas additionnable jour par jour, compté
+        # sur les consultations du docteur (index doctor/start_time)
         unique_patients = Consultation.objects.filter(
             doctor=doctor
         ).values('patient').distinct().count()
         
-        return Response({
+        return {
             'overview': {
-                'total_consultations': total_consultations,
+                'total_consultations': counts['total'],
                 'total_patients': unique_patients,
-                'consultations_today': consultations_today,
-                'consultations_this_week': consultations_this_week,
-                'consultations_this_month': consultations_this_month
+                'consultations_today': counts['today'],
+                'consultations_this_week': counts['this_week'],
+                'consultations_this_month': counts['this_month']
             },
             'upcoming_consultations': upcoming_data,
             'doctor_info': {
@@ -173,7 +139,7 @@ class DoctorDashboardStatsView(APIView):
                 'specialty': doctor.specialty,
                 'schedule': doctor.schedule
             }
-        }, status=status.HTTP_200_OK)
+        }
 
 
 class PatientDashboardStatsView(APIView):
@@ -199,20 +165,25 @@ class PatientDashboardStatsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Statistiques de consultations
-        total_consultations = Consultation.objects.filter(patient=patient).count()
-        
-        # Consultations passées
-        past_consultations = Consultation.objects.filter(
-            patient=patient,
-            start_time__lt=datetime.now()
-        ).count()
+        data = dashboard_cache.cached(
+            'patient', dashboard_cache.patient_scope(patient.id), lambda: self.build_payload(patient)
+        )
+        return Response(data, status=status.HTTP_200_OK)
+    
+    def build_payload(self, patient):
+        # Statistiques de consultations: total, passées et à venir en une requête
+        now = timezone.now()
+        counts = Consultation.objects.filter(patient=patient).aggregate(
+            total=Count('id'),
+            past=Count('id', filter=Q(start_time__lt=now)),
+            upcoming=Count('id', filter=Q(start_time__gte=now))
+        )
         
         # Consultations à venir
         upcoming_consultations = Consultation.objects.filter(
             patient=patient,
-            start_time__gte=datetime.now()
-        ).order_by('start_time')[:5]
+            start_time__gte=now
+        ).select_related('doctor__user').order_by('start_time')[:5]
         
         upcoming_data = [
             {
@@ -228,11 +199,11 @@ class PatientDashboardStatsView(APIView):
         # Nombre de dossiers médicaux
         total_dossiers = patient.dossiers.count()
         
-        return Response({
+        return {
             'overview': {
-                'total_consultations': total_consultations,
-                'past_consultations': past_consultations,
-                'upcoming_consultations_count': upcoming_consultations.count(),
+                'total_consultations': counts['total'],
+                'past_consultations': counts['past'],
+                'upcoming_consultations_count': counts['upcoming'],
                 'total_dossiers': total_dossiers
             },
             'upcoming_consultations': upcoming_data,
@@ -242,4 +213,144 @@ class PatientDashboardStatsView(APIView):
                 'address': patient.address,
                 'status': patient.status
             }
-        }, status=status.HTTP_200_OK)
+        }
+
+
+class AdminDashboardCacheStatsView(APIView):
+    """
+    Succès/échecs du cache des dashboards (surveillance)
+
+    GET: compteurs du processus qui répond, depuis son démarrage
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def get(self, request):
+        return Response(dashboard_cache.stats(), status=status.HTTP_200_OK)
+
+
+class AdminOccupancyView(APIView):
+    """
+    Taux d'occupation des créneaux pour la heatmap du dashboard admin
+
+    GET: /api/users/dashboard/admin/occupancy/?start=YYYY-MM-DD&end=YYYY-MM-DD&doctor_id=
+
+    Les consultations sont comptées par la base (GROUP BY jour de semaine/heure
+    et date/médecin); la capacité vient des horaires des médecins. Un médecin
+    sans horaire exploitable n'a pas de capacité (null).
+    Par défaut: les 28 derniers jours. Période limitée à 92 jours.
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    MAX_DAYS = 92
+
+    def get(self, request):
+        start_date = request.query_params.get('start')
+        end_date = request.query_params.get('end')
+        try:
+            end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else timezone.localdate()
+            start_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else end_day - timedelta(days=27)
+        except ValueError:
+            return Response(
+                {'error': 'Format de date invalide. Utilisez YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_day < start_day or (end_day - start_day).days >= self.MAX_DAYS:
+            return Response(
+                {'error': f'La période doit être comprise entre 1 et {self.MAX_DAYS} jours'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        doctors = Doctor.objects.all()
+        doctor_id = request.query_params.get('doctor_id')
+        if doctor_id:
+            try:
+                doctor_id = int(doctor_id)
+            except ValueError:
+                return Response(
+                    {'error': 'doctor_id invalide'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            doctors = doctors.filter(id=doctor_id)
+        doctors = list(doctors.only('id', 'nom', 'prenom', 'schedule'))
+
+        window_start = timezone.make_aware(datetime.combine(start_day, time()))
+        window_end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time()))
+        consultations = Consultation.objects.filter(
+            doctor__in=[doctor.id for doctor in doctors],
+            start_time__gte=window_start,
+            start_time__lt=window_end
+        )
+
+        # Agrégation en base, dans le fuseau courant
+        by_slot = consultations.annotate(
+            weekday=ExtractIsoWeekDay('start_time'),
+            hour=ExtractHour('start_time')
+        ).values('weekday', 'hour').annotate(booked=Count('id')).order_by()
+        by_day = consultations.annotate(
+            day=TruncDate('start_time')
+        ).values('day', 'doctor_id').annotate(booked=Count('id')).order_by()
+
+        booked_by_slot = {(row['weekday'] - 1, row['hour']): row['booked'] for row in by_slot}
+        booked_by_day = {(row['day'], row['doctor_id']): row['booked'] for row in by_day}
+
+        # Nombre de chaque jour de semaine dans la période
+        days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+        weekday_count = [0] * 7
+        for day in days:
+            weekday_count[day.weekday()] += 1
+
+        schedules = {doctor.id: compile_schedule(doctor.schedule) for doctor in doctors}
+        capacity_by_slot = [[0] * 24 for _ in range(7)]
+        for schedule in schedules.values():
+            if schedule is None:
+                continue
+            hourly = slots_per_hour(schedule)
+            for weekday in range(7):
+                if schedule.works_on(weekday):
+                    for hour in range(24):
+                        capacity_by_slot[weekday][hour] += hourly[hour] * weekday_count[weekday]
+
+        by_weekday_hour = []
+        for weekday in range(7):
+            for hour in range(24):
+                booked = booked_by_slot.get((weekday, hour), 0)
+                capacity = capacity_by_slot[weekday][hour]
+                if booked or capacity:
+                    by_weekday_hour.append(self.cell(
+                        {'weekday': weekday, 'hour': hour}, booked, capacity
+                    ))
+
+        by_date_doctor = []
+        for day in days:
+            for doctor in doctors:
+                schedule = schedules[doctor.id]
+                capacity = None
+                if schedule is not None:
+                    capacity = sum(slots_per_hour(schedule)) if schedule.works_on(day.weekday()) else 0
+                booked = booked_by_day.get((day, doctor.id), 0)
+                if booked or capacity:
+                    by_date_doctor.append(self.cell(
+                        {'date': day.strftime('%Y-%m-%d'), 'doctor_id': doctor.id}, booked, capacity
+                    ))
+
+        return Response({
+            'period': {
+                'start': start_day.strftime('%Y-%m-%d'),
+                'end': end_day.strftime('%Y-%m-%d'),
+            },
+            'slot_minutes': int(SLOT_DURATION.total_seconds() // 60),
+            'doctors': [
+                {'id': doctor.id, 'name': f"Dr. {doctor.nom} {doctor.prenom}"}
+                for doctor in doctors
+            ],
+            'by_weekday_hour': by_weekday_hour,
+            'by_date_doctor': by_date_doctor
+        })
+
+    @staticmethod
+    def cell(key, booked, capacity):
+        key.update({
+            'booked': booked,
+            'capacity': capacity,
+            'occupancy': round(booked / capacity, 3) if capacity else None
+        })
+        return key
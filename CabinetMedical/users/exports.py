@@ -0,0 +1,81 @@
+"""
+Exports CSV / JSONL en flux (StreamingHttpResponse).
+
+Les lignes sont lues par ``values_list().iterator(chunk_size=CHUNK_SIZE)``
+(curseur côté serveur sous PostgreSQL) et écrites au fur et à mesure: ni
+instances ni liste complète en mémoire, quelle que soit la taille de l'export.
+
+Une vue d'export hérite de la vue liste (mêmes filtres via ``get_queryset``)
+et de ``ExportMixin``, qui remplace le GET; le format vient de l'URL
+(``export/csv/`` ou ``export/jsonl/``), le paramètre ``format`` étant
+réservé par DRF.
+"""
+import csv
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer: rend la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def csv_rows(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def jsonl_rows(headers, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def stream(queryset, columns, export_format, name):
+    """
+    Réponse en flux des ``columns`` ((en-tête, champ), ...) de ``queryset``
+    au format ``csv`` ou ``jsonl``, en pièce jointe ``<name>-<date>.<format>``.
+    """
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[field for _, field in columns]).iterator(chunk_size=CHUNK_SIZE)
+    lines = (csv_rows if export_format == 'csv' else jsonl_rows)(headers, rows)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+    filename = f'{name}-{timezone.localdate().isoformat()}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ExportMixin:
+    """GET: export en flux de ``get_queryset()`` (``export_columns``, fichier ``export_name``)"""
+    export_columns = ()
+    export_name = 'export'
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, export_format, *args, **kwargs):
+        if export_format not in CONTENT_TYPES:
+            return Response(
+                {'error': f"Format d'export invalide ({', '.join(CONTENT_TYPES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return stream(self.get_queryset(), self.export_columns, export_format, self.export_name)
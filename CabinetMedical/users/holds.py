@@ -0,0 +1,100 @@
+"""
+Gardes de créneau: pendant qu'un utilisateur réserve, le créneau choisi lui
+est gardé ``HOLD_DURATION``. Les autres le voient occupé dans les
+disponibilités et ne peuvent pas le réserver; le service de réservation
+consomme la garde de son détenteur. Un utilisateur n'a qu'une garde active
+à la fois.
+
+Les gardes expirées sont ignorées partout et supprimées à chaque nouvelle garde.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .booking import CONFLICT_MESSAGE, HELD_MESSAGE, BookingError, _resolve
+from .models import Consultation, Doctor, SlotHold, WaitlistEntry, booking_atomic
+from .schedule import SLOT_DURATION, is_within_schedule
+
+HOLD_DURATION = timedelta(minutes=5)
+
+
+def create_hold(doctor, start_time, user, duration=HOLD_DURATION, exclusive=True):
+    """
+    Garde le créneau pour ``user`` pendant ``duration``. Une nouvelle demande
+    du même utilisateur sur le même créneau prolonge sa garde.
+
+    ``exclusive``: une seule garde active par utilisateur, la nouvelle remplace
+    les autres (hors créneaux proposés par la liste d'attente), pour qu'un
+    utilisateur ne puisse pas bloquer tout un planning.
+    """
+    doctor = _resolve(Doctor.objects.select_related('user'), doctor, 'Médecin non trouvé')
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time, timezone.get_current_timezone())
+    end_time = start_time + SLOT_DURATION
+    now = timezone.now()
+
+    if start_time < now:
+        raise BookingError('invalid', 'Le créneau doit être dans le futur')
+    if not doctor.user.is_approved:
+        raise BookingError('doctor_not_approved', 'Ce médecin n\'est pas encore approuvé')
+    if not is_within_schedule(start_time, end_time, doctor):
+        raise BookingError(
+            'outside_schedule',
+            f'Consultation hors des heures de travail du médecin. Horaires: {doctor.schedule}'
+        )
+
+    try:
+        with booking_atomic():
+            SlotHold.objects.filter(expires_at__lte=now).delete()
+
+            if Consultation.objects.filter(
+                doctor=doctor, start_time__lt=end_time, end_time__gt=start_time
+            ).exists():
+                raise BookingError('conflict', CONFLICT_MESSAGE)
+
+            holds = SlotHold.objects.filter(doctor=doctor, start_time__lt=end_time, end_time__gt=start_time)
+            if holds.exclude(user=user).exists():
+                raise BookingError('slot_held', HELD_MESSAGE, status=409)
+
+            if exclusive:
+                offered = WaitlistEntry.objects.filter(
+                    statut='PROPOSE', patient__user=user,
+                    doctor=OuterRef('doctor'), offered_start_time=OuterRef('start_time')
+                )
+                SlotHold.objects.filter(user=user).exclude(
+                    doctor=doctor, start_time=start_time
+                ).exclude(Exists(offered)).delete()
+
+            hold, _ = SlotHold.objects.update_or_create(
+                doctor=doctor, start_time=start_time, user=user,
+                defaults={'end_time': end_time, 'expires_at': now + duration}
+            )
+    except IntegrityError:
+        # Garde concurrente sur le même créneau (contrainte unique)
+        raise BookingError('slot_held', HELD_MESSAGE, status=409)
+    return hold
+
+
+def release_hold(hold_id, user):
+    """Libère une garde de ``user``; retourne False si elle n'existe pas."""
+    deleted, _ = SlotHold.objects.filter(id=hold_id, user=user).delete()
+    return bool(deleted)
+
+
+def held_intervals(doctor_ids, window_start, window_end, exclude_user=None):
+    """Gardes actives par médecin, hors celles de ``exclude_user``: {doctor_id: [(start, end), ...]}"""
+    holds = SlotHold.objects.filter(
+        doctor_id__in=doctor_ids,
+        start_time__lt=window_end,
+        end_time__gt=window_start,
+        expires_at__gt=timezone.now()
+    )
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    held = defaultdict(list)
+    for doctor_id, start, end in holds.order_by('start_time').values_list('doctor_id', 'start_time', 'end_time'):
+        held[doctor_id].append((start, end))
+    return held
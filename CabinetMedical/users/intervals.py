@@ -0,0 +1,154 @@
+"""
+Index en mémoire des créneaux réservés, par médecin.
+
+Pour chaque médecin, les consultations à venir sont gardées dans une liste
+triée de (début, fin, id): savoir si un créneau est libre revient à une
+recherche dichotomique, sans requête. L'index d'un médecin est chargé à la
+première utilisation, puis tenu à jour par les signaux de ``Consultation``
+(voir signals.py) et rechargé après ``INDEX_TTL`` secondes pour rattraper
+les réservations faites par d'autres processus.
+
+L'index ne sert qu'à éviter des requêtes: la base reste l'arbitre final
+(contrainte d'exclusion ou vérification dans ``Consultation.save``).
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.utils import timezone
+
+from .models import Consultation
+
+
+INDEX_TTL = 60
+
+
+class _DoctorIntervals:
+    __slots__ = ('intervals', 'since', 'loaded_at')
+
+    def __init__(self, since):
+        self.intervals = []
+        # Les consultations terminées avant ``since`` ne sont pas indexées
+        self.since = since
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        return time.monotonic() - self.loaded_at < INDEX_TTL
+
+
+_lock = threading.RLock()
+# doctor_id -> _DoctorIntervals
+_index = {}
+# consultation_id -> (doctor_id, start, end), pour retrouver l'entrée à retirer
+_entries = {}
+
+
+def warm(doctor_ids):
+    """Charge en une requête l'index des médecins absents ou expirés."""
+    with _lock:
+        missing = [
+            doctor_id for doctor_id in set(doctor_ids)
+            if doctor_id not in _index or not _index[doctor_id].is_fresh()
+        ]
+    if not missing:
+        return
+
+    since = timezone.now()
+    loaded = {doctor_id: _DoctorIntervals(since) for doctor_id in missing}
+    rows = Consultation.objects.filter(
+        doctor_id__in=missing,
+        end_time__gt=since
+    ).order_by('start_time').values_list('id', 'doctor_id', 'start_time', 'end_time')
+    for pk, doctor_id, start, end in rows:
+        loaded[doctor_id].intervals.append((start, end, pk))
+
+    with _lock:
+        for doctor_id, entry in loaded.items():
+            _forget_doctor(doctor_id)
+            _index[doctor_id] = entry
+            for start, end, pk in entry.intervals:
+                _entries[pk] = (doctor_id, start, end)
+
+
+def busy_intervals(doctor_ids, window_start, window_end):
+    """
+    Créneaux occupés à venir de chaque médecin qui chevauchent
+    [window_start, window_end): {doctor_id: [(start, end), ...]} trié par début.
+    """
+    warm(doctor_ids)
+    busy = {}
+    with _lock:
+        for doctor_id in doctor_ids:
+            intervals = _index[doctor_id].intervals
+            i = bisect_left(intervals, (window_start,))
+            if i > 0 and intervals[i - 1][1] > window_start:
+                i -= 1
+            j = bisect_left(intervals, (window_end,), lo=i)
+            busy[doctor_id] = [(start, end) for start, end, _ in intervals[i:j]]
+    return busy
+
+
+def is_slot_free(doctor_id, start_time, end_time, exclude=None):
+    """
+    Le créneau [start_time, end_time) est-il libre d'après l'index ?
+
+    Retourne None si l'index ne couvre pas ce créneau (passé). ``exclude``
+    est l'id d'une consultation à ignorer (celle qu'on déplace).
+    """
+    warm([doctor_id])
+    with _lock:
+        entry = _index[doctor_id]
+        if start_time < entry.since:
+            return None
+        intervals = entry.intervals
+        # Seuls les créneaux qui commencent avant la fin peuvent chevaucher
+        i = bisect_left(intervals, (end_time,))
+        while i > 0:
+            start, end, pk = intervals[i - 1]
+            if pk != exclude:
+                return end <= start_time
+            i -= 1
+        return True
+
+
+def record(pk, doctor_id, start_time, end_time):
+    """Met à jour l'index après l'enregistrement d'une consultation."""
+    with _lock:
+        discard(pk)
+        entry = _index.get(doctor_id)
+        # Médecin pas encore chargé: il le sera à la demande
+        if entry is not None and end_time > entry.since:
+            insort(entry.intervals, (start_time, end_time, pk))
+            _entries[pk] = (doctor_id, start_time, end_time)
+
+
+def discard(pk):
+    """Retire une consultation de l'index (supprimée ou déplacée)."""
+    with _lock:
+        location = _entries.pop(pk, None)
+        if location is None:
+            return
+        doctor_id, start, end = location
+        intervals = _index[doctor_id].intervals
+        i = bisect_left(intervals, (start, end, pk))
+        if i < len(intervals) and intervals[i][2] == pk:
+            del intervals[i]
+
+
+def invalidate(doctor_id):
+    """Oublie l'index d'un médecin (rechargé à la prochaine utilisation)."""
+    with _lock:
+        _forget_doctor(doctor_id)
+
+
+def reset():
+    with _lock:
+        _index.clear()
+        _entries.clear()
+
+
+def _forget_doctor(doctor_id):
+    entry = _index.pop(doctor_id, None)
+    if entry is not None:
+        for _, _, pk in entry.intervals:
+            _entries.pop(pk, None)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Consultation
+from users.motifs import BACKFILL_BATCH_SIZE, backfill
+
+
+class Command(BaseCommand):
+    help = 'Recalcule le code canonique du motif (motif_code) des consultations existantes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+            help=f'Nombre de consultations lues par lot (défaut: {BACKFILL_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size doit être au moins 1')
+        updated = backfill(Consultation.objects.all(), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'{updated} consultation(s) mise(s) à jour'))
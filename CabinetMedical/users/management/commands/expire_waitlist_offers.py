@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.waitlist import expire_offers
+
+
+class Command(BaseCommand):
+    help = (
+        "Remet en attente les propositions de liste d'attente restées sans réponse "
+        "à leur échéance et propose leurs créneaux aux patients suivants. "
+        "À lancer périodiquement (cron, toutes les 5 minutes par exemple)."
+    )
+
+    def handle(self, *args, **options):
+        count = expire_offers()
+        self.stdout.write(self.style.SUCCESS(f'{count} proposition(s) expirée(s)'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Consultation
+
+LABELS = {'doctor_id': 'médecin', 'patient_id': 'patient'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Liste les consultations d'un même médecin (ou avec --patient, d'un même "
+        "patient) qui se chevauchent. À résoudre (déplacer ou supprimer l'une des "
+        "deux) avant d'ajouter les contraintes d'exclusion des migrations 0005 et 0008."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patient', action='store_true',
+            help="Chevauchements d'un même patient, tous médecins confondus (migration 0008)"
+        )
+
+    def handle(self, *args, **options):
+        key, other = ('patient_id', 'doctor_id') if options['patient'] else ('doctor_id', 'patient_id')
+        found = 0
+        for first, second in overlapping_pairs(key):
+            found += 1
+            self.stdout.write(
+                f"{LABELS[key]} #{first[key]}: consultation #{first['id']} "
+                f"({first['start_time']:%Y-%m-%d %H:%M}, {LABELS[other]} #{first[other]}) "
+                f"chevauche #{second['id']} "
+                f"({second['start_time']:%Y-%m-%d %H:%M}, {LABELS[other]} #{second[other]})"
+            )
+        if found:
+            self.stdout.write(self.style.WARNING(f'{found} chevauchement(s) à résoudre'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Aucun chevauchement'))
+
+
+def overlapping_pairs(key):
+    """
+    Paires (consultation ouverte, consultation qui la chevauche) pour un même
+    ``key`` (doctor_id ou patient_id), en un seul parcours trié des consultations.
+    """
+    fields = ('id', 'doctor_id', 'patient_id', 'start_time', 'end_time')
+    current = None
+    rows = Consultation.objects.order_by(key, 'start_time', 'id').values(*fields).iterator(chunk_size=2000)
+    for row in rows:
+        if current is not None and current[key] == row[key] and row['start_time'] < current['end_time']:
+            yield current, row
+            if row['end_time'] <= current['end_time']:
+                continue
+        current = row
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import ConsultationTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les traces de consultations supprimées ou déplacées plus anciennes "
+        "que la rétention (ConsultationTombstone.RETENTION): plus aucun token de "
+        "synchronisation du calendrier ne les lit. À lancer périodiquement (cron, une fois par jour)."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = ConsultationTombstone.objects.filter(
+            deleted_at__lt=timezone.now() - ConsultationTombstone.RETENTION
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} trace(s) supprimée(s)'))
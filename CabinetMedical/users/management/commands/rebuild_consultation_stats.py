@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import rollup
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'agrégat journalier des consultations (ConsultationDailyStat)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-days', type=int, default=31,
+            help='Nombre de jours recalculés par transaction (défaut: 31)'
+        )
+
+    def handle(self, *args, **options):
+        chunk_days = options['chunk_days']
+        if chunk_days < 1:
+            raise CommandError('--chunk-days doit être au moins 1')
+        written = rollup.rebuild(chunk_days=chunk_days)
+        self.stdout.write(self.style.SUCCESS(f'{written} ligne(s) journalière(s) reconstruite(s)'))
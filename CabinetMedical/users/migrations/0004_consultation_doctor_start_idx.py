@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_dossiermedical_fichier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['doctor', 'start_time'], name='consultation_doctor_start_idx'),
+        ),
+    ]
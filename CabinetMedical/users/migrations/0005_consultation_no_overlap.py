@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-18 17:02
+
+from django.db import migrations
+
+
+# Paires de consultations d'un même médecin qui se chevauchent (SQL figé ici:
+# la migration ne dépend pas du code de l'application)
+OVERLAPS_SQL = (
+    'SELECT a.id, b.id, a.doctor_id, a.start_time FROM users_consultation a '
+    'JOIN users_consultation b ON b.doctor_id = a.doctor_id AND b.id > a.id '
+    'AND b.start_time < a.end_time AND a.start_time < b.end_time '
+    'ORDER BY a.start_time'
+)
+MAX_REPORTED = 20
+
+
+def check_no_overlaps(schema_editor):
+    """
+    Échoue avec la liste des doubles réservations existantes: la contrainte ne
+    peut pas être ajoutée tant qu'elles ne sont pas résolues (voir la commande
+    find_overlapping_consultations).
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS_SQL)
+        rows = cursor.fetchall()
+    if rows:
+        lines = [
+            f'  consultations #{first} et #{second} (médecin #{doctor_id}, {start:%Y-%m-%d %H:%M})'
+            for first, second, doctor_id, start in rows[:MAX_REPORTED]
+        ]
+        if len(rows) > MAX_REPORTED:
+            lines.append(f'  ... et {len(rows) - MAX_REPORTED} autre(s)')
+        raise RuntimeError(
+            f'{len(rows)} paire(s) de consultations se chevauchent pour un même médecin:\n'
+            + '\n'.join(lines)
+            + '\nDéplacer ou supprimer l\'une des consultations de chaque paire '
+            '(python manage.py find_overlapping_consultations les liste), puis relancer migrate.'
+        )
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Les contraintes d'exclusion n'existent que sous PostgreSQL; ailleurs
+    # (SQLite en test) Consultation.save() vérifie les chevauchements lui-même.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    check_no_overlaps(schema_editor)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE users_consultation ADD CONSTRAINT consultation_no_overlap '
+        'EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time) WITH &&)'
+    )
+
+
+def remove_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE users_consultation DROP CONSTRAINT IF EXISTS consultation_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_consultation_doctor_start_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_constraint, remove_overlap_constraint),
+    ]
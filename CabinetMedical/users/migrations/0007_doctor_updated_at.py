@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_consultation_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+# Paires de consultations d'un même patient qui se chevauchent (SQL figé, comme 0005)
+OVERLAPS_SQL = (
+    'SELECT a.id, b.id, a.patient_id, a.start_time FROM users_consultation a '
+    'JOIN users_consultation b ON b.patient_id = a.patient_id AND b.id > a.id '
+    'AND b.start_time < a.end_time AND a.start_time < b.end_time '
+    'ORDER BY a.start_time'
+)
+MAX_REPORTED = 20
+
+
+def check_no_patient_overlaps(schema_editor):
+    """Échoue avec la liste des patients réservés deux fois sur le même créneau"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS_SQL)
+        rows = cursor.fetchall()
+    if rows:
+        lines = [
+            f'  consultations #{first} et #{second} (patient #{patient_id}, {start:%Y-%m-%d %H:%M})'
+            for first, second, patient_id, start in rows[:MAX_REPORTED]
+        ]
+        if len(rows) > MAX_REPORTED:
+            lines.append(f'  ... et {len(rows) - MAX_REPORTED} autre(s)')
+        raise RuntimeError(
+            f'{len(rows)} paire(s) de consultations se chevauchent pour un même patient:\n'
+            + '\n'.join(lines)
+            + '\nDéplacer ou supprimer l\'une des consultations de chaque paire '
+            '(python manage.py find_overlapping_consultations --patient les liste), puis relancer migrate.'
+        )
+
+
+def add_patient_overlap_constraint(apps, schema_editor):
+    # Même principe que 0005: PostgreSQL uniquement, Consultation.save() vérifie ailleurs
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    check_no_patient_overlaps(schema_editor)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE users_consultation ADD CONSTRAINT consultation_patient_no_overlap '
+        'EXCLUDE USING gist (patient_id WITH =, tstzrange(start_time, end_time) WITH &&)'
+    )
+
+
+def remove_patient_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE users_consultation DROP CONSTRAINT IF EXISTS consultation_patient_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['patient', 'start_time'], name='consultation_patient_start_idx'),
+        ),
+        migrations.RunPython(add_patient_overlap_constraint, remove_patient_overlap_constraint),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_consultation_patient_no_overlap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('motif', models.TextField(blank=True)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('PROPOSE', 'Créneau proposé'), ('SATISFAIT', 'Satisfait')], default='EN_ATTENTE', max_length=20)),
+                ('offered_start_time', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='users.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='users.patient')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['doctor', 'statut', 'window_start'], name='waitlist_doctor_window_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_slothold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('specialty', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('unique_patients', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['start_time'], name='consultation_start_idx'),
+        ),
+        migrations.AddField(
+            model_name='consultationdailystat',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='users.doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='consultationdailystat',
+            index=models.Index(fields=['doctor', 'date'], name='consultation_stat_doctor_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='consultationdailystat',
+            constraint=models.UniqueConstraint(fields=('date', 'doctor'), name='consultation_daily_stat_unique_day'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-18 17:12
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Copie figée de users.motifs au moment de la migration: une migration ne doit
+# pas dépendre du code applicatif, qui évoluera. Les synonymes ajoutés plus tard
+# s'appliquent avec la commande backfill_motif_codes.
+SYNONYMS = {
+    'consultation de suivi': 'suivi',
+    'controle': 'suivi',
+    'visite de controle': 'suivi',
+    'premiere consultation': 'premiere-consultation',
+    'premiere visite': 'premiere-consultation',
+    'temperature': 'fievre',
+    'fievre': 'fievre',
+    'mal de tete': 'cephalees',
+    'maux de tete': 'cephalees',
+    'migraine': 'cephalees',
+    'kine': 'kinesitherapie',
+    'reeducation': 'kinesitherapie',
+    'renouvellement ordonnance': 'renouvellement-ordonnance',
+    'renouvellement d ordonnance': 'renouvellement-ordonnance',
+    'certificat medical': 'certificat',
+    'vaccin': 'vaccination',
+}
+
+
+def motif_code(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    normalized = ' '.join(re.findall(r'[a-z0-9]+', text))
+    return (SYNONYMS.get(normalized) or normalized.replace(' ', '-'))[:100]
+
+
+def backfill_motif_codes(apps, schema_editor):
+    # Par lots de BATCH_SIZE, parcours par id
+    Consultation = apps.get_model('users', 'Consultation')
+    last_id = 0
+    while True:
+        batch = list(Consultation.objects.filter(pk__gt=last_id).order_by('pk').only('pk', 'motif')[:BATCH_SIZE])
+        if not batch:
+            return
+        for consultation in batch:
+            consultation.motif_code = motif_code(consultation.motif)
+        Consultation.objects.bulk_update(batch, ['motif_code'])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_consultationdailystat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultation',
+            name='motif_code',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['doctor', 'motif_code'], name='consultation_doctor_motif_idx'),
+        ),
+        migrations.RunPython(backfill_motif_codes, migrations.RunPython.noop),
+    ]
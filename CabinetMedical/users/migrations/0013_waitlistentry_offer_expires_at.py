@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_consultation_motif_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='offer_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['statut', 'offer_expires_at'], name='waitlist_offer_expiry_idx'),
+        ),
+    ]
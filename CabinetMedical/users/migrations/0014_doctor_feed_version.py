@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_waitlistentry_offer_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='feed_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_doctor_feed_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultationtombstone',
+            name='start_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='consultationtombstone',
+            index=models.Index(fields=['doctor_id', 'deleted_at'], name='tombstone_doctor_deleted_idx'),
+        ),
+    ]
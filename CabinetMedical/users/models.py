@@ -1,7 +1,39 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
 from datetime import timedelta
 from django.core.exceptions import ValidationError
+from contextlib import contextmanager
+import threading
+
+from .motifs import MAX_CODE_LENGTH, motif_code
+
+# Contraintes d'exclusion PostgreSQL (voir migrations 0005 et 0008): pas deux
+# consultations qui se chevauchent pour le même docteur, ni pour le même patient
+CONSULTATION_OVERLAP_CONSTRAINT = 'consultation_no_overlap'
+CONSULTATION_PATIENT_OVERLAP_CONSTRAINT = 'consultation_patient_no_overlap'
+
+CONSULTATION_DURATION = timedelta(minutes=30)
+
+# Sérialise vérification + insertion quand la base n'a pas la contrainte (SQLite en test)
+_overlap_lock = threading.RLock()
+
+
+def has_overlap_constraint():
+    return connection.vendor == 'postgresql'
+
+
+@contextmanager
+def booking_atomic():
+    """
+    Transaction d'une réservation. Sans contrainte d'exclusion, les réservations
+    sont sérialisées par un verrou tenu jusqu'à la fin de la transaction la plus externe.
+    """
+    if has_overlap_constraint():
+        with transaction.atomic():
+            yield
+    else:
+        with _overlap_lock, transaction.atomic():
+            yield
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -47,11 +79,27 @@ class Doctor(models.Model):
     phone = models.CharField(max_length=20)
     schedule = models.CharField(max_length=50)
     image = models.ImageField(upload_to='doctor_images/', null=True, blank=True)
+    # ETag / Last-Modified des données de référence du calendrier
+    updated_at = models.DateTimeField(auto_now=True)
+    # Signée dans le lien d'abonnement .ics: l'incrémenter révoque les liens existants
+    feed_version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return f"Dr. {self.nom} {self.prenom}" if self.nom else self.user.username
 
 
+class ConsultationConflict(ValidationError):
+    """Le docteur a déjà une consultation sur ce créneau"""
+    def __init__(self, message="Ce docteur a déjà une consultation à cette heure"):
+        super().__init__(message)
+
+
+class PatientConsultationConflict(ConsultationConflict):
+    """Le patient a déjà une consultation (avec n'importe quel docteur) sur ce créneau"""
+    def __init__(self, message="Ce patient a déjà une consultation à cette heure"):
+        super().__init__(message)
+
+
 class Consultation(models.Model):
     doctor = models.ForeignKey(
         Doctor,
@@ -66,27 +114,158 @@ class Consultation(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(blank=True)
     motif = models.TextField(blank=True)
+    # Code canonique du motif (voir motifs.py), pour les statistiques et les filtres
+    motif_code = models.CharField(max_length=MAX_CODE_LENGTH, blank=True, db_index=True, editable=False)
+    # Pour la synchronisation incrémentale du calendrier (paramètre since)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'start_time'], name='consultation_doctor_start_idx'),
+            models.Index(fields=['patient', 'start_time'], name='consultation_patient_start_idx'),
+            # Consultations restantes du jour (statistiques, voir stats.consultation_counts)
+            models.Index(fields=['start_time'], name='consultation_start_idx'),
+            models.Index(fields=['doctor', 'motif_code'], name='consultation_doctor_motif_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # durée fixe 30 min
-        self.end_time = self.start_time + timedelta(minutes=30)
+        self.end_time = self.start_time + CONSULTATION_DURATION
+        self.motif_code = motif_code(self.motif)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'motif' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'motif_code'}
 
-        conflict = Consultation.objects.filter(
-            doctor=self.doctor,
-            start_time__lt=self.end_time,
-            end_time__gt=self.start_time
-        )
+        try:
+            with booking_atomic():
+                # Avec PostgreSQL les contraintes d'exclusion font foi, sans requête préalable
+                if not has_overlap_constraint():
+                    # Une seule requête pour le docteur et le patient. Durée fixe: un chevauchement
+                    # commence dans ]start - durée, end[, plage bornée des deux côtés sur les index
+                    # doctor/start_time et patient/start_time
+                    window = models.Q(
+                        start_time__gt=self.start_time - CONSULTATION_DURATION,
+                        start_time__lt=self.end_time
+                    )
+                    conflict = Consultation.objects.filter(
+                        (models.Q(doctor_id=self.doctor_id) & window) | (models.Q(patient_id=self.patient_id) & window),
+                        end_time__gt=self.start_time
+                    )
+                    if self.pk:
+                        conflict = conflict.exclude(pk=self.pk)
+                    # Au plus quelques lignes: les consultations d'un docteur (ou d'un patient) sont disjointes
+                    conflicting_doctors = set(conflict.values_list('doctor_id', flat=True))
+                    if self.doctor_id in conflicting_doctors:
+                        raise ConsultationConflict()
+                    if conflicting_doctors:
+                        raise PatientConsultationConflict()
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if CONSULTATION_PATIENT_OVERLAP_CONSTRAINT in str(e):
+                raise PatientConsultationConflict()
+            if CONSULTATION_OVERLAP_CONSTRAINT in str(e):
+                raise ConsultationConflict()
+            raise
 
-        if self.pk:
-            conflict = conflict.exclude(pk=self.pk)
+    def __str__(self):
+        return f"{self.doctor.user.username} - {self.patient.user.username}"
 
-        if conflict.exists():
-            raise ValidationError("Ce docteur a déjà une consultation à cette heure")
 
-        super().save(*args, **kwargs)
+class WaitlistEntry(models.Model):
+    """Patient en liste d'attente chez un docteur pour une fenêtre de dates acceptable"""
+    STATUT_CHOICES = (
+        ('EN_ATTENTE', 'En attente'),
+        ('PROPOSE', 'Créneau proposé'),
+        ('SATISFAIT', 'Satisfait'),
+    )
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='waitlist')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    motif = models.TextField(blank=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    # Créneau libéré proposé au patient (statut PROPOSE)
+    offered_start_time = models.DateTimeField(null=True, blank=True)
+    # Échéance de la proposition: sans réponse, le créneau passe au suivant
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Recherche des demandes dont la fenêtre contient un créneau libéré
+            models.Index(fields=['doctor', 'statut', 'window_start'], name='waitlist_doctor_window_idx'),
+            # Propositions échues (expire_offers)
+            models.Index(fields=['statut', 'offer_expires_at'], name='waitlist_offer_expiry_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.doctor.user.username} - {self.patient.user.username}"
+        return f"Attente {self.patient} - {self.doctor} ({self.statut})"
+
+
+class SlotHold(models.Model):
+    """Créneau gardé quelques minutes pour un utilisateur pendant qu'il réserve"""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_holds')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='slot_holds')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            # Deux demandes simultanées pour le même créneau: une seule obtient la garde
+            models.UniqueConstraint(fields=['doctor', 'start_time'], name='slot_hold_unique_slot'),
+        ]
+
+    def __str__(self):
+        return f"Garde {self.doctor} {self.start_time} ({self.user})"
+
+
+class ConsultationTombstone(models.Model):
+    """
+    Trace d'une consultation supprimée, ou déplacée (ancien médecin et ancien
+    créneau), pour la synchronisation du calendrier
+    """
+    consultation_id = models.IntegerField()
+    doctor_id = models.IntegerField()
+    # Créneau quitté; null pour les traces antérieures à ce champ
+    start_time = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    # Au-delà, un client qui synchronise recharge tout le calendrier
+    # (traces purgées par la commande purge_consultation_tombstones)
+    RETENTION = timedelta(days=30)
+
+    class Meta:
+        indexes = [
+            # Synchronisation du calendrier d'un médecin
+            models.Index(fields=['doctor_id', 'deleted_at'], name='tombstone_doctor_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Consultation {self.consultation_id} supprimée le {self.deleted_at}"
+
+
+class ConsultationDailyStat(models.Model):
+    """Nombre de consultations et de patients distincts par jour et par médecin (voir rollup.py)"""
+    date = models.DateField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_stats')
+    # Copie de doctor.specialty, pour regrouper sans jointure
+    specialty = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+    unique_patients = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'doctor'], name='consultation_daily_stat_unique_day'),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'date'], name='consultation_stat_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} {self.date}: {self.count}"
 
 
 class DossierMedical(models.Model):
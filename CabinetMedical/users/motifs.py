@@ -0,0 +1,91 @@
+"""
+Normalisation des motifs de consultation.
+
+Le motif reste du texte libre; ``motif_code`` en dérive un code canonique
+indexé (``Consultation.motif_code``) sur lequel portent les statistiques et
+les filtres: minuscules, sans accents ni ponctuation, mots séparés par des
+tirets, puis synonymes ramenés à un même code ("Fièvre", "fievre " et
+"fièvre." donnent tous ``fievre``).
+
+Après une modification de ``SYNONYMS``, recalculer les codes existants avec
+``python manage.py backfill_motif_codes``.
+"""
+import re
+import unicodedata
+
+MAX_CODE_LENGTH = 100
+BACKFILL_BATCH_SIZE = 1000
+
+# Motif normalisé -> code canonique
+SYNONYMS = {
+    'consultation de suivi': 'suivi',
+    'controle': 'suivi',
+    'visite de controle': 'suivi',
+    'premiere consultation': 'premiere-consultation',
+    'premiere visite': 'premiere-consultation',
+    'temperature': 'fievre',
+    'fievre': 'fievre',
+    'mal de tete': 'cephalees',
+    'maux de tete': 'cephalees',
+    'migraine': 'cephalees',
+    'kine': 'kinesitherapie',
+    'reeducation': 'kinesitherapie',
+    'renouvellement ordonnance': 'renouvellement-ordonnance',
+    'renouvellement d ordonnance': 'renouvellement-ordonnance',
+    'certificat medical': 'certificat',
+    'vaccin': 'vaccination',
+}
+
+# Libellés des codes canoniques (les autres codes sont affichés tels quels)
+LABELS = {
+    'suivi': 'Consultation de suivi',
+    'premiere-consultation': 'Première consultation',
+    'fievre': 'Fièvre',
+    'cephalees': 'Céphalées',
+    'kinesitherapie': 'Kinésithérapie',
+    'renouvellement-ordonnance': "Renouvellement d'ordonnance",
+    'certificat': 'Certificat médical',
+    'vaccination': 'Vaccination',
+}
+
+
+def normalize_motif(text):
+    """Minuscules, sans accents, ponctuation remplacée par des espaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def motif_code(text):
+    """Code canonique d'un motif ('' pour un motif vide)"""
+    normalized = normalize_motif(text)
+    code = SYNONYMS.get(normalized) or normalized.replace(' ', '-')
+    return code[:MAX_CODE_LENGTH]
+
+
+def motif_label(code):
+    return LABELS.get(code) or code.replace('-', ' ').capitalize()
+
+
+def backfill(queryset, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recalcule ``motif_code`` des consultations de ``queryset`` par lots de
+    ``batch_size`` (parcours par id). Retourne le nombre de lignes modifiées.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_id).order_by('pk').only('pk', 'motif', 'motif_code')[:batch_size])
+        if not batch:
+            return updated
+        changed = []
+        for consultation in batch:
+            code = motif_code(consultation.motif)
+            if consultation.motif_code != code:
+                consultation.motif_code = code
+                changed.append(consultation)
+        if changed:
+            # bulk_update: ni save() ni signaux, updated_at inchangé
+            queryset.model.objects.bulk_update(changed, ['motif_code'])
+            updated += len(changed)
+        last_id = batch[-1].pk
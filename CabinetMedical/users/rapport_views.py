@@ -1,24 +1,33 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, ExtractWeekDay
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import Patient, Doctor, Consultation
+from . import report_stats, reports, stats
+from .models import Patient, Doctor, Consultation, ConsultationDailyStat
+from .motifs import motif_label
 from .permissions import IsAdminRole
-import io
 from django.http import FileResponse
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.lib.units import cm
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False
+from django.utils.dateparse import parse_date
+
+
+def parse_period(request):
+    """(début, fin) depuis date_debut / date_fin (YYYY-MM-DD, facultatifs); ValueError si invalide"""
+    params = request.data if request.method == 'POST' else request.query_params
+    period = []
+    for name in ('date_debut', 'date_fin'):
+        value = params.get(name) or None
+        if value is not None:
+            value = parse_date(value)
+            if value is None:
+                raise ValueError(f'{name} invalide (format YYYY-MM-DD)')
+        period.append(value)
+    if period[0] and period[1] and period[0] > period[1]:
+        raise ValueError('date_debut doit précéder date_fin')
+    return tuple(period)
 
 
 class RapportCliniqueView(APIView):
@@ -26,179 +35,92 @@ class RapportCliniqueView(APIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
 
     def get(self, request):
-        # Statistiques de base
-        total_patients = Patient.objects.count()
-        total_doctors = Doctor.objects.count()
-        total_consultations = Consultation.objects.count()
-        
-        # Patients actifs vs inactifs
-        patients_actifs = Patient.objects.filter(status='Actif').count()
-        patients_inactifs = Patient.objects.filter(status='Inactif').count()
-        
-        # Spécialités les plus sollicitées
-        specialites = Doctor.objects.values('specialty').annotate(
-            count=Count('specialty'),
-            nb_consultations=Count('consultations')
-        ).order_by('-nb_consultations')
-        
-        # Consultations par médecin
-        consultations_par_medecin = Doctor.objects.annotate(
-            nb_consultations=Count('consultations')
-        ).values('id', 'nom', 'prenom', 'specialty', 'nb_consultations').order_by('-nb_consultations')[:10]
-        
-        # Consultations récentes (7 derniers jours)
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        consultations_recentes = Consultation.objects.filter(
-            start_time__gte=seven_days_ago
-        ).count()
-        
-        # Consultations à venir
-        consultations_a_venir = Consultation.objects.filter(
-            start_time__gt=timezone.now()
-        ).count()
-        
-        return Response({
-            'resume': {
-                'total_patients': total_patients,
-                'patients_actifs': patients_actifs,
-                'patients_inactifs': patients_inactifs,
-                'total_medecins': total_doctors,
-                'total_consultations': total_consultations,
-                'consultations_7_jours': consultations_recentes,
-                'consultations_a_venir': consultations_a_venir
-            },
-            'specialites_sollicitees': list(specialites),
-            'top_medecins': list(consultations_par_medecin)
-        })
+        try:
+            start, end = parse_period(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(report_stats.get_snapshot(start, end).as_dict())
 
 
 class RapportCliniquePDFView(APIView):
-    """Génère le rapport clinique au format PDF (téléchargement)."""
+    """
+    Rapport clinique au format PDF, rendu en tâche de fond (voir users/reports.py)
+
+    GET: le PDF s'il est à jour, sinon lance le rendu et répond 202 avec la tâche
+    POST: lance le rendu si besoin et répond avec la tâche (200 si déjà prêt)
+    Paramètres: date_debut, date_fin (YYYY-MM-DD, facultatifs)
+    """
     permission_classes = [IsAuthenticated, IsAdminRole]
 
     def get(self, request):
-        # Reutiliser la logique de RapportCliniqueView
-        total_patients = Patient.objects.count()
-        total_doctors = Doctor.objects.count()
-        total_consultations = Consultation.objects.count()
+        return self.handle(request, download=True)
 
-        patients_actifs = Patient.objects.filter(status='Actif').count()
-        patients_inactifs = Patient.objects.filter(status='Inactif').count()
+    def post(self, request):
+        return self.handle(request, download=False)
 
-        specialites = Doctor.objects.values('specialty').annotate(
-            count=Count('specialty'),
-            nb_consultations=Count('consultations')
-        ).order_by('-nb_consultations')
-
-        consultations_par_medecin = Doctor.objects.annotate(
-            nb_consultations=Count('consultations')
-        ).values('id', 'nom', 'prenom', 'specialty', 'nb_consultations').order_by('-nb_consultations')[:10]
-
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        consultations_recentes = Consultation.objects.filter(start_time__gte=seven_days_ago).count()
-        consultations_a_venir = Consultation.objects.filter(start_time__gt=timezone.now()).count()
-
-        if not REPORTLAB_AVAILABLE:
+    def handle(self, request, download):
+        if not reports.REPORTLAB_AVAILABLE:
             return Response({
                 'error': 'reportlab non installé. Installer avec `pip install reportlab` pour activer l\'export PDF.'
             }, status=500)
+        try:
+            start, end = parse_period(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
 
-        # Générer PDF en mémoire avec Platypus pour un rendu plus élégant
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('title', parent=styles['Title'], alignment=1, fontSize=18, spaceAfter=12)
-        h2_style = ParagraphStyle('h2', parent=styles['Heading2'], spaceAfter=8)
-        normal = styles['Normal']
-
-        elems = []
-        elems.append(Paragraph('Rapport clinique', title_style))
-        elems.append(Paragraph(f'Date: {timezone.now().strftime("%Y-%m-%d %H:%M")}', normal))
-        elems.append(Spacer(1, 12))
-
-        # Résumé chiffré
-        summary_data = [
-            ['Total patients', str(total_patients)],
-            ['Patients actifs', str(patients_actifs)],
-            ['Patients inactifs', str(patients_inactifs)],
-            ['Total médecins', str(total_doctors)],
-            ['Total consultations', str(total_consultations)],
-            ['Consultations (7 derniers jours)', str(consultations_recentes)],
-            ['Consultations à venir', str(consultations_a_venir)],
-        ]
-        t = Table(summary_data, colWidths=[8*cm, 6*cm])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-            ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
-            ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ]))
-        elems.append(t)
-        elems.append(Spacer(1, 12))
+        job = reports.submit(report_stats.get_snapshot(start, end))
+        if job.statut == 'pret' and download:
+            return FileResponse(
+                open(reports.artifact_path(job.id), 'rb'), as_attachment=True, filename='rapport_clinique.pdf'
+            )
+        return Response(job.as_dict(), status=200 if job.statut == 'pret' else 202)
 
-        # Spécialités sollicitées
-        elems.append(Paragraph('Spécialités sollicitées', h2_style))
-        spec_data = [['Spécialité', 'Nombre consultations']]
-        for spec in list(specialites)[:20]:
-            spec_name = spec.get('specialty') or 'N/A'
-            spec_data.append([spec_name, str(spec.get('nb_consultations', 0))])
-        spec_table = Table(spec_data, colWidths=[10*cm, 4*cm])
-        spec_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#4b79a1')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (1,1), (-1,-1), 'CENTER'),
-            ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
-            ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
-        ]))
-        elems.append(spec_table)
-        elems.append(Spacer(1, 12))
 
-        # Top médecins
-        elems.append(Paragraph('Top médecins (par nombre de consultations)', h2_style))
-        doc_data = [['Médecin', 'Spécialité', 'Nb consultations']]
-        for d in list(consultations_par_medecin):
-            name = f"{d.get('nom') or ''} {d.get('prenom') or ''}".strip()
-            doc_data.append([name, d.get('specialty') or 'N/A', str(d.get('nb_consultations', 0))])
-        doc_table = Table(doc_data, colWidths=[8*cm, 4*cm, 2*cm])
-        doc_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#4b79a1')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (2,1), (-1,-1), 'CENTER'),
-            ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
-            ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
-        ]))
-        elems.append(doc_table)
-
-        # Footer
-        elems.append(Spacer(1, 24))
-        elems.append(Paragraph('Generated by Clinic Management System', ParagraphStyle('footer', parent=normal, fontSize=8, alignment=1, textColor=colors.grey)))
+class RapportJobView(APIView):
+    """État d'une tâche de rendu du rapport PDF"""
+    permission_classes = [IsAuthenticated, IsAdminRole]
 
-        doc.build(elems)
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename='rapport_clinique.pdf')
+    def get(self, request, job_id):
+        job = reports.get_job(job_id)
+        if job is None:
+            return Response({'error': 'Tâche de rapport non trouvée'}, status=404)
+        return Response(job.as_dict())
 
 
 class StatistiquesConsultationsView(APIView):
-    """Statistiques détaillées sur les consultations"""
+    """
+    Statistiques détaillées sur les consultations
+
+    Paramètres: date_debut, date_fin (YYYY-MM-DD)
+    granularity=hour|day|week|month ajoute la série temporelle (périodes vides à 0), avec
+    breakdown=doctor|specialty pour une série par médecin ou spécialité, et les filtres
+    doctor_id, specialty. Sans dates, la série couvre: le jour (hour), 30 jours (day),
+    12 semaines (week) ou 12 mois (month) jusqu'à aujourd'hui.
+    """
     permission_classes = [IsAuthenticated, IsAdminRole]
+    DEFAULT_SPANS = {'hour': 0, 'day': 29, 'week': 7 * 11, 'month': 334}
 
     def get(self, request):
         # Filtres optionnels
-        date_debut = request.query_params.get('date_debut')
-        date_fin = request.query_params.get('date_fin')
+        try:
+            date_debut, date_fin = parse_period(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
         
         qs = Consultation.objects.all()
+        daily = ConsultationDailyStat.objects.all()
         
         if date_debut:
             qs = qs.filter(start_time__date__gte=date_debut)
+            daily = daily.filter(date__gte=date_debut)
         if date_fin:
             qs = qs.filter(start_time__date__lte=date_fin)
+            daily = daily.filter(date__lte=date_fin)
         
-        # Consultations par jour de la semaine
-        from django.db.models.functions import ExtractWeekDay
-        consultations_par_jour = qs.annotate(
-            jour_semaine=ExtractWeekDay('start_time')
-        ).values('jour_semaine').annotate(count=Count('id')).order_by('jour_semaine')
+        # Consultations par jour de la semaine (agrégat journalier)
+        consultations_par_jour = daily.annotate(
+            jour_semaine=ExtractWeekDay('date')
+        ).values('jour_semaine').annotate(count=Sum('count')).order_by('jour_semaine')
         
         # Mapping des jours
         jours = {1: 'Dimanche', 2: 'Lundi', 3: 'Mardi', 4: 'Mercredi', 5: 'Jeudi', 6: 'Vendredi', 7: 'Samedi'}
@@ -207,16 +129,48 @@ class StatistiquesConsultationsView(APIView):
             for item in consultations_par_jour
         ]
         
-        # Motifs les plus fréquents
-        motifs = qs.exclude(motif='').values('motif').annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
+        # Motifs les plus fréquents, regroupés par code canonique (colonne indexée)
+        motifs = [
+            {'motif': motif_label(row['motif_code']), 'motif_code': row['motif_code'], 'count': row['count']}
+            for row in qs.exclude(motif_code='').values('motif_code').annotate(
+                count=Count('id')
+            ).order_by('-count')[:10]
+        ]
         
-        return Response({
-            'total_consultations': qs.count(),
+        data = {
+            'total_consultations': daily.aggregate(total=Coalesce(Sum('count'), 0))['total'],
             'consultations_par_jour': consultations_formatted,
-            'motifs_frequents': list(motifs)
-        })
+            'motifs_frequents': motifs
+        }
+
+        granularity = request.query_params.get('granularity')
+        if granularity:
+            try:
+                data['evolution'] = self.get_series(request, granularity, date_debut, date_fin)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+        return Response(data)
+
+    def get_series(self, request, granularity, start, end):
+        if granularity not in stats.GRANULARITIES:
+            raise ValueError(f"granularity invalide ({', '.join(stats.GRANULARITIES)})")
+        breakdown = request.query_params.get('breakdown') or None
+        if breakdown is not None and breakdown not in stats.BREAKDOWNS:
+            raise ValueError(f"breakdown invalide ({', '.join(stats.BREAKDOWNS)})")
+        doctor_id = request.query_params.get('doctor_id')
+        if doctor_id is not None:
+            try:
+                doctor_id = int(doctor_id)
+            except ValueError:
+                raise ValueError('doctor_id invalide')
+
+        end = end or timezone.localdate()
+        start = start or end - timedelta(days=self.DEFAULT_SPANS[granularity])
+        series = stats.consultation_series(
+            granularity, start, end, breakdown=breakdown, doctor_id=doctor_id,
+            specialty=request.query_params.get('specialty')
+        )
+        return {'granularity': granularity, 'breakdown': breakdown, 'debut': start, 'fin': end, **series}
 
 
 class RechercheAvanceeView(APIView):
@@ -0,0 +1,162 @@
+"""
+Chiffres du rapport clinique pour une période, sous forme d'instantané typé
+(``ReportSnapshot``) partagé par le JSON, le PDF et les futurs exports.
+
+Les instantanés sont mémorisés par (période, version des données): la version
+est celle des portées ``all`` et ``admin`` du cache des dashboards, changée
+par les signaux à chaque écriture concernée. Au plus ``MAX_SNAPSHOTS`` sont
+gardés (le moins récemment utilisé est oublié), chacun pendant
+``SNAPSHOT_TTL`` secondes au plus, les compteurs "7 derniers jours" et
+"à venir" dépendant aussi de l'heure.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from . import dashboard_cache, stats
+from .models import Doctor
+
+MAX_SNAPSHOTS = 32
+SNAPSHOT_TTL = 60
+TOP_DOCTORS = 10
+
+
+@dataclass(frozen=True)
+class SpecialtyStat:
+    specialty: str
+    doctors: int
+    consultations: int
+
+
+@dataclass(frozen=True)
+class DoctorStat:
+    id: int
+    nom: str
+    prenom: str
+    specialty: str
+    consultations: int
+
+
+@dataclass(frozen=True)
+class ReportSnapshot:
+    start: date | None
+    end: date | None
+    total_patients: int
+    patients_actifs: int
+    patients_inactifs: int
+    total_medecins: int
+    total_consultations: int
+    consultations_7_jours: int
+    consultations_a_venir: int
+    specialites: tuple[SpecialtyStat, ...]
+    top_medecins: tuple[DoctorStat, ...]
+
+    @property
+    def periode(self):
+        return {
+            'debut': self.start.isoformat() if self.start else None,
+            'fin': self.end.isoformat() if self.end else None,
+        }
+
+    def as_dict(self):
+        """Forme JSON du rapport clinique"""
+        return {
+            'periode': self.periode,
+            'resume': {
+                'total_patients': self.total_patients,
+                'patients_actifs': self.patients_actifs,
+                'patients_inactifs': self.patients_inactifs,
+                'total_medecins': self.total_medecins,
+                'total_consultations': self.total_consultations,
+                'consultations_7_jours': self.consultations_7_jours,
+                'consultations_a_venir': self.consultations_a_venir,
+            },
+            'specialites_sollicitees': [
+                {'specialty': s.specialty, 'count': s.doctors, 'nb_consultations': s.consultations}
+                for s in self.specialites
+            ],
+            'top_medecins': [
+                {'id': d.id, 'nom': d.nom, 'prenom': d.prenom, 'specialty': d.specialty,
+                 'nb_consultations': d.consultations}
+                for d in self.top_medecins
+            ],
+        }
+
+    def fingerprint(self):
+        """Empreinte des chiffres: change dès qu'une donnée affichée change"""
+        payload = json.dumps(self.as_dict(), sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+_lock = threading.Lock()
+# (start, end, version) -> (instant du calcul, ReportSnapshot), du moins au plus récemment utilisé
+_snapshots = OrderedDict()
+
+
+def get_snapshot(start=None, end=None):
+    """Instantané pour [start, end] (bornes facultatives), recalculé si les données ont changé"""
+    key = (start, end, dashboard_cache.version(dashboard_cache.ALL, dashboard_cache.ADMIN))
+    with _lock:
+        entry = _snapshots.get(key)
+        if entry is not None and time.monotonic() - entry[0] < SNAPSHOT_TTL:
+            _snapshots.move_to_end(key)
+            return entry[1]
+
+    snapshot = compute_snapshot(start, end)
+    with _lock:
+        _snapshots[key] = (time.monotonic(), snapshot)
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def compute_snapshot(start=None, end=None):
+    """
+    Calcule l'instantané; les consultations viennent de l'agrégat journalier.
+    La période limite le total, les spécialités et le classement des médecins.
+    """
+    patients = stats.patient_counts()
+    doctors = stats.doctor_counts()
+    counts = stats.consultation_counts()
+
+    specialites = tuple(
+        SpecialtyStat(row['specialty'], row['doctors'], row['consultations'])
+        for row in stats.specialty_counts(start, end)
+    )
+    top_medecins = tuple(
+        DoctorStat(*row)
+        for row in Doctor.objects.annotate(
+            nb_consultations=Coalesce(
+                Sum('daily_stats__count', filter=stats.period_filter('daily_stats__date', start, end)), 0
+            )
+        ).values_list('id', 'nom', 'prenom', 'specialty', 'nb_consultations').order_by('-nb_consultations')[:TOP_DOCTORS]
+    )
+
+    return ReportSnapshot(
+        start=start,
+        end=end,
+        total_patients=patients['total'],
+        patients_actifs=patients['actifs'],
+        patients_inactifs=patients['inactifs'],
+        total_medecins=doctors['total'],
+        total_consultations=(
+            sum(s.consultations for s in specialites) if start or end else counts['total']
+        ),
+        consultations_7_jours=counts['last_7_days'],
+        consultations_a_venir=counts['upcoming'],
+        specialites=specialites,
+        top_medecins=top_medecins,
+    )
+
+
+def clear():
+    with _lock:
+        _snapshots.clear()
@@ -0,0 +1,222 @@
+"""
+Génération asynchrone du rapport clinique PDF.
+
+Une demande de rapport pour une période devient une tâche exécutée par un
+pool de threads (``REPORT_WORKERS``, 2 par défaut). Le PDF est écrit sous
+``MEDIA_ROOT/rapports/``, nommé d'après la période et la version des données
+(empreinte des chiffres de l'instantané, voir report_stats.py): tant que rien ne change, le fichier
+existant est resservi sans nouveau rendu. Une nouvelle version remplace les
+anciennes de la même période.
+
+Les tâches en cours sont connues du processus qui les a lancées; un fichier
+terminé est visible de tous les processus.
+"""
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import cm
+    REPORTLAB_AVAILABLE = True
+except Exception:
+    REPORTLAB_AVAILABLE = False
+
+REPORTS_DIR = 'rapports'
+JOB_ID_RE = re.compile(r'^clinique_[0-9a-z-]+_[0-9a-z-]+_[0-9a-f]{16}$')
+
+_lock = threading.Lock()
+_executor = None
+# job_id -> ReportJob
+_jobs = {}
+
+
+class ReportJob:
+    __slots__ = ('id', 'periode', 'statut', 'error', 'created_at', 'finished_at')
+
+    def __init__(self, job_id, periode, statut='en_attente'):
+        self.id = job_id
+        self.periode = periode
+        self.statut = statut
+        self.error = None
+        self.created_at = timezone.now()
+        self.finished_at = None
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'statut': self.statut,
+            'periode': self.periode,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+def _period_prefix(periode):
+    return f"clinique_{periode['debut'] or 'debut'}_{periode['fin'] or 'fin'}_"
+
+
+def job_id_for(snapshot):
+    return _period_prefix(snapshot.periode) + snapshot.fingerprint()
+
+
+def artifact_path(job_id):
+    if not JOB_ID_RE.match(job_id):
+        raise ValueError(f'Identifiant de rapport invalide: {job_id}')
+    return os.path.join(settings.MEDIA_ROOT, REPORTS_DIR, f'{job_id}.pdf')
+
+
+def get_job(job_id):
+    """Tâche ``job_id``: celle du processus, ou une tâche terminée si le fichier existe"""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None and JOB_ID_RE.match(job_id) and os.path.exists(artifact_path(job_id)):
+        job = ReportJob(job_id, None, statut='pret')
+    return job
+
+
+def submit(snapshot):
+    """
+    Lance le rendu de l'instantané s'il n'existe pas déjà pour cette version
+    des données; retourne la tâche (statut ``pret`` si le PDF est déjà là).
+    """
+    job_id = job_id_for(snapshot)
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.statut != 'erreur':
+            return job
+        if os.path.exists(artifact_path(job_id)):
+            return ReportJob(job_id, snapshot.periode, statut='pret')
+        job = _jobs[job_id] = ReportJob(job_id, snapshot.periode)
+        _get_executor().submit(_run, job, snapshot)
+    return job
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'REPORT_WORKERS', 2), thread_name_prefix='rapport'
+        )
+    return _executor
+
+
+def _run(job, snapshot):
+    job.statut = 'en_cours'
+    path = artifact_path(job.id)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        render_clinique_pdf(snapshot, tmp_path)
+        # Le fichier n'apparaît que complet
+        os.replace(tmp_path, path)
+        _remove_older_versions(job)
+        job.statut = 'pret'
+    except Exception as e:
+        job.statut = 'erreur'
+        job.error = str(e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finally:
+        job.finished_at = timezone.now()
+        with _lock:
+            # Terminé: le fichier fait foi; une erreur reste visible jusqu'à la prochaine demande
+            if job.statut == 'pret':
+                _jobs.pop(job.id, None)
+
+
+def _remove_older_versions(job):
+    directory = os.path.join(settings.MEDIA_ROOT, REPORTS_DIR)
+    prefix = _period_prefix(job.periode)
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.pdf') and name != f'{job.id}.pdf':
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def render_clinique_pdf(snapshot, path):
+    """Écrit l'instantané du rapport clinique en PDF dans ``path``"""
+    periode = snapshot.periode
+
+    # Platypus pour un rendu plus élégant
+    doc = SimpleDocTemplate(path, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('title', parent=styles['Title'], alignment=1, fontSize=18, spaceAfter=12)
+    h2_style = ParagraphStyle('h2', parent=styles['Heading2'], spaceAfter=8)
+    normal = styles['Normal']
+
+    elems = []
+    elems.append(Paragraph('Rapport clinique', title_style))
+    elems.append(Paragraph(f'Date: {timezone.now().strftime("%Y-%m-%d %H:%M")}', normal))
+    if periode['debut'] or periode['fin']:
+        elems.append(Paragraph(f"Période: {periode['debut'] or '...'} - {periode['fin'] or '...'}", normal))
+    elems.append(Spacer(1, 12))
+
+    # Résumé chiffré
+    summary_data = [
+        ['Total patients', str(snapshot.total_patients)],
+        ['Patients actifs', str(snapshot.patients_actifs)],
+        ['Patients inactifs', str(snapshot.patients_inactifs)],
+        ['Total médecins', str(snapshot.total_medecins)],
+        ['Total consultations', str(snapshot.total_consultations)],
+        ['Consultations (7 derniers jours)', str(snapshot.consultations_7_jours)],
+        ['Consultations à venir', str(snapshot.consultations_a_venir)],
+    ]
+    t = Table(summary_data, colWidths=[8*cm, 6*cm])
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
+        ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    elems.append(t)
+    elems.append(Spacer(1, 12))
+
+    # Spécialités sollicitées
+    elems.append(Paragraph('Spécialités sollicitées', h2_style))
+    spec_data = [['Spécialité', 'Nombre consultations']]
+    for spec in snapshot.specialites[:20]:
+        spec_data.append([spec.specialty or 'N/A', str(spec.consultations)])
+    spec_table = Table(spec_data, colWidths=[10*cm, 4*cm])
+    spec_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#4b79a1')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('ALIGN', (1,1), (-1,-1), 'CENTER'),
+        ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
+        ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
+    ]))
+    elems.append(spec_table)
+    elems.append(Spacer(1, 12))
+
+    # Top médecins
+    elems.append(Paragraph('Top médecins (par nombre de consultations)', h2_style))
+    doc_data = [['Médecin', 'Spécialité', 'Nb consultations']]
+    for d in snapshot.top_medecins:
+        name = f"{d.nom or ''} {d.prenom or ''}".strip()
+        doc_data.append([name, d.specialty or 'N/A', str(d.consultations)])
+    doc_table = Table(doc_data, colWidths=[8*cm, 4*cm, 2*cm])
+    doc_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#4b79a1')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('ALIGN', (2,1), (-1,-1), 'CENTER'),
+        ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
+        ('INNERGRID', (0,0), (-1,-1), 0.25, colors.grey),
+    ]))
+    elems.append(doc_table)
+
+    # Footer
+    elems.append(Spacer(1, 24))
+    elems.append(Paragraph('Generated by Clinic Management System', ParagraphStyle('footer', parent=normal, fontSize=8, alignment=1, textColor=colors.grey)))
+
+    doc.build(elems)
@@ -0,0 +1,109 @@
+"""
+Agrégat journalier des consultations (``ConsultationDailyStat``): une ligne
+par (jour, médecin) avec le nombre de consultations et de patients distincts.
+
+Les statistiques des dashboards et des rapports lisent cette table (voir
+stats.py): leur coût dépend du nombre de jours, plus du nombre de consultations.
+
+Chaque enregistrement ou suppression de consultation recalcule, après la
+validation de la transaction, la ligne du jour concerné (et de l'ancien jour
+si la consultation a été déplacée) à partir de l'index (doctor, start_time).
+Recalculer le jour plutôt qu'incrémenter garde ``unique_patients`` exact.
+La commande ``rebuild_consultation_stats`` reconstruit toute la table.
+
+Les jours sont ceux du fuseau de la clinique (TIME_ZONE).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Consultation, ConsultationDailyStat, Doctor
+
+
+def stat_day(start_time):
+    """Jour de la clinique auquel une consultation est comptée"""
+    return timezone.localtime(start_time, timezone.get_default_timezone()).date()
+
+
+def day_bounds(day):
+    """[début, fin) du jour ``day`` dans le fuseau de la clinique"""
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def refresh_day(doctor_id, day):
+    """Recalcule la ligne (day, doctor_id) depuis les consultations"""
+    start, end = day_bounds(day)
+    with transaction.atomic():
+        # Sérialise les recalculs d'un même médecin: le dernier écrit des chiffres à jour
+        doctor = Doctor.objects.select_for_update().filter(pk=doctor_id).values('specialty').first()
+        if doctor is None:
+            return
+        totals = Consultation.objects.filter(
+            doctor_id=doctor_id, start_time__gte=start, start_time__lt=end
+        ).aggregate(count=Count('id'), unique_patients=Count('patient', distinct=True))
+        if not totals['count']:
+            ConsultationDailyStat.objects.filter(doctor_id=doctor_id, date=day).delete()
+            return
+        ConsultationDailyStat.objects.update_or_create(
+            doctor_id=doctor_id, date=day,
+            defaults={'specialty': doctor['specialty'], **totals}
+        )
+
+
+def refresh_on_commit(keys):
+    """Recalcule les (doctor_id, jour) de ``keys`` une fois la transaction validée"""
+    keys = set(keys)
+
+    def refresh():
+        for doctor_id, day in keys:
+            refresh_day(doctor_id, day)
+
+    if keys:
+        transaction.on_commit(refresh)
+
+
+def rebuild(chunk_days=31):
+    """
+    Reconstruit toute la table, ``chunk_days`` jours par transaction.
+    Retourne le nombre de lignes écrites.
+    """
+    bounds = Consultation.objects.order_by().aggregate(first=Min('start_time'), last=Max('start_time'))
+    if bounds['first'] is None:
+        ConsultationDailyStat.objects.all().delete()
+        return 0
+    first, last = stat_day(bounds['first']), stat_day(bounds['last'])
+    ConsultationDailyStat.objects.filter(Q(date__lt=first) | Q(date__gt=last)).delete()
+
+    tz = timezone.get_default_timezone()
+    written = 0
+    chunk_start = first
+    while chunk_start <= last:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), last)
+        start, _ = day_bounds(chunk_start)
+        _, end = day_bounds(chunk_end)
+        rows = Consultation.objects.filter(start_time__gte=start, start_time__lt=end).annotate(
+            day=TruncDate('start_time', tzinfo=tz)
+        ).values('day', 'doctor_id', 'doctor__specialty').annotate(
+            count=Count('id'), unique_patients=Count('patient', distinct=True)
+        ).order_by()
+        with transaction.atomic():
+            ConsultationDailyStat.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            created = ConsultationDailyStat.objects.bulk_create([
+                ConsultationDailyStat(
+                    date=row['day'],
+                    doctor_id=row['doctor_id'],
+                    specialty=row['doctor__specialty'],
+                    count=row['count'],
+                    unique_patients=row['unique_patients']
+                )
+                for row in rows
+            ])
+        written += len(created)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
@@ -0,0 +1,179 @@
+"""
+Moteur d'horaires partagé pour les médecins.
+
+Le champ texte ``Doctor.schedule`` (ex: "Lun-Ven 9:00-17:00",
+"Mon-Fri 09:00-17:00", "Lun,Mer 08:00-12:00", "Lun-Ven 9h00-17h00" ou
+"Lun - Ven | 08:00 - 16:00")
+est compilé une seule fois en un masque de jours + une plage en minutes,
+puis mis en cache par médecin. Vérifier un créneau ne coûte ensuite que
+quelques comparaisons d'entiers.
+"""
+import re
+from datetime import datetime, time, timedelta
+from typing import NamedTuple
+
+from django.utils import timezone
+
+
+DAY_CODES = {
+    'lun': 0, 'mar': 1, 'mer': 2, 'jeu': 3, 'ven': 4, 'sam': 5, 'dim': 6,
+    'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6,
+}
+
+SLOT_DURATION = timedelta(minutes=30)
+
+_TIME_RANGE_RE = re.compile(r"(\d{1,2})[:h](\d{2})\s*-\s*(\d{1,2})[:h](\d{2})")
+
+
+class CompiledSchedule(NamedTuple):
+    """Horaire compilé: bit N de ``days`` = jour N (lundi = 0), plage en minutes depuis minuit."""
+    days: int
+    start: int
+    end: int
+
+    def works_on(self, weekday):
+        return bool(self.days >> weekday & 1)
+
+    def allows(self, start_dt, end_dt):
+        """Vérifie qu'un créneau [start_dt, end_dt) tient dans les heures de travail."""
+        start_local = timezone.localtime(start_dt) if timezone.is_aware(start_dt) else start_dt
+        if not self.works_on(start_local.weekday()):
+            return False
+        start_min = start_local.hour * 60 + start_local.minute
+        end_min = start_min + int((end_dt - start_dt).total_seconds() // 60)
+        return self.start <= start_min and end_min <= self.end
+
+
+def _day_to_num(token):
+    return DAY_CODES.get(token[:3])
+
+
+def _parse_days(day_part):
+    mask = 0
+    for token in day_part.split(','):
+        if not token:
+            continue
+        if '-' in token:
+            a, b = token.split('-', 1)
+            na, nb = _day_to_num(a), _day_to_num(b)
+            if na is None or nb is None:
+                return 0
+            # Plage pouvant boucler sur la semaine (ex: Sam-Lun)
+            day = na
+            while True:
+                mask |= 1 << day
+                if day == nb:
+                    break
+                day = (day + 1) % 7
+        else:
+            n = _day_to_num(token)
+            if n is None:
+                return 0
+            mask |= 1 << n
+    return mask
+
+
+def compile_schedule(schedule_str):
+    """
+    Compile une chaîne d'horaire en ``CompiledSchedule``.
+    Retourne None si la chaîne est vide ou inexploitable.
+    """
+    if not schedule_str:
+        return None
+    s = schedule_str.strip().lower()
+    m = _TIME_RANGE_RE.search(s)
+    if not m:
+        return None
+
+    day_part = re.sub(r"[\s|]", '', s[:m.start()])
+    days = _parse_days(day_part)
+    if not days:
+        return None
+
+    h1, m1, h2, m2 = (int(g) for g in m.groups())
+    if m1 > 59 or m2 > 59:
+        return None
+    start, end = h1 * 60 + m1, h2 * 60 + m2
+    if not (0 <= start < end <= 24 * 60):
+        return None
+    return CompiledSchedule(days, start, end)
+
+
+# doctor_id -> (chaîne d'horaire, horaire compilé)
+_doctor_schedules = {}
+
+
+def get_doctor_schedule(doctor):
+    """
+    Horaire compilé d'un médecin (None si vide ou inexploitable), recompilé
+    uniquement si ``doctor.schedule`` a changé.
+    """
+    cached = _doctor_schedules.get(doctor.pk)
+    if cached is not None and cached[0] == doctor.schedule:
+        return cached[1]
+    compiled = compile_schedule(doctor.schedule)
+    _doctor_schedules[doctor.pk] = (doctor.schedule, compiled)
+    return compiled
+
+
+def invalidate_doctor_schedule(doctor_id):
+    _doctor_schedules.pop(doctor_id, None)
+
+
+def is_within_schedule(start_dt, end_dt, doctor):
+    """
+    Vérifie qu'une consultation est dans les heures de travail du médecin.
+    Sans horaire: pas de restriction; horaire saisi mais inexploitable: refusé.
+    """
+    schedule = get_doctor_schedule(doctor)
+    if schedule is None:
+        return not (doctor.schedule or '').strip()
+    return schedule.allows(start_dt, end_dt)
+
+
+def slots_per_hour(schedule, step=SLOT_DURATION):
+    """Nombre de créneaux de ``step`` qui commencent à chaque heure (liste de 24 entiers)."""
+    minutes = int(step.total_seconds() // 60)
+    counts = [0] * 24
+    for start in range(schedule.start, schedule.end - minutes + 1, minutes):
+        counts[start // 60] += 1
+    return counts
+
+
+def window_bounds(start_day, end_day):
+    """Bornes aware [début de start_day, fin de end_day), sans remonter avant maintenant."""
+    window_start = timezone.make_aware(datetime.combine(start_day, time()))
+    window_end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time()))
+    return max(window_start, timezone.now()), window_end
+
+
+def free_slots(schedule, busy, window_start, window_end, step=SLOT_DURATION):
+    """
+    Créneaux libres de durée ``step`` dans [window_start, window_end).
+
+    ``busy`` est la liste des intervalles (start, end) déjà réservés, triée
+    par début. Les créneaux des jours travaillés sont parcourus dans l'ordre
+    en avançant un seul curseur sur ``busy`` (balayage d'intervalles).
+    Aucun créneau si ``schedule`` est None (horaire vide ou inexploitable).
+    """
+    if schedule is None:
+        return
+    tz = timezone.get_current_timezone()
+    day = timezone.localtime(window_start, tz).date()
+    last_day = timezone.localtime(window_end, tz).date()
+    i, n = 0, len(busy)
+
+    while day <= last_day:
+        if schedule.works_on(day.weekday()):
+            midnight = timezone.make_aware(datetime.combine(day, time()), tz)
+            slot = midnight + timedelta(minutes=schedule.start)
+            day_end = midnight + timedelta(minutes=schedule.end)
+            while slot + step <= day_end:
+                slot_end = slot + step
+                if slot >= window_start and slot_end <= window_end:
+                    while i < n and busy[i][1] <= slot:
+                        i += 1
+                    if i == n or busy[i][0] >= slot_end:
+                        yield slot
+                slot = slot_end
+        day += timedelta(days=1)
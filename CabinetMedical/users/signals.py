@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from Facture.models import Facture
+
+from . import dashboard_cache, intervals, rollup
+from .models import Consultation, ConsultationDailyStat, ConsultationTombstone, Doctor, DossierMedical, Patient, User
+from .schedule import invalidate_doctor_schedule
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_schedule_cache(sender, instance, **kwargs):
+    """Oublier l'horaire compilé quand le médecin est modifié ou supprimé"""
+    invalidate_doctor_schedule(instance.pk)
+
+
+@receiver(post_save, sender=Doctor)
+def sync_stat_specialty(sender, instance, created, **kwargs):
+    """Reporter un changement de spécialité dans l'agrégat journalier"""
+    if not created:
+        ConsultationDailyStat.objects.filter(doctor=instance).exclude(
+            specialty=instance.specialty
+        ).update(specialty=instance.specialty)
+
+
+@receiver(post_save, sender=Consultation)
+def index_consultation(sender, instance, **kwargs):
+    """Reporter le créneau dans l'index des intervalles une fois la transaction validée"""
+    pk, doctor_id, start, end = instance.pk, instance.doctor_id, instance.start_time, instance.end_time
+    transaction.on_commit(lambda: intervals.record(pk, doctor_id, start, end))
+
+
+@receiver(post_delete, sender=Consultation)
+def unindex_consultation(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: intervals.discard(pk))
+
+
+@receiver(post_delete, sender=Consultation)
+def record_tombstone(sender, instance, **kwargs):
+    """Garder la trace de la suppression pour les calendriers qui synchronisent (since)"""
+    ConsultationTombstone.objects.create(
+        consultation_id=instance.pk, doctor_id=instance.doctor_id, start_time=instance.start_time
+    )
+
+
+@receiver(post_save, sender=Consultation)
+def record_move_tombstone(sender, instance, created, **kwargs):
+    """Une consultation déplacée quitte la vue (médecin, période) de son ancien créneau"""
+    doctor_id, _, start_time = instance._original_slot
+    if created or not doctor_id or not start_time:
+        return
+    if (doctor_id, start_time) != (instance.doctor_id, instance.start_time):
+        ConsultationTombstone.objects.create(consultation_id=instance.pk, doctor_id=doctor_id, start_time=start_time)
+
+
+@receiver(post_init, sender=Consultation)
+def remember_original_slot(sender, instance, **kwargs):
+    """Créneau d'origine, pour recalculer l'ancien jour si la consultation est déplacée"""
+    # __dict__: ne pas charger les champs différés (only/defer)
+    values = instance.__dict__
+    instance._original_slot = (values.get('doctor_id'), values.get('patient_id'), values.get('start_time'))
+
+
+@receiver(post_save, sender=Consultation)
+def consultation_saved(sender, instance, created, **kwargs):
+    """Agrégat journalier et dashboards du jour/docteur/patient, avant et après un déplacement"""
+    stat_keys = [(instance.doctor_id, rollup.stat_day(instance.start_time))]
+    scopes = _dashboard_scopes(instance.doctor_id, instance.patient_id)
+    doctor_id, patient_id, start_time = instance._original_slot
+    if not created and doctor_id and start_time:
+        stat_keys.append((doctor_id, rollup.stat_day(start_time)))
+        scopes |= _dashboard_scopes(doctor_id, patient_id)
+    rollup.refresh_on_commit(stat_keys)
+    dashboard_cache.invalidate(*scopes)
+    instance._original_slot = (instance.doctor_id, instance.patient_id, instance.start_time)
+
+
+@receiver(post_delete, sender=Consultation)
+def consultation_deleted(sender, instance, **kwargs):
+    rollup.refresh_on_commit([(instance.doctor_id, rollup.stat_day(instance.start_time))])
+    dashboard_cache.invalidate(*_dashboard_scopes(instance.doctor_id, instance.patient_id))
+
+
+def _dashboard_scopes(doctor_id, patient_id):
+    scopes = {dashboard_cache.ADMIN, dashboard_cache.doctor_scope(doctor_id)}
+    if patient_id:
+        scopes.add(dashboard_cache.patient_scope(patient_id))
+    return scopes
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_all_dashboards(sender, instance, **kwargs):
+    """Noms et profils apparaissent dans les dashboards des uns et des autres"""
+    dashboard_cache.invalidate(dashboard_cache.ALL)
+
+
+@receiver(post_save, sender=User)
+def invalidate_dashboards_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # La connexion ne met à jour que last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    dashboard_cache.invalidate(dashboard_cache.ALL)
+
+
+@receiver(post_save, sender=DossierMedical)
+@receiver(post_delete, sender=DossierMedical)
+def invalidate_patient_dashboard(sender, instance, **kwargs):
+    dashboard_cache.invalidate(dashboard_cache.patient_scope(instance.patient_id))
+
+
+@receiver(post_save, sender=Facture)
+@receiver(post_delete, sender=Facture)
+def invalidate_facture_stats(sender, instance, **kwargs):
+    dashboard_cache.invalidate(dashboard_cache.FACTURES)
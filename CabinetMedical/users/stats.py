@@ -0,0 +1,224 @@
+"""
+Compteurs des dashboards et des rapports: une requête ``aggregate`` par table,
+chaque compteur étant un ``Count``/``Sum`` filtré (agrégation conditionnelle)
+au lieu d'un ``count()`` séparé.
+
+Les consultations sont lues dans l'agrégat journalier (voir rollup.py),
+complété par les consultations du jour en cours pour les compteurs qui
+commencent à un instant précis (à venir, 7 derniers jours).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from Facture.models import Facture
+
+from .models import Consultation, ConsultationDailyStat, Doctor, Patient
+from .rollup import day_bounds, stat_day
+
+
+def patient_counts():
+    return Patient.objects.aggregate(
+        total=Count('id'),
+        actifs=Count('id', filter=Q(status='Actif')),
+        inactifs=Count('id', filter=Q(status='Inactif')),
+    )
+
+
+def doctor_counts():
+    return Doctor.objects.aggregate(
+        total=Count('id'),
+        approved=Count('id', filter=Q(user__is_approved=True)),
+        pending=Count('id', filter=Q(user__is_approved=False)),
+    )
+
+
+def consultation_counts(doctor_id=None):
+    """
+    Consultations: total, du jour, depuis 7 et 30 jours (jours suivants inclus),
+    à venir et des 7 derniers jours (à partir de maintenant - 7 jours).
+    Deux requêtes: l'agrégat journalier, puis le reste des deux jours entamés.
+    """
+    now = timezone.now()
+    week_ago = now - timedelta(days=7)
+    today, first_day = stat_day(now), stat_day(week_ago)
+    _, today_end = day_bounds(today)
+    _, first_day_end = day_bounds(first_day)
+
+    stats = ConsultationDailyStat.objects.all()
+    partial = Consultation.objects.all()
+    if doctor_id is not None:
+        stats = stats.filter(doctor_id=doctor_id)
+        partial = partial.filter(doctor_id=doctor_id)
+
+    def total(**filters):
+        return Coalesce(Sum('count', filter=Q(**filters)), 0)
+
+    counts = stats.aggregate(
+        total=Coalesce(Sum('count'), 0),
+        today=total(date=today),
+        this_week=total(date__gte=today - timedelta(days=7)),
+        this_month=total(date__gte=today - timedelta(days=30)),
+        after_today=total(date__gt=today),
+        after_first_day=total(date__gt=first_day),
+    )
+
+    remaining_today = Q(start_time__gte=now, start_time__lt=today_end)
+    remaining_first_day = Q(start_time__gte=week_ago, start_time__lt=first_day_end)
+    partial = partial.filter(remaining_today | remaining_first_day).aggregate(
+        today=Count('id', filter=remaining_today),
+        first_day=Count('id', filter=remaining_first_day),
+    )
+
+    return {
+        'total': counts['total'],
+        'today': counts['today'],
+        'this_week': counts['this_week'],
+        'this_month': counts['this_month'],
+        'upcoming': counts['after_today'] + partial['today'],
+        'last_7_days': counts['after_first_day'] + partial['first_day'],
+    }
+
+
+def period_filter(field, start=None, end=None):
+    """Q limitant ``field`` (une date) à [start, end], bornes facultatives; None sans borne"""
+    q = Q()
+    if start:
+        q &= Q(**{f'{field}__gte': start})
+    if end:
+        q &= Q(**{f'{field}__lte': end})
+    return q or None
+
+
+def specialty_counts(start=None, end=None):
+    """Par spécialité: nombre de médecins et de consultations (sur [start, end]), trié par consultations"""
+    return Doctor.objects.values('specialty').annotate(
+        doctors=Count('id', distinct=True),
+        consultations=Coalesce(Sum('daily_stats__count', filter=period_filter('daily_stats__date', start, end)), 0),
+    ).order_by('-consultations')
+
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+BREAKDOWNS = ('doctor', 'specialty')
+MAX_BUCKETS = 1000
+
+
+def consultation_series(granularity, start, end, breakdown=None, doctor_id=None, specialty=None):
+    """
+    Nombre de consultations par heure, jour, semaine (commençant le lundi) ou
+    mois sur [start, end] (dates), éventuellement une série par médecin ou par
+    spécialité. Une requête groupée: l'agrégat journalier, ou les consultations
+    pour l'heure. Les périodes sans consultation valent 0.
+
+    Retourne {'periodes': [...], 'series': [{'key', 'label', 'points': [...]}]}.
+    """
+    buckets = period_buckets(granularity, start, end)
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f'Trop de périodes ({len(buckets)}), maximum {MAX_BUCKETS}: réduire la plage')
+
+    if granularity == 'hour':
+        range_start, _ = day_bounds(start)
+        _, range_end = day_bounds(end)
+        rows = Consultation.objects.filter(start_time__gte=range_start, start_time__lt=range_end).annotate(
+            bucket=TruncHour('start_time', tzinfo=timezone.get_default_timezone())
+        )
+        count, specialty_field = Count('id'), 'doctor__specialty'
+    else:
+        rows = ConsultationDailyStat.objects.filter(date__gte=start, date__lte=end)
+        if granularity == 'day':
+            rows = rows.annotate(bucket=F('date'))
+        else:
+            rows = rows.annotate(bucket=(TruncWeek if granularity == 'week' else TruncMonth)('date'))
+        # La spécialité est recopiée dans l'agrégat: pas de jointure
+        count, specialty_field = Sum('count'), 'specialty'
+
+    if doctor_id is not None:
+        rows = rows.filter(doctor_id=doctor_id)
+    if specialty:
+        rows = rows.filter(**{specialty_field: specialty})
+    group = {
+        None: [],
+        'doctor': ['doctor_id', 'doctor__nom', 'doctor__prenom'],
+        'specialty': [specialty_field],
+    }[breakdown]
+
+    counts = defaultdict(dict)
+    labels = {}
+    for row in rows.values('bucket', *group).annotate(n=count).order_by():
+        key = tuple(row[field] for field in group)
+        counts[key][_bucket_key(row['bucket'])] = row['n']
+        labels[key] = row
+    if not counts and breakdown is None:
+        counts[()] = {}
+
+    series = []
+    for key, values in counts.items():
+        if breakdown == 'doctor':
+            row = labels[key]
+            label = f"Dr. {row['doctor__nom']} {row['doctor__prenom']}".strip()
+            series_key = key[0]
+        elif breakdown == 'specialty':
+            label = series_key = key[0]
+        else:
+            label = series_key = None
+        series.append({
+            'key': series_key,
+            'label': label,
+            'total': sum(values.values()),
+            'points': [values.get(_bucket_key(b), 0) for b in buckets],
+        })
+    series.sort(key=lambda item: -item['total'])
+    return {'periodes': [b.isoformat() for b in buckets], 'series': series}
+
+
+def period_buckets(granularity, start, end):
+    """Début de chaque période couvrant [start, end]"""
+    if granularity == 'hour':
+        tz = timezone.get_default_timezone()
+        moment, _ = day_bounds(start)
+        _, stop = day_bounds(end)
+        buckets = []
+        # Pas d'une heure en UTC: les changements d'heure restent justes
+        moment = moment.astimezone(dt_timezone.utc)
+        while moment < stop:
+            buckets.append(moment.astimezone(tz))
+            moment += timedelta(hours=1)
+        return buckets
+    if granularity == 'day':
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if granularity == 'week':
+        first = start - timedelta(days=start.weekday())
+        return [first + timedelta(weeks=i) for i in range((end - first).days // 7 + 1)]
+    buckets = []
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        buckets.append(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return buckets
+
+
+def _bucket_key(value):
+    # Heures comparées en UTC, jours/semaines/mois par leur date
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc)
+    return value
+
+
+def facture_counts():
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    def amount(**filters):
+        return Coalesce(Sum('montant', filter=Q(**filters) if filters else None), Value(0), output_field=money)
+
+    return Facture.objects.aggregate(
+        total=Count('id'),
+        payees=Count('id', filter=Q(statut='PAYEE')),
+        en_attente=Count('id', filter=Q(statut='EN_ATTENTE')),
+        annulees=Count('id', filter=Q(statut='ANNULEE')),
+        montant_total=amount(),
+        montant_paye=amount(statut='PAYEE'),
+        montant_en_attente=amount(statut='EN_ATTENTE'),
+    )
@@ -1,3 +1,1187 @@
-from django.test import TestCase
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from Facture.models import Facture
+
+from . import dashboard_cache, intervals, report_stats, reports, schedule, stats
+from .booking import BookingError, book_consultation
+from .models import (
+    CONSULTATION_OVERLAP_CONSTRAINT, CONSULTATION_PATIENT_OVERLAP_CONSTRAINT, Consultation, ConsultationConflict,
+    ConsultationDailyStat, Doctor, DossierMedical, Patient, PatientConsultationConflict,
+    SlotHold, User, WaitlistEntry, has_overlap_constraint,
+)
+from .motifs import motif_code, motif_label
+from .waitlist import accept_offer
+
+TRANSACTION_KEYWORDS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+# Après validation d'une réservation: verrou du médecin, comptage du jour,
+# lecture et écriture de la ligne agrégée
+ROLLUP_QUERIES = 4
+
+
+def data_queries(context):
+    """Requêtes capturées, sans les instructions de gestion de transaction"""
+    return [
+        q['sql'] for q in context.captured_queries
+        if not q['sql'].upper().startswith(TRANSACTION_KEYWORDS)
+    ]
+
+
+def install_overlap_trigger(column, constraint):
+    """
+    Sous SQLite, simule la contrainte d'exclusion PostgreSQL ``constraint`` par
+    un trigger (supprimé avec la transaction du test), pour vérifier que
+    l'erreur de la base est bien traduite. Sans effet sous PostgreSQL.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TRIGGER test_{constraint} BEFORE INSERT ON users_consultation '
+            f'WHEN EXISTS (SELECT 1 FROM users_consultation c WHERE c.{column} = NEW.{column} '
+            f'AND c.start_time < NEW.end_time AND NEW.start_time < c.end_time) '
+            f'BEGIN SELECT RAISE(ABORT, \'conflicting key value violates exclusion constraint "{constraint}"\'); END'
+        )
+
+
+def next_monday_at(hour, minute=0):
+    day = timezone.localdate() + timedelta(days=7)
+    while day.weekday() != 0:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=hour, minutes=minute)
+
+
+class BookingTestMixin:
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@test.com', password='x', role='ADMIN', is_approved=True
+        )
+        doctor_user = User.objects.create_user(
+            username='doc', email='doc@test.com', password='x', role='DOCTOR', is_approved=True
+        )
+        self.doctor = Doctor.objects.create(
+            user=doctor_user, nom='House', prenom='Greg', specialty='Cardiologie',
+            phone='0600000000', schedule='Lun-Ven 9:00-17:00'
+        )
+        patient_user = User.objects.create_user(
+            username='pat', email='pat@test.com', password='x', role='PATIENT', is_approved=True
+        )
+        self.patient = Patient.objects.create(user=patient_user, nom='Doe', prenom='John', address='Tunis')
+        # index vidé entre les tests, puis chargé pour ne pas compter sa requête
+        intervals.reset()
+        intervals.warm([self.doctor.id])
+        # le cache des dashboards survit au rollback de chaque test
+        dashboard_cache.get_cache().clear()
+        dashboard_cache.reset_stats()
+        report_stats.clear()
+
+    @contextmanager
+    def capture_booking_queries(self):
+        """Requêtes mesurées, callbacks on_commit compris (index, agrégat journalier, cache)"""
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            yield ctx
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class OverlapConstraintTests(BookingTestMixin, TestCase):
+    def test_database_conflict_is_mapped_to_consultation_conflict(self):
+        book_consultation(self.doctor, self.patient, next_monday_at(10))
+        install_overlap_trigger('doctor_id', CONSULTATION_OVERLAP_CONSTRAINT)
+        # Sans vérification préalable: seule la base arbitre, comme sous PostgreSQL
+        with mock.patch('users.models.has_overlap_constraint', return_value=True):
+            with self.assertRaises(ConsultationConflict):
+                Consultation(doctor=self.doctor, patient=self.patient, start_time=next_monday_at(10, 15)).save()
+        self.assertEqual(Consultation.objects.count(), 1)
+
+    def test_database_patient_conflict_is_mapped(self):
+        other = Doctor.objects.create(
+            user=User.objects.create_user(
+                username='doc2', email='doc2@test.com', password='x', role='DOCTOR', is_approved=True
+            ),
+            nom='Grey', prenom='Meredith', specialty='Chirurgie', phone='0600000001', schedule='Lun-Ven 9:00-17:00'
+        )
+        book_consultation(self.doctor, self.patient, next_monday_at(10))
+        install_overlap_trigger('patient_id', CONSULTATION_PATIENT_OVERLAP_CONSTRAINT)
+        with mock.patch('users.models.has_overlap_constraint', return_value=True):
+            with self.assertRaises(PatientConsultationConflict):
+                Consultation(doctor=other, patient=self.patient, start_time=next_monday_at(10, 15)).save()
+
+    def test_probe_is_bounded_on_start_time(self):
+        book_consultation(self.doctor, self.patient, next_monday_at(10))
+        with CaptureQueriesContext(connection) as ctx, self.assertRaises(ConsultationConflict):
+            Consultation(doctor=self.doctor, patient=self.patient, start_time=next_monday_at(10, 15)).save()
+        probe = next(sql for sql in data_queries(ctx) if sql.startswith('SELECT'))
+        # les deux branches (médecin, patient) bornent start_time des deux côtés
+        self.assertEqual(probe.count('"users_consultation"."start_time" >'), 2)
+        self.assertEqual(probe.count('"users_consultation"."start_time" <'), 2)
+
+        # juste avant / juste après: pas de chevauchement
+        Consultation(doctor=self.doctor, patient=self.patient, start_time=next_monday_at(9, 30)).save()
+        Consultation(doctor=self.doctor, patient=self.patient, start_time=next_monday_at(10, 30)).save()
+
+    def test_overlapping_rows_are_listed_before_migration(self):
+        # Données héritées: insérées sans passer par save()
+        Consultation.objects.bulk_create([
+            Consultation(doctor=self.doctor, patient=self.patient, start_time=start, end_time=start + timedelta(minutes=30))
+            for start in (next_monday_at(9), next_monday_at(9, 15), next_monday_at(9, 20), next_monday_at(11))
+        ])
+        out = StringIO()
+        call_command('find_overlapping_consultations', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('2 chevauchement(s)', lines[-1])
+
+        out = StringIO()
+        call_command('find_overlapping_consultations', '--patient', stdout=out)
+        self.assertIn(f'patient #{self.patient.id}', out.getvalue())
+        self.assertIn('2 chevauchement(s)', out.getvalue())
+
+
+class ScheduleParserTests(SimpleTestCase):
+    MONDAY_9 = datetime(2030, 1, 7, 9, 0, tzinfo=dt_timezone.utc)
+
+    def test_day_ranges_and_lists(self):
+        self.assertEqual(schedule.compile_schedule('Lun-Ven 9:00-17:00'), (0b0011111, 540, 1020))
+        self.assertEqual(schedule.compile_schedule('Mon-Fri 09:00-17:00'), (0b0011111, 540, 1020))
+        self.assertEqual(schedule.compile_schedule('Lun,Mer 08:00-12:00').days, 0b0000101)
+        # plage qui boucle sur la semaine: samedi, dimanche, lundi
+        self.assertEqual(schedule.compile_schedule('Sam-Lun 10:00-14:00').days, 0b1100001)
+        self.assertEqual(schedule.compile_schedule('Lundi 8:30-12:15'), (0b0000001, 510, 735))
+
+    def test_separators(self):
+        self.assertEqual(schedule.compile_schedule('Lun-Ven 9h00-17h30'), (0b0011111, 540, 1050))
+        self.assertEqual(schedule.compile_schedule('Lun - Ven | 08:00 - 16:00'), (0b0011111, 480, 960))
+
+    def test_malformed_input(self):
+        for value in (None, '', '   ', 'Lun-Ven', '9:00-17:00', 'Xyz 9:00-17:00', 'Lun-Xyz 9:00-17:00',
+                      'Lun-Ven 17:00-9:00', 'Lun-Ven 9:75-17:00', 'Lun-Ven 20:00-25:00', 'Sur rendez-vous',
+                      'Lun-Ven 9:-17:', 'Lun-Ven 9h-17h'):
+            with self.subTest(value=value):
+                self.assertIsNone(schedule.compile_schedule(value))
+
+    def test_unparsable_schedule_rejects_and_empty_schedule_allows(self):
+        end = self.MONDAY_9 + schedule.SLOT_DURATION
+        unparsable = Doctor(pk=-1, schedule='Sur rendez-vous')
+        empty = Doctor(pk=-2, schedule='')
+        self.addCleanup(schedule.invalidate_doctor_schedule, -1)
+        self.addCleanup(schedule.invalidate_doctor_schedule, -2)
+        self.assertFalse(schedule.is_within_schedule(self.MONDAY_9, end, unparsable))
+        self.assertTrue(schedule.is_within_schedule(self.MONDAY_9, end, empty))
+        self.assertEqual(list(schedule.free_slots(None, [], self.MONDAY_9, self.MONDAY_9 + timedelta(days=7))), [])
+
+
+class BookingServiceTests(BookingTestMixin, TestCase):
+    ROLLUP_QUERIES = ROLLUP_QUERIES
+    # médecin + patient + gardes de créneau + insertion, la vérification de chevauchement
+    # sans contrainte d'exclusion, puis la mise à jour de l'agrégat journalier
+    EXPECTED_QUERIES = (4 if has_overlap_constraint() else 5) + ROLLUP_QUERIES
+
+    def test_booking_costs_fixed_number_of_queries(self):
+        with self.capture_booking_queries() as ctx:
+            consultation = book_consultation(self.doctor.id, self.patient.id, next_monday_at(9))
+        self.assertEqual(len(data_queries(ctx)), self.EXPECTED_QUERIES)
+        self.assertEqual(consultation.end_time - consultation.start_time, timedelta(minutes=30))
+
+    def test_overlap_is_reported_as_conflict(self):
+        book_consultation(self.doctor.id, self.patient.id, next_monday_at(10))
+        with self.assertRaises(BookingError) as ctx:
+            book_consultation(self.doctor.id, self.patient.id, next_monday_at(10, 15))
+        self.assertEqual(ctx.exception.code, 'conflict')
+        self.assertEqual(Consultation.objects.count(), 1)
+
+    def test_patient_overlap_with_another_doctor_is_rejected(self):
+        other_user = User.objects.create_user(
+            username='doc2', email='doc2@test.com', password='x', role='DOCTOR', is_approved=True
+        )
+        other = Doctor.objects.create(
+            user=other_user, nom='Grey', prenom='Meredith', specialty='Chirurgie',
+            phone='0600000001', schedule='Lun-Ven 9:00-17:00'
+        )
+        book_consultation(self.doctor.id, self.patient.id, next_monday_at(10))
+        with self.capture_booking_queries() as ctx:
+            with self.assertRaises(BookingError) as error:
+                book_consultation(other.id, self.patient.id, next_monday_at(10, 15))
+        self.assertEqual(error.exception.code, 'patient_conflict')
+        # la vérification patient partage la requête docteur; rien à recalculer après un refus
+        self.assertLessEqual(len(data_queries(ctx)), self.EXPECTED_QUERIES - self.ROLLUP_QUERIES)
+
+    def test_outside_schedule_is_rejected(self):
+        with self.assertRaises(BookingError) as ctx:
+            book_consultation(self.doctor.id, self.patient.id, next_monday_at(17))
+        self.assertEqual(ctx.exception.code, 'outside_schedule')
+
+    def test_unparsable_schedule_is_rejected(self):
+        self.doctor.schedule = 'Sur rendez-vous'
+        self.doctor.save()
+        with self.assertRaises(BookingError) as ctx:
+            book_consultation(self.doctor.id, self.patient.id, next_monday_at(10))
+        self.assertEqual(ctx.exception.code, 'outside_schedule')
+
+    def test_unapproved_doctor_is_rejected(self):
+        self.doctor.user.is_approved = False
+        self.doctor.user.save()
+        with self.assertRaises(BookingError) as ctx:
+            book_consultation(self.doctor.id, self.patient.id, next_monday_at(9))
+        self.assertEqual(ctx.exception.code, 'doctor_not_approved')
+
+    def test_moving_a_consultation_keeps_fixed_query_count(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        with self.capture_booking_queries() as ctx:
+            book_consultation(self.doctor, self.patient, next_monday_at(11), consultation=consultation)
+        # médecin et patient déjà chargés: il ne reste que l'écriture (et la vérification sans contrainte),
+        # la trace de l'ancien créneau (synchronisation du calendrier), puis un seul
+        # recalcul de l'agrégat (même jour avant et après)
+        self.assertEqual(len(data_queries(ctx)), self.EXPECTED_QUERIES - 1)
+
+
+class BookingEndpointQueryCountTests(BookingTestMixin, TestCase):
+    EXPECTED_QUERIES = BookingServiceTests.EXPECTED_QUERIES
+
+    def assertBookingQueries(self, client, url, payload, expected):
+        with self.capture_booking_queries() as ctx:
+            response = client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(data_queries(ctx)), expected)
+
+    def test_admin_calendar_booking(self):
+        self.assertBookingQueries(
+            self.client_for(self.admin), '/api/Admin/calendar/consultations/',
+            {'doctor': self.doctor.id, 'patient': self.patient.id, 'start_time': next_monday_at(9).isoformat()},
+            self.EXPECTED_QUERIES
+        )
+
+    def test_admin_consultation_booking(self):
+        self.assertBookingQueries(
+            self.client_for(self.admin), '/api/Admin/consultations/',
+            {'doctor': self.doctor.id, 'patient': self.patient.id, 'start_time': next_monday_at(9).isoformat()},
+            self.EXPECTED_QUERIES
+        )
+
+    def test_patient_booking(self):
+        # le profil patient vient de l'utilisateur connecté au lieu d'un identifiant
+        self.assertBookingQueries(
+            self.client_for(self.patient.user), '/api/patient/rendez-vous/',
+            {'doctor': self.doctor.id, 'start_time': next_monday_at(9).isoformat()},
+            self.EXPECTED_QUERIES
+        )
+
+    def test_conflict_returns_structured_error(self):
+        client = self.client_for(self.admin)
+        payload = {'doctor': self.doctor.id, 'patient': self.patient.id, 'start_time': next_monday_at(9).isoformat()}
+        client.post('/api/Admin/calendar/consultations/', payload, format='json')
+        response = client.post('/api/Admin/consultations/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 'conflict')
+
+
+class IntervalIndexTests(BookingTestMixin, TestCase):
+    def book(self, start):
+        with self.captureOnCommitCallbacks(execute=True):
+            return book_consultation(self.doctor, self.patient, start)
+
+    def test_index_follows_saves_and_deletes(self):
+        consultation = self.book(next_monday_at(10))
+        self.assertFalse(intervals.is_slot_free(self.doctor.id, next_monday_at(10, 15), next_monday_at(10, 45)))
+        self.assertTrue(intervals.is_slot_free(
+            self.doctor.id, next_monday_at(10), next_monday_at(10, 30), exclude=consultation.pk
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            consultation.delete()
+        self.assertTrue(intervals.is_slot_free(self.doctor.id, next_monday_at(10), next_monday_at(10, 30)))
+
+    def test_conflict_is_rejected_from_the_index(self):
+        self.book(next_monday_at(10))
+        with self.capture_booking_queries() as ctx:
+            with self.assertRaises(BookingError) as error:
+                book_consultation(self.doctor, self.patient, next_monday_at(10, 15))
+        self.assertEqual(error.exception.code, 'conflict')
+        # gardes de créneau et confirmation en base, aucune écriture tentée
+        self.assertEqual(len(data_queries(ctx)), 2)
+
+    def test_stale_entry_does_not_block_booking(self):
+        consultation = self.book(next_monday_at(10))
+        # suppression faite ailleurs, sans que l'index soit prévenu
+        Consultation.objects.filter(pk=consultation.pk).delete()
+        intervals.record(consultation.pk, self.doctor.id, consultation.start_time, consultation.end_time)
+        self.book(next_monday_at(10))
+        self.assertEqual(Consultation.objects.count(), 1)
+
+    def test_availability_reads_the_index(self):
+        self.book(next_monday_at(9))
+        day = next_monday_at(9).date().isoformat()
+        client = self.client_for(self.patient.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(f'/api/doctor-calendar/{self.doctor.id}/availability/?start={day}&end={day}')
+        self.assertEqual(response.data['total_slots'], 15)
+        # seulement le médecin (et l'utilisateur authentifié), pas les consultations
+        self.assertFalse(any('users_consultation' in sql for sql in data_queries(ctx)))
+
+
+class DoctorCalendarFeedTests(BookingTestMixin, TestCase):
+    def test_feed_streams_events_and_supports_conditional_get(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9), 'Suivi')
+        url = self.client_for(self.doctor.user).get('/api/doctor-calendar/feed/').data['url']
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn(f'UID:consultation-{consultation.id}@cabinet-medical', body)
+        self.assertIn('SUMMARY:Consultation - John Doe', body)
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        consultation.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.client.get('/api/doctor-calendar/feed/abc.ics').status_code, 404)
+
+    def test_rotated_token_is_revoked(self):
+        client = self.client_for(self.doctor.user)
+        old_url = client.get('/api/doctor-calendar/feed/').data['url']
+        self.assertEqual(self.client.get(old_url).status_code, 200)
+
+        new_url = client.post('/api/doctor-calendar/feed/').data['url']
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+        self.assertEqual(client.get('/api/doctor-calendar/feed/').data['url'], new_url)
+        self.assertEqual(self.client_for(self.patient.user).post('/api/doctor-calendar/feed/').status_code, 403)
+
+
+class DoctorAvailabilityTests(BookingTestMixin, TestCase):
+    def get(self, **params):
+        return self.client_for(self.patient.user).get(f'/api/doctor-calendar/{self.doctor.id}/availability/', params)
+
+    def test_free_slots_skip_bookings_and_include_end_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+        monday = next_monday_at(9).date()
+        response = self.get(start=monday.isoformat(), end=(monday + timedelta(days=1)).isoformat())
+        self.assertTrue(response.data['schedule_valid'])
+        # 16 créneaux par jour (9:00-17:00), moins celui de 9:00 le lundi
+        self.assertEqual(response.data['total_slots'], 31)
+        self.assertEqual(response.data['slots'][0]['start_time'], next_monday_at(9, 30))
+        self.assertEqual(response.data['slots'][-1]['end_time'], next_monday_at(17) + timedelta(days=1))
+
+        weekend = monday - timedelta(days=2)
+        response = self.get(start=weekend.isoformat(), end=(weekend + timedelta(days=1)).isoformat())
+        self.assertEqual(response.data['total_slots'], 0)
+
+    def test_default_period_is_seven_days(self):
+        period = self.get().data['period']
+        today = timezone.localdate()
+        self.assertEqual(period, {'start': today.isoformat(), 'end': (today + timedelta(days=6)).isoformat()})
+
+    def test_unparsable_schedule_advertises_no_slot(self):
+        self.doctor.schedule = 'Sur rendez-vous'
+        self.doctor.save()
+        response = self.get()
+        self.assertFalse(response.data['schedule_valid'])
+        self.assertEqual(response.data['slots'], [])
+
+    def test_rejected_requests(self):
+        today = timezone.localdate()
+        self.assertEqual(self.get(start='2030-02-30').status_code, 400)
+        self.assertEqual(self.get(start=today.isoformat(), end=(today - timedelta(days=1)).isoformat()).status_code, 400)
+        self.assertEqual(self.get(start=today.isoformat(), end=(today + timedelta(days=31)).isoformat()).status_code, 400)
+        client = self.client_for(self.patient.user)
+        self.assertEqual(client.get('/api/doctor-calendar/999999/availability/').status_code, 404)
+        self.doctor.user.is_approved = False
+        self.doctor.user.save()
+        self.assertEqual(self.get().status_code, 400)
+
+
+class EarliestSlotSearchTests(BookingTestMixin, TestCase):
+    url = '/api/patient/doctors/'
+
+    def setUp(self):
+        super().setUp()
+        self.colleague = self.make_doctor('doc2', 'Wilson', 'Cardiologie', 'Lun-Ven 9:00-17:00')
+        self.pediatrician = self.make_doctor('doc3', 'Grey', 'Pédiatrie', 'Lun-Ven 10:00-17:00')
+        self.unparsable = self.make_doctor('doc4', 'Shepherd', 'Cardiologie', 'Sur rendez-vous')
+        self.make_doctor('doc5', 'Kutner', 'Cardiologie', 'Lun-Ven 8:00-17:00', approved=False)
+        self.monday = next_monday_at(9).date()
+
+    def make_doctor(self, username, nom, specialty, schedule, approved=True):
+        user = User.objects.create_user(
+            username=username, email=f'{username}@test.com', password='x', role='DOCTOR', is_approved=approved
+        )
+        return Doctor.objects.create(
+            user=user, nom=nom, prenom='X', specialty=specialty, phone='0600000009', schedule=schedule
+        )
+
+    def earliest(self, start, end=None, **params):
+        response = self.client_for(self.patient.user).get(self.url, {
+            'mode': 'earliest', 'start': start.isoformat(), 'end': (end or start).isoformat(), **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return [(d['id'], d['next_slot']) for d in response.data]
+
+    def test_ranking_ties_and_unparsable_schedule_last(self):
+        self.assertEqual(self.earliest(self.monday), [
+            # même premier créneau: départagés par id
+            (self.doctor.id, next_monday_at(9)),
+            (self.colleague.id, next_monday_at(9)),
+            (self.pediatrician.id, next_monday_at(10)),
+            (self.unparsable.id, None),
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.colleague, self.patient, next_monday_at(9))
+            book_consultation(self.doctor, self.patient, next_monday_at(9, 30))
+        # 9:00 est libre chez House (son 9:30 est pris), Wilson passe à 9:30
+        self.assertEqual(self.earliest(self.monday)[:2], [
+            (self.doctor.id, next_monday_at(9)),
+            (self.colleague.id, next_monday_at(9, 30)),
+        ])
+
+    def test_window_edges(self):
+        saturday = self.monday - timedelta(days=2)
+        self.assertEqual({slot for _, slot in self.earliest(saturday)}, {None})
+        # le dernier jour est inclus
+        self.assertEqual(self.earliest(saturday, self.monday)[0], (self.doctor.id, next_monday_at(9)))
+
+        # journée entière réservée: pas de créneau sur la période, classé après les autres
+        with self.captureOnCommitCallbacks(execute=True):
+            for slot in range(16):
+                book_consultation(self.doctor, self.patient, next_monday_at(9) + slot * schedule.SLOT_DURATION)
+        ranking = self.earliest(self.monday, specialty='Cardiologie')
+        self.assertEqual(ranking, [
+            (self.colleague.id, next_monday_at(9)), (self.doctor.id, None), (self.unparsable.id, None)
+        ])
+
+        client = self.client_for(self.patient.user)
+        self.assertEqual(client.get(self.url, {'mode': 'earliest', 'start': '2030-13-01'}).status_code, 400)
+        self.assertEqual(client.get(self.url, {
+            'mode': 'earliest', 'start': self.monday.isoformat(), 'end': (self.monday + timedelta(days=31)).isoformat()
+        }).status_code, 400)
+
+    def test_specialty_and_search_filters(self):
+        client = self.client_for(self.patient.user)
+        ids = lambda **params: sorted(d['id'] for d in client.get(self.url, params).data)
+        self.assertEqual(ids(specialty='pédia'), [self.pediatrician.id])
+        self.assertEqual(ids(q='wilson'), [self.colleague.id])
+        self.assertEqual(ids(q='cardio'), sorted([self.doctor.id, self.colleague.id, self.unparsable.id]))
+        self.assertEqual(ids(), sorted([self.doctor.id, self.colleague.id, self.pediatrician.id, self.unparsable.id]))
+        self.assertEqual(
+            [doctor_id for doctor_id, _ in self.earliest(self.monday, specialty='Pédiatrie')], [self.pediatrician.id]
+        )
+
+
+class OccupancyTests(BookingTestMixin, TestCase):
+    def test_invalid_doctor_id_is_rejected(self):
+        response = self.client_for(self.admin).get('/api/users/dashboard/admin/occupancy/', {'doctor_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'doctor_id invalide'})
+
+    def test_booked_slots_and_capacity(self):
+        for hour, minute in ((9, 0), (10, 0), (10, 30)):
+            book_consultation(self.doctor, self.patient, next_monday_at(hour, minute))
+        day = next_monday_at(9).date().isoformat()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_for(self.admin).get(
+                '/api/users/dashboard/admin/occupancy/', {'start': day, 'end': day}
+            )
+        # médecins + deux agrégats, quel que soit le nombre de consultations
+        self.assertEqual(len(data_queries(ctx)), 3)
+
+        cells = {(c['weekday'], c['hour']): c for c in response.data['by_weekday_hour']}
+        self.assertEqual(cells[(0, 10)]['booked'], 2)
+        self.assertEqual(cells[(0, 10)]['capacity'], 2)
+        self.assertEqual(response.data['by_date_doctor'], [
+            {'date': day, 'doctor_id': self.doctor.id, 'booked': 3, 'capacity': 16, 'occupancy': 0.188}
+        ])
+
+
+class WaitlistTests(BookingTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        waiting_user = User.objects.create_user(
+            username='wait', email='wait@test.com', password='x', role='PATIENT', is_approved=True
+        )
+        self.waiting = Patient.objects.create(user=waiting_user, nom='Roe', prenom='Jane', address='Sfax')
+        self.entry = WaitlistEntry.objects.create(
+            doctor=self.doctor, patient=self.waiting,
+            window_start=next_monday_at(8), window_end=next_monday_at(12), motif='Contrôle'
+        )
+
+    def cancel(self, consultation):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client_for(self.admin).delete(f'/api/Admin/calendar/consultations/?id={consultation.id}')
+
+    def test_cancellation_offers_slot_and_offer_can_be_accepted(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.statut, 'PROPOSE')
+        self.assertEqual(self.entry.offered_start_time, next_monday_at(10))
+
+        response = self.client_for(self.waiting.user).post(f'/api/patient/liste-attente/{self.entry.id}/accepter/')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.statut, 'SATISFAIT')
+        self.assertTrue(Consultation.objects.filter(patient=self.waiting, start_time=next_monday_at(10)).exists())
+
+    def test_slot_outside_window_is_not_offered(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(14))
+        self.cancel(consultation)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.statut, 'EN_ATTENTE')
+
+    def test_declined_slot_goes_to_next_patient(self):
+        later = WaitlistEntry.objects.create(
+            doctor=self.doctor, patient=self.patient,
+            window_start=next_monday_at(8), window_end=next_monday_at(12)
+        )
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        self.cancel(consultation)
+        # le patient qui annule n'est pas servi par son propre créneau
+        later.refresh_from_db()
+        self.assertEqual(later.statut, 'EN_ATTENTE')
+
+        self.client_for(self.waiting.user).post(f'/api/patient/liste-attente/{self.entry.id}/refuser/')
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.statut, 'EN_ATTENTE')
+        later.refresh_from_db()
+        self.assertEqual(later.statut, 'PROPOSE')
+        self.assertEqual(SlotHold.objects.get().user, self.patient.user)
+
+    def test_offer_holds_slot_and_notifies_patient(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+
+        self.entry.refresh_from_db()
+        hold = SlotHold.objects.get()
+        self.assertEqual((hold.user, hold.start_time), (self.waiting.user, next_monday_at(10)))
+        self.assertEqual(hold.expires_at, self.entry.offer_expires_at)
+        self.assertEqual([m.to for m in mail.outbox], [['wait@test.com']])
+        # le créneau est réservé au patient le temps de répondre
+        with self.assertRaises(BookingError) as error:
+            book_consultation(self.doctor, self.patient, next_monday_at(10), user=self.admin)
+        self.assertEqual(error.exception.code, 'slot_held')
+
+    def test_offer_hold_survives_patient_own_hold(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+        response = self.client_for(self.waiting.user).post(
+            f'/api/doctor-calendar/{self.doctor.id}/holds/', {'start_time': next_monday_at(11).isoformat()}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            set(SlotHold.objects.values_list('start_time', flat=True)), {next_monday_at(10), next_monday_at(11)}
+        )
+
+    def expire_offer(self):
+        past = timezone.now() - timedelta(seconds=1)
+        WaitlistEntry.objects.filter(statut='PROPOSE').update(offer_expires_at=past)
+        SlotHold.objects.update(expires_at=past)
+
+    def test_unanswered_offer_rolls_over_to_next_patient(self):
+        other = Patient.objects.create(
+            user=User.objects.create_user(
+                username='next', email='next@test.com', password='x', role='PATIENT', is_approved=True
+            ),
+            nom='Poe', address='Tunis'
+        )
+        later = WaitlistEntry.objects.create(
+            doctor=self.doctor, patient=other, window_start=next_monday_at(8), window_end=next_monday_at(12)
+        )
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+        self.expire_offer()
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_waitlist_offers', stdout=out)
+        self.assertIn('1 proposition(s) expirée(s)', out.getvalue())
+
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.statut, self.entry.offer_expires_at), ('EN_ATTENTE', None))
+        later.refresh_from_db()
+        self.assertEqual((later.statut, later.offered_start_time), ('PROPOSE', next_monday_at(10)))
+        self.assertEqual(SlotHold.objects.get().user, other.user)
+        self.assertEqual(mail.outbox[-1].to, ['next@test.com'])
+
+    def test_expired_offer_cannot_be_accepted(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+        self.expire_offer()
+
+        response = self.client_for(self.waiting.user).post(f'/api/patient/liste-attente/{self.entry.id}/accepter/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['code'], 'offer_expired')
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.statut, 'EN_ATTENTE')
+        self.assertFalse(Consultation.objects.filter(start_time=next_monday_at(10)).exists())
+
+    def test_listing_does_not_expire_offers(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+        self.expire_offer()
+        mail.outbox.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.waiting.user).get('/api/patient/liste-attente/')
+        self.assertEqual(response.data[0]['statut'], 'PROPOSE')
+        self.assertEqual(mail.outbox, [])
+
+    def test_accept_rereads_entry_under_lock(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+        stale = WaitlistEntry.objects.get(pk=self.entry.pk)
+        self.expire_offer()
+        call_command('expire_waitlist_offers', stdout=StringIO())
+
+        # copie en mémoire encore PROPOSE, mais la proposition a expiré entre-temps
+        with self.assertRaises(BookingError) as error:
+            accept_offer(stale)
+        self.assertEqual(error.exception.code, 'no_offer')
+        self.assertFalse(Consultation.objects.filter(start_time=next_monday_at(10)).exists())
+
+    def test_waitlist_requires_patient_profile(self):
+        client = self.client_for(self.doctor.user)
+        self.assertEqual(client.get('/api/patient/liste-attente/').status_code, 404)
+        response = client.post('/api/patient/liste-attente/', {
+            'doctor': self.doctor.id, 'window_start': next_monday_at(8).isoformat(),
+            'window_end': next_monday_at(12).isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error'], 'Profil patient introuvable')
+
+    def test_withdrawing_releases_held_slot(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(10))
+        self.cancel(consultation)
+
+        self.client_for(self.waiting.user).delete(f'/api/patient/liste-attente/{self.entry.id}/')
+        self.assertFalse(SlotHold.objects.exists())
+        book_consultation(self.doctor, self.patient, next_monday_at(10), user=self.admin)
+
+
+class SlotHoldTests(BookingTestMixin, TestCase):
+    def hold(self, user, start):
+        return self.client_for(user).post(
+            f'/api/doctor-calendar/{self.doctor.id}/holds/', {'start_time': start.isoformat()}, format='json'
+        )
+
+    def test_hold_blocks_other_users_until_released(self):
+        response = self.hold(self.patient.user, next_monday_at(9))
+        self.assertEqual(response.status_code, 201, response.data)
+
+        self.assertEqual(self.hold(self.admin, next_monday_at(9)).status_code, 409)
+        with self.assertRaises(BookingError) as error:
+            book_consultation(self.doctor, self.patient, next_monday_at(9), user=self.admin)
+        self.assertEqual(error.exception.code, 'slot_held')
+
+        day = next_monday_at(9).date().isoformat()
+        url = f'/api/doctor-calendar/{self.doctor.id}/availability/?start={day}&end={day}'
+        self.assertEqual(self.client_for(self.admin).get(url).data['total_slots'], 15)
+        # le détenteur voit toujours son créneau
+        self.assertEqual(self.client_for(self.patient.user).get(url).data['total_slots'], 16)
+
+        self.client_for(self.patient.user).delete(f"/api/doctor-calendar/holds/{response.data['id']}/")
+        book_consultation(self.doctor, self.patient, next_monday_at(9), user=self.admin)
+
+    def test_holder_booking_consumes_hold(self):
+        self.hold(self.patient.user, next_monday_at(9))
+        response = self.client_for(self.patient.user).post(
+            '/api/patient/rendez-vous/', {'doctor': self.doctor.id, 'start_time': next_monday_at(9).isoformat()},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_new_hold_replaces_previous_one(self):
+        first = self.hold(self.patient.user, next_monday_at(9))
+        second = self.hold(self.patient.user, next_monday_at(10))
+        self.assertEqual(second.status_code, 201, second.data)
+        self.assertEqual(list(SlotHold.objects.values_list('id', flat=True)), [second.data['id']])
+        # le premier créneau est de nouveau libre pour les autres
+        self.assertNotEqual(first.data['id'], second.data['id'])
+        book_consultation(self.doctor, self.patient, next_monday_at(9), user=self.admin)
+
+    def test_invalid_start_time_is_rejected(self):
+        for value in ('2030-02-30T09:00:00Z', 'demain', 42):
+            response = self.client_for(self.patient.user).post(
+                f'/api/doctor-calendar/{self.doctor.id}/holds/', {'start_time': value}, format='json'
+            )
+            self.assertEqual(response.status_code, 400, value)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_expired_hold_is_ignored(self):
+        self.hold(self.patient.user, next_monday_at(9))
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        book_consultation(self.doctor, self.patient, next_monday_at(9), user=self.admin)
+
+
+class DatabaseConflictEndpointTests(BookingTestMixin, TestCase):
+    """
+    Course perdue sous PostgreSQL: les vérifications applicatives ne voient pas
+    encore la réservation concurrente et seule la contrainte d'exclusion refuse
+    l'insertion. Chaque point d'entrée doit répondre par un conflit, pas une 500.
+    """
+
+    def post_as_race_loser(self, url, data):
+        other = Patient.objects.create(
+            user=User.objects.create_user(
+                username='late', email='late@test.com', password='x', role='PATIENT', is_approved=True
+            ),
+            nom='Late', address='Tunis'
+        )
+        book_consultation(self.doctor, self.patient, next_monday_at(9))
+        install_overlap_trigger('doctor_id', CONSULTATION_OVERLAP_CONSTRAINT)
+        user = other.user if url.startswith('/api/patient/') else self.admin
+        with mock.patch('users.models.has_overlap_constraint', return_value=True), \
+                mock.patch('users.booking.intervals.is_slot_free', return_value=True):
+            return self.client_for(user).post(
+                url, {**data, 'patient': other.id, 'start_time': next_monday_at(9).isoformat()}, format='json'
+            )
+
+    def assertConflict(self, response):
+        self.assertIn(response.status_code, (400, 409), response.data)
+        self.assertEqual(response.data['code'], 'conflict')
+        self.assertEqual(Consultation.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_patient_endpoint(self):
+        self.assertConflict(self.post_as_race_loser('/api/patient/rendez-vous/', {'doctor': self.doctor.id}))
+
+    def test_admin_calendar_endpoint(self):
+        self.assertConflict(self.post_as_race_loser('/api/Admin/calendar/consultations/', {'doctor': self.doctor.id}))
+
+    def test_admin_consultation_endpoint(self):
+        self.assertConflict(self.post_as_race_loser('/api/Admin/consultations/', {'doctor': self.doctor.id}))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concurrence réelle: SQLite sérialise les écritures et le verrou applicatif décide')
+class BookingConcurrencyTests(BookingTestMixin, TransactionTestCase):
+    """
+    Réservations simultanées du même créneau par plusieurs threads (chacun avec
+    sa connexion): une seule doit réussir, quel que soit le point d'entrée.
+    Sous PostgreSQL seulement: c'est la contrainte d'exclusion qui arbitre.
+    Sous SQLite, voir DatabaseConflictEndpointTests.
+    """
+    WORKERS = 12
+
+    def setUp(self):
+        super().setUp()
+        self.patients = [self.patient] + [
+            Patient.objects.create(
+                user=User.objects.create_user(
+                    username=f'pat{i}', email=f'pat{i}@test.com', password='x', role='PATIENT', is_approved=True
+                ),
+                nom=f'Patient{i}', address='Tunis'
+            )
+            for i in range(1, self.WORKERS)
+        ]
+
+    def race(self, name, request_for):
+        """Lance ``request_for(i)`` dans WORKERS threads au même instant; retourne les statuts HTTP"""
+        barrier = threading.Barrier(self.WORKERS)
+
+        def worker(i):
+            try:
+                barrier.wait()
+                started = time.perf_counter()
+                response = request_for(i)
+                return response.status_code, time.perf_counter() - started
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(worker, range(self.WORKERS)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        p95 = latencies[max(0, int(len(latencies) * 0.95 + 0.5) - 1)]
+        sys.stderr.write(
+            f'\n{name}: {self.WORKERS} requêtes en {elapsed:.3f}s '
+            f'({self.WORKERS / elapsed:.1f} req/s), p95 {p95 * 1000:.1f} ms\n'
+        )
+        return [code for code, _ in results]
+
+    def assertSingleBooking(self, codes, start):
+        self.assertEqual(codes.count(201), 1, codes)
+        self.assertTrue(all(code in (400, 409) for code in codes if code != 201), codes)
+        self.assertEqual(Consultation.objects.filter(doctor=self.doctor, start_time=start).count(), 1)
+
+    def test_patient_endpoint(self):
+        start = next_monday_at(9)
+        codes = self.race('patient/rendez-vous', lambda i: self.client_for(self.patients[i].user).post(
+            '/api/patient/rendez-vous/', {'doctor': self.doctor.id, 'start_time': start.isoformat()}, format='json'
+        ))
+        self.assertSingleBooking(codes, start)
+
+    def test_admin_calendar_endpoint(self):
+        start = next_monday_at(10)
+        codes = self.race('Admin/calendar/consultations', lambda i: self.client_for(self.admin).post(
+            '/api/Admin/calendar/consultations/',
+            {'doctor': self.doctor.id, 'patient': self.patients[i].id, 'start_time': start.isoformat()},
+            format='json'
+        ))
+        self.assertSingleBooking(codes, start)
+
+    def test_admin_consultation_endpoint(self):
+        start = next_monday_at(11)
+        codes = self.race('Admin/consultations', lambda i: self.client_for(self.admin).post(
+            '/api/Admin/consultations/',
+            {'doctor': self.doctor.id, 'patient': self.patients[i].id, 'start_time': start.isoformat()},
+            format='json'
+        ))
+        self.assertSingleBooking(codes, start)
+
+
+class DoctorCalendarDayBucketTests(BookingTestMixin, TestCase):
+    @override_settings(TIME_ZONE='Africa/Tunis')
+    def test_consultations_are_grouped_by_local_day(self):
+        # 00:30 à Tunis = 23:30 UTC la veille
+        local_day = next_monday_at(9).date() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(local_day, datetime.min.time())) + timedelta(minutes=30)
+        consultation = Consultation.objects.create(doctor=self.doctor, patient=self.patient, start_time=start)
+        self.assertEqual(start.astimezone(dt_timezone.utc).date(), local_day - timedelta(days=1))
+
+        response = self.client_for(self.doctor.user).get('/api/doctor-calendar/consultations/', {
+            'start_date': (local_day - timedelta(days=1)).isoformat(), 'end_date': local_day.isoformat()
+        })
+        self.assertEqual(response.data['consultations_by_date'], {local_day.isoformat(): [consultation.id]})
+        self.assertEqual(response.data['consultations'][0]['date'], local_day)
+
+
+class ConsultationDailyStatTests(BookingTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        other_user = User.objects.create_user(
+            username='pat2', email='pat2@test.com', password='x', role='PATIENT', is_approved=True
+        )
+        self.other_patient = Patient.objects.create(user=other_user, nom='Roe', prenom='Jane', address='Sfax')
+
+    def stats(self):
+        return list(ConsultationDailyStat.objects.order_by('date').values_list('date', 'count', 'unique_patients'))
+
+    def test_rollup_follows_bookings_moves_and_deletes(self):
+        monday = next_monday_at(9).date()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = book_consultation(self.doctor, self.patient, next_monday_at(9))
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(10))
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.other_patient, next_monday_at(11))
+        self.assertEqual(self.stats(), [(monday, 3, 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9) + timedelta(days=1), consultation=first)
+        self.assertEqual(self.stats(), [(monday, 2, 2), (monday + timedelta(days=1), 1, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.get(pk=first.pk).delete()
+        self.assertEqual(self.stats(), [(monday, 2, 2)])
+
+    def test_batch_booking_and_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.admin).post('/api/Admin/calendar/consultations/batch/', {
+                'doctor': self.doctor.id, 'patient': self.patient.id,
+                'start_time': next_monday_at(10).isoformat(),
+                'recurrence': {'frequency': 'weekly', 'count': 3}
+            }, format='json')
+        incremental = self.stats()
+        self.assertEqual([count for _, count, _ in incremental], [1, 1, 1])
+
+        ConsultationDailyStat.objects.update(count=0)
+        call_command('rebuild_consultation_stats', '--chunk-days', '2', stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_dashboards_read_the_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+            book_consultation(self.doctor, self.other_patient, next_monday_at(10))
+
+        response = self.client_for(self.admin).get('/api/users/dashboard/admin/stats/')
+        self.assertEqual(response.data['overview']['total_consultations'], 2)
+        self.assertEqual(response.data['consultations']['upcoming'], 2)
+        self.assertEqual(response.data['top_doctors'][0]['consultations_count'], 2)
+        self.assertEqual(response.data['consultations_by_specialty'], [{'specialty': 'Cardiologie', 'count': 2}])
+
+        response = self.client_for(self.admin).get('/api/users/rapports/clinique/')
+        self.assertEqual(response.data['resume']['consultations_a_venir'], 2)
+        self.assertEqual(response.data['resume']['consultations_7_jours'], 2)
+
+        response = self.client_for(self.admin).get('/api/users/rapports/consultations/')
+        self.assertEqual(response.data['consultations_par_jour'], [{'jour': 'Lundi', 'count': 2}])
+
+        response = self.client_for(self.doctor.user).get('/api/users/dashboard/doctor/stats/')
+        self.assertEqual(response.data['overview']['total_consultations'], 2)
+        self.assertEqual(response.data['overview']['total_patients'], 2)
+
+
+class DashboardStatsQueryCountTests(BookingTestMixin, TestCase):
+    def test_admin_dashboard_query_count_does_not_depend_on_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for hour in (9, 10, 11):
+                book_consultation(self.doctor, self.patient, next_monday_at(hour))
+        client = self.client_for(self.admin)
+        # patients, médecins, agrégat journalier, jour entamé, top médecins, spécialités
+        with self.assertNumQueries(6):
+            response = client.get('/api/users/dashboard/admin/stats/')
+        self.assertEqual(response.data['overview']['total_patients'], 1)
+        self.assertEqual(response.data['overview']['approved_doctors'], 1)
+        self.assertEqual(response.data['consultations']['upcoming'], 3)
+
+    def test_facture_stats_single_query(self):
+        Facture.objects.create(patient=self.patient, montant=Decimal('40.00'), statut='PAYEE')
+        Facture.objects.create(patient=self.patient, montant=Decimal('25.50'))
+        client = self.client_for(self.admin)
+        with self.assertNumQueries(1):
+            response = client.get('/api/factures/stats/')
+        self.assertEqual(response.data['factures_count'], {'total': 2, 'payees': 1, 'en_attente': 1, 'annulees': 0})
+        self.assertEqual(response.data['montants'], {'total': 65.5, 'paye': 40.0, 'en_attente': 25.5})
+
+
+class DashboardCacheTests(BookingTestMixin, TestCase):
+    url = '/api/users/dashboard/admin/stats/'
+
+    def test_cached_until_a_consultation_changes(self):
+        client = self.client_for(self.admin)
+        self.assertEqual(client.get(self.url).data['overview']['total_consultations'], 0)
+        with self.assertNumQueries(0):
+            client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+        self.assertEqual(client.get(self.url).data['overview']['total_consultations'], 1)
+
+        stats = self.client_for(self.admin).get('/api/users/dashboard/admin/cache/').data
+        self.assertEqual(stats['dashboards']['admin'], {'hits': 1, 'misses': 2})
+
+    def test_scopes_are_per_doctor_and_patient(self):
+        doctor_client = self.client_for(self.doctor.user)
+        patient_client = self.client_for(self.patient.user)
+        doctor_client.get('/api/users/dashboard/doctor/stats/')
+        patient_client.get('/api/users/dashboard/patient/stats/')
+
+        # Un dossier ne concerne que le dashboard du patient
+        with self.captureOnCommitCallbacks(execute=True):
+            DossierMedical.objects.create(patient=self.patient, observations='Bilan')
+        doctor_client.get('/api/users/dashboard/doctor/stats/')
+        response = patient_client.get('/api/users/dashboard/patient/stats/')
+        self.assertEqual(response.data['overview']['total_dossiers'], 1)
+        self.assertEqual(dashboard_cache.stats()['dashboards'], {
+            'doctor': {'hits': 1, 'misses': 1},
+            'patient': {'hits': 0, 'misses': 2},
+        })
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RapportCliniqueTests(BookingTestMixin, TestCase):
+    url = '/api/users/rapports/clinique/pdf/'
+
+    def test_report_period(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+            book_consultation(self.doctor, self.patient, next_monday_at(9) + timedelta(weeks=1))
+        monday = next_monday_at(9).date().isoformat()
+        client = self.client_for(self.admin)
+
+        response = client.get('/api/users/rapports/clinique/', {'date_debut': monday, 'date_fin': monday})
+        self.assertEqual(response.data['periode'], {'debut': monday, 'fin': monday})
+        self.assertEqual(response.data['resume']['total_consultations'], 1)
+        self.assertEqual(response.data['resume']['consultations_a_venir'], 2)
+        self.assertEqual(client.get('/api/users/rapports/clinique/', {'date_debut': 'hier'}).status_code, 400)
+
+    def test_unknown_job(self):
+        response = self.client_for(self.admin).get('/api/users/rapports/jobs/clinique_debut_fin_0123456789abcdef/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client_for(self.admin).get('/api/users/rapports/jobs/..%2F..%2Fsettings/')
+        self.assertEqual(response.status_code, 404)
+
+    @skipIf(reports.REPORTLAB_AVAILABLE, 'reportlab installé')
+    def test_pdf_requires_reportlab(self):
+        self.assertEqual(self.client_for(self.admin).post(self.url).status_code, 500)
+
+    @skipUnless(reports.REPORTLAB_AVAILABLE, 'reportlab non installé')
+    def test_pdf_rendered_once_per_data_version(self):
+        client = self.client_for(self.admin)
+        response = client.post(self.url, {'date_debut': '2026-01-01'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        deadline = time.monotonic() + 30
+        while client.get(f'/api/users/rapports/jobs/{job_id}/').data['statut'] != 'pret':
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+        response = client.get(self.url, {'date_debut': '2026-01-01'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(client.post(self.url, {'date_debut': '2026-01-01'}).data['id'], job_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+        self.assertNotEqual(client.post(self.url, {'date_debut': '2026-01-01'}).data['id'], job_id)
+
+
+class ReportSnapshotTests(BookingTestMixin, TestCase):
+    def test_snapshot_memoized_until_data_changes(self):
+        first = report_stats.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertIs(report_stats.get_snapshot(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+        snapshot = report_stats.get_snapshot()
+        self.assertEqual(snapshot.total_consultations, 1)
+        self.assertEqual(snapshot.top_medecins[0].consultations, 1)
+        self.assertNotEqual(snapshot.fingerprint(), first.fingerprint())
+
+    def test_least_recently_used_window_is_evicted(self):
+        january, february, march = (datetime(2026, month, 1).date() for month in (1, 2, 3))
+        with mock.patch.object(report_stats, 'MAX_SNAPSHOTS', 2):
+            report_stats.get_snapshot(january)
+            report_stats.get_snapshot(february)
+            report_stats.get_snapshot(january)
+            report_stats.get_snapshot(march)
+            with self.assertNumQueries(0):
+                report_stats.get_snapshot(january)
+            with self.assertNumQueries(6):
+                report_stats.get_snapshot(february)
+
+
+class ConsultationSeriesTests(BookingTestMixin, TestCase):
+    url = '/api/users/rapports/consultations/'
+
+    def setUp(self):
+        super().setUp()
+        other_user = User.objects.create_user(
+            username='doc2', email='doc2@test.com', password='x', role='DOCTOR', is_approved=True
+        )
+        self.other_doctor = Doctor.objects.create(
+            user=other_user, nom='Grey', prenom='Meredith', specialty='Pédiatrie',
+            phone='0600000001', schedule='Lun-Ven 9:00-17:00'
+        )
+        patient_user = User.objects.create_user(
+            username='pat2', email='pat2@test.com', password='x', role='PATIENT', is_approved=True
+        )
+        other_patient = Patient.objects.create(user=patient_user, nom='Roe', prenom='Jane', address='Sfax')
+        with self.captureOnCommitCallbacks(execute=True):
+            book_consultation(self.doctor, self.patient, next_monday_at(9))
+            book_consultation(self.doctor, self.patient, next_monday_at(10))
+            book_consultation(self.other_doctor, other_patient, next_monday_at(9, 30))
+            book_consultation(self.doctor, self.patient, next_monday_at(9) + timedelta(days=2))
+        self.monday = next_monday_at(9).date()
+
+    def test_day_series_zero_filled_by_specialty(self):
+        with self.assertNumQueries(1):
+            series = stats.consultation_series(
+                'day', self.monday, self.monday + timedelta(days=3), breakdown='specialty'
+            )
+        self.assertEqual(series['periodes'][0], self.monday.isoformat())
+        self.assertEqual(series['series'], [
+            {'key': 'Cardiologie', 'label': 'Cardiologie', 'total': 3, 'points': [2, 0, 1, 0]},
+            {'key': 'Pédiatrie', 'label': 'Pédiatrie', 'total': 1, 'points': [1, 0, 0, 0]},
+        ])
+
+    def test_hour_and_month_granularity(self):
+        hourly = stats.consultation_series('hour', self.monday, self.monday, doctor_id=self.doctor.id)
+        self.assertEqual(len(hourly['periodes']), 24)
+        self.assertEqual(hourly['series'][0]['points'][9:11], [1, 1])
+
+        monthly = stats.consultation_series('month', self.monday, self.monday + timedelta(days=2))
+        self.assertEqual(monthly['series'][0]['total'], 4)
+
+    def test_endpoint_parameters(self):
+        client = self.client_for(self.admin)
+        response = client.get(self.url, {
+            'granularity': 'week', 'breakdown': 'doctor',
+            'date_debut': self.monday.isoformat(), 'date_fin': (self.monday + timedelta(days=13)).isoformat()
+        })
+        evolution = response.data['evolution']
+        self.assertEqual(evolution['periodes'], [self.monday.isoformat(), (self.monday + timedelta(weeks=1)).isoformat()])
+        self.assertEqual(evolution['series'][0]['label'], 'Dr. House Greg')
+        self.assertEqual(evolution['series'][0]['points'], [3, 0])
+        self.assertNotIn('evolution', client.get(self.url).data)
+        self.assertEqual(client.get(self.url, {'granularity': 'year'}).status_code, 400)
+
+
+class MotifNormalizationTests(BookingTestMixin, TestCase):
+    def test_variants_share_a_code(self):
+        self.assertEqual({motif_code(m) for m in ('Fièvre', 'fievre ', 'fièvre.', 'Température')}, {'fievre'})
+        self.assertEqual(motif_code('Mal de tête !'), 'cephalees')
+        self.assertEqual(motif_code('Douleur   au genou'), 'douleur-au-genou')
+        self.assertEqual(motif_code(''), '')
+        self.assertEqual(motif_label('douleur-au-genou'), 'Douleur au genou')
+
+    def test_top_motifs_and_filter_use_code(self):
+        for hour, motif in ((9, 'Fièvre'), (10, 'fievre '), (11, 'Contrôle'), (12, 'fièvre.')):
+            book_consultation(self.doctor, self.patient, next_monday_at(hour), motif=motif)
+
+        response = self.client_for(self.admin).get('/api/users/rapports/consultations/')
+        self.assertEqual(response.data['motifs_frequents'], [
+            {'motif': 'Fièvre', 'motif_code': 'fievre', 'count': 3},
+            {'motif': 'Consultation de suivi', 'motif_code': 'suivi', 'count': 1},
+        ])
+
+        response = self.client_for(self.doctor.user).get(
+            '/api/doctor-patient/doctor/consultations/', {'motif': 'FIÈV'}
+        )
+        self.assertEqual(len(response.data), 3)
+
+    def search(self, motif):
+        response = self.client_for(self.doctor.user).get('/api/doctor-patient/doctor/consultations/', {'motif': motif})
+        return sorted(c['motif'] for c in response.data)
+
+    def test_filter_matches_code_prefix_or_synonym(self):
+        for hour, motif in ((9, 'Forte douleur abdominale'), (10, 'Migraine'), (11, 'Fièvre'), (12, 'Douleur au genou')):
+            book_consultation(self.doctor, self.patient, next_monday_at(hour), motif=motif)
+
+        self.assertEqual(self.search('douleur'), ['Douleur au genou'])
+        self.assertEqual(self.search('Forte dou'), ['Forte douleur abdominale'])
+        # code cephalees: trouvé par un synonyme, pas par le texte saisi (non indexé)
+        self.assertEqual(self.search('mal de tête'), ['Migraine'])
+        self.assertEqual(self.search('migr'), [])
+        self.assertEqual(self.search('Température'), ['Fièvre'])
+        self.assertEqual(self.search('?!'), [])
+
+    def test_filter_uses_motif_code_only(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.search('douleur')
+        sql = next(q for q in data_queries(ctx) if 'users_consultation' in q and 'motif_code' in q)
+        self.assertIn('"users_consultation"."motif_code" LIKE', sql)
+        self.assertNotIn('"users_consultation"."motif" LIKE', sql)
+        self.assertNotIn("'%douleur%'", sql)
+
+    def test_update_recomputes_code(self):
+        consultation = book_consultation(self.doctor, self.patient, next_monday_at(9), motif='Fièvre')
+        consultation.motif = 'Migraine'
+        consultation.save(update_fields=['motif'])
+        consultation.refresh_from_db()
+        self.assertEqual(consultation.motif_code, 'cephalees')
+
+    def test_backfill_command(self):
+        for hour in (9, 10, 11):
+            book_consultation(self.doctor, self.patient, next_monday_at(hour), motif='Vaccin')
+        Consultation.objects.update(motif_code='')
+        out = StringIO()
+        call_command('backfill_motif_codes', batch_size=2, stdout=out)
+        self.assertIn('3 consultation(s)', out.getvalue())
+        self.assertEqual(set(Consultation.objects.values_list('motif_code', flat=True)), {'vaccination'})
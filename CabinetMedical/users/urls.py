@@ -1,7 +1,9 @@
 from django.urls import path
 from .views import *
 from .dashboard_views import (
+    AdminDashboardCacheStatsView,
     AdminDashboardStatsView,
+    AdminOccupancyView,
     DoctorDashboardStatsView,
     PatientDashboardStatsView
 )
@@ -10,6 +12,7 @@ from .dashboard_views import (
 from .rapport_views import (
     RapportCliniqueView,
     RapportCliniquePDFView,
+    RapportJobView,
     StatistiquesConsultationsView,
     RechercheAvanceeView
 )
@@ -24,6 +27,8 @@ urlpatterns = [
 
     # Dashboard Statistics
     path('dashboard/admin/stats/', AdminDashboardStatsView.as_view(), name='admin-dashboard-stats'),
+    path('dashboard/admin/occupancy/', AdminOccupancyView.as_view(), name='admin-dashboard-occupancy'),
+    path('dashboard/admin/cache/', AdminDashboardCacheStatsView.as_view(), name='admin-dashboard-cache'),
     path('dashboard/doctor/stats/', DoctorDashboardStatsView.as_view(), name='doctor-dashboard-stats'),
     path('dashboard/patient/stats/', PatientDashboardStatsView.as_view(), name='patient-dashboard-stats'),
 
@@ -34,6 +39,7 @@ urlpatterns = [
     # Rapports et Statistiques
     path('rapports/clinique/', RapportCliniqueView.as_view(), name='rapport-clinique'),
     path('rapports/clinique/pdf/', RapportCliniquePDFView.as_view(), name='rapport-clinique-pdf'),
+    path('rapports/jobs/<str:job_id>/', RapportJobView.as_view(), name='rapport-job'),
     path('rapports/consultations/', StatistiquesConsultationsView.as_view(), name='stats-consultations'),
     path('recherche/', RechercheAvanceeView.as_view(), name='recherche-avancee'),
 ]
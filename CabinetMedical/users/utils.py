@@ -1,5 +1,6 @@
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
 
 def send_admin_notification(user):
     approve_link = f"http://127.0.0.1:8000/api/users/approve/{user.id}/"
@@ -43,3 +44,24 @@ def send_approval_email(user):
         [user.email],
         fail_silently=False
     )
+
+def send_waitlist_offer_email(entry):
+    patient_user = entry.patient.user
+    start = timezone.localtime(entry.offered_start_time)
+    expires = timezone.localtime(entry.offer_expires_at)
+    subject = "Un créneau s'est libéré"
+    message = (
+        f"Bonjour {patient_user.username},\n\n"
+        f"Un créneau s'est libéré chez le Dr. {entry.doctor.nom} {entry.doctor.prenom} "
+        f"le {start:%d/%m/%Y à %H:%M}. Il vous est réservé jusqu'au {expires:%d/%m/%Y à %H:%M}.\n\n"
+        "Acceptez ou refusez la proposition depuis votre liste d'attente.\n\n"
+        "Cordialement,\nL'équipe"
+    )
+    from_email = settings.EMAIL_HOST_USER
+    to = [patient_user.email]
+
+    try:
+        send_mail(subject, message, from_email, to, fail_silently=False)
+        print(f"[mail] proposition de créneau envoyée à {patient_user.email}")
+    except Exception as e:
+        print(f"[mail] Erreur envoi proposition de créneau: {e}")
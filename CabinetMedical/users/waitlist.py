@@ -0,0 +1,155 @@
+"""
+Liste d'attente: un créneau libéré par une annulation est proposé au premier
+patient en attente chez ce docteur dont la fenêtre le contient.
+
+La recherche passe par l'index (doctor, statut, window_start): seules les
+demandes en attente du docteur qui commencent avant le créneau sont lues.
+
+Le créneau proposé est gardé (SlotHold) au nom du patient jusqu'à
+``offer_expires_at`` et le patient est prévenu par email. Une proposition sans
+réponse à l'échéance repart en attente et le créneau passe au suivant
+(``expire_offers``, commande ``expire_waitlist_offers``).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .booking import BookingError, book_consultation
+from .holds import create_hold
+from .models import SlotHold, WaitlistEntry
+from .schedule import SLOT_DURATION
+from .utils import send_waitlist_offer_email
+
+# Délai de réponse à une proposition (jamais au-delà du début du créneau)
+OFFER_DURATION = timedelta(hours=2)
+
+
+def offer_freed_slot(doctor_id, start_time, exclude_patient_id=None):
+    """
+    Propose le créneau [start_time, start_time + 30 min) au premier patient
+    éligible et le lui garde. Retourne la demande mise à jour, ou None.
+    """
+    now = timezone.now()
+    if start_time <= now:
+        return None
+    end_time = start_time + SLOT_DURATION
+
+    with transaction.atomic():
+        candidates = WaitlistEntry.objects.select_for_update(skip_locked=True).filter(
+            doctor_id=doctor_id,
+            statut='EN_ATTENTE',
+            window_start__lte=start_time,
+            window_end__gte=end_time
+        )
+        if exclude_patient_id is not None:
+            candidates = candidates.exclude(patient_id=exclude_patient_id)
+        entry = candidates.order_by('created_at').first()
+        if entry is None:
+            return None
+        try:
+            hold = create_hold(
+                doctor_id, start_time, entry.patient.user,
+                duration=min(OFFER_DURATION, start_time - now), exclusive=False
+            )
+        except BookingError:
+            # Créneau repris ou gardé entre-temps: rien à proposer
+            return None
+        entry.statut = 'PROPOSE'
+        entry.offered_start_time = start_time
+        entry.offer_expires_at = hold.expires_at
+        entry.save(update_fields=['statut', 'offered_start_time', 'offer_expires_at'])
+        transaction.on_commit(lambda: send_waitlist_offer_email(entry))
+    return entry
+
+
+def accept_offer(entry):
+    """
+    Réserve le créneau proposé; s'il a été pris entre-temps, la demande repart en attente.
+
+    La demande est verrouillée pendant toute l'opération: une expiration
+    concurrente (expire_offers) ne peut pas passer le créneau au suivant entre
+    la vérification de l'échéance et la réservation.
+    """
+    error = consultation = None
+    with transaction.atomic():
+        entry = WaitlistEntry.objects.select_for_update().get(pk=entry.pk)
+        if entry.statut != 'PROPOSE':
+            raise BookingError('no_offer', 'Aucun créneau proposé pour cette demande')
+        start_time = entry.offered_start_time
+        if entry.offer_expires_at is not None and entry.offer_expires_at <= timezone.now():
+            _roll_over(entry)
+            error = BookingError('offer_expired', 'Le délai de réponse à cette proposition est dépassé', status=409)
+        else:
+            try:
+                consultation = book_consultation(
+                    entry.doctor_id, entry.patient, start_time, entry.motif, user=entry.patient.user
+                )
+            except BookingError as e:
+                _back_to_waiting(entry)
+                # Créneau toujours libre mais pas pour ce patient: le proposer au suivant
+                if e.code != 'conflict':
+                    offer_freed_slot(entry.doctor_id, start_time, exclude_patient_id=entry.patient_id)
+                error = e
+            else:
+                entry.statut = 'SATISFAIT'
+                entry.offer_expires_at = None
+                entry.save(update_fields=['statut', 'offer_expires_at'])
+    # Levée hors de la transaction: la remise en attente est conservée
+    if error is not None:
+        raise error
+    return consultation
+
+
+def decline_offer(entry):
+    """Le patient refuse: il reste en attente et le créneau passe au suivant."""
+    if entry.statut != 'PROPOSE':
+        raise BookingError('no_offer', 'Aucun créneau proposé pour cette demande')
+    return _roll_over(entry)
+
+
+def withdraw(entry):
+    """Supprime la demande; un créneau qui lui était proposé passe au suivant."""
+    offered = entry.statut == 'PROPOSE'
+    if offered:
+        _release(entry)
+    entry.delete()
+    if offered:
+        offer_freed_slot(entry.doctor_id, entry.offered_start_time, exclude_patient_id=entry.patient_id)
+
+
+def expire_offers():
+    """Remet en attente les propositions échues et propose leurs créneaux au suivant; retourne leur nombre."""
+    now = timezone.now()
+    expired = WaitlistEntry.objects.filter(statut='PROPOSE', offer_expires_at__lte=now)
+    count = 0
+    for entry_id in list(expired.values_list('id', flat=True)):
+        with transaction.atomic():
+            # Une acceptation en cours garde son verrou: la demande est laissée de côté
+            entry = expired.select_for_update(skip_locked=True).filter(pk=entry_id).first()
+            if entry is None:
+                continue
+            _roll_over(entry)
+            count += 1
+    return count
+
+
+def _roll_over(entry):
+    start_time = entry.offered_start_time
+    _back_to_waiting(entry)
+    return offer_freed_slot(entry.doctor_id, start_time, exclude_patient_id=entry.patient_id)
+
+
+def _back_to_waiting(entry):
+    _release(entry)
+    entry.statut = 'EN_ATTENTE'
+    entry.offered_start_time = None
+    entry.offer_expires_at = None
+    entry.save(update_fields=['statut', 'offered_start_time', 'offer_expires_at'])
+
+
+def _release(entry):
+    """Supprime la garde du créneau proposé au patient"""
+    SlotHold.objects.filter(
+        doctor_id=entry.doctor_id, start_time=entry.offered_start_time, user_id=entry.patient.user_id
+    ).delete()
@@ -34,8 +34,19 @@ export interface CalendarPatient {
 
 export interface CalendarData {
   consultations: CalendarConsultation[];
-  doctors: CalendarDoctor[];
-  patients: CalendarPatient[];
+  doctors?: CalendarDoctor[];
+  patients?: CalendarPatient[];
+  // Synchronisation incrémentale: ids à retirer, réponse complète ou partielle, token du prochain appel
+  deleted?: number[];
+  full: boolean;
+  token: string;
+}
+
+export interface PaginatedPatients {
+  count: number;
+  next: string | null;
+  previous: string | null;
+  results: CalendarPatient[];
 }
 
 export interface CreateCalendarConsultation {
@@ -63,16 +74,34 @@ export class AdminCalendarService {
   constructor(private http: HttpClient) {}
 
   /**
-   * Récupère les données du calendrier (consultations + doctors + patients)
+   * Récupère les consultations du calendrier
+   * Avec `since` (token du dernier appel), seuls les changements sont renvoyés
    */
-  getCalendarData(filters?: { start?: string; end?: string; doctor_id?: number }): Observable<CalendarData> {
+  getCalendarData(filters?: { start?: string; end?: string; doctor_id?: number; since?: string }): Observable<CalendarData> {
     let params = new HttpParams();
     if (filters?.start) params = params.set('start', filters.start);
     if (filters?.end) params = params.set('end', filters.end);
     if (filters?.doctor_id) params = params.set('doctor_id', filters.doctor_id.toString());
+    if (filters?.since) params = params.set('since', filters.since);
     return this.http.get<CalendarData>(this.API_URL, { params });
   }
 
+  /**
+   * Liste des médecins (réponse revalidée par ETag: 304 si rien n'a changé)
+   */
+  getDoctors(): Observable<CalendarDoctor[]> {
+    return this.http.get<CalendarDoctor[]>(`${this.API_URL}doctors/`);
+  }
+
+  /**
+   * Recherche paginée de patients pour le sélecteur
+   */
+  searchPatients(q = '', page = 1): Observable<PaginatedPatients> {
+    let params = new HttpParams().set('page', page.toString());
+    if (q) params = params.set('q', q);
+    return this.http.get<PaginatedPatients>(`${this.API_URL}patients/`, { params });
+  }
+
   /**
    * Crée une nouvelle consultation depuis le calendrier
    */
@@ -70,7 +70,9 @@ export interface CalendarResponse {
     end: string;
   };
   total_consultations: number;
-  consultations_by_date: { [date: string]: any[] };
+  // Index jour local -> ids des consultations de ce jour
+  consultations_by_date: { [date: string]: number[] };
+  consultations: any[];
 }
 
 export interface CalendarConsultation {
@@ -28,6 +28,7 @@ export class CalenderComponent implements OnInit {
   consultations: CalendarConsultation[] = [];
   doctors: CalendarDoctor[] = [];
   patients: CalendarPatient[] = [];
+  patientSearch = '';
 
   // Modal
   showModal = false;
@@ -73,20 +74,39 @@ export class CalenderComponent implements OnInit {
   constructor(private calendarService: AdminCalendarService) {}
 
   ngOnInit(): void {
+    this.loadDoctors();
+    this.searchPatients();
     this.loadCalendarData();
   }
 
+  loadDoctors(): void {
+    this.calendarService.getDoctors().subscribe({
+      next: (doctors) => this.doctors = doctors,
+      error: () => this.error = 'Erreur lors du chargement des médecins'
+    });
+  }
+
+  searchPatients(q = ''): void {
+    this.calendarService.searchPatients(q).subscribe({
+      next: (page) => {
+        // Garder le patient sélectionné même s'il n'est pas dans les résultats
+        const selected = this.patients.find(p => p.id === this.selectedPatientId);
+        this.patients = page.results;
+        if (selected && !this.patients.some(p => p.id === selected.id)) {
+          this.patients = [selected, ...this.patients];
+        }
+      },
+      error: () => this.error = 'Erreur lors du chargement des patients'
+    });
+  }
+
   loadCalendarData(): void {
     this.loading = true;
     console.log('Loading calendar data...');
     this.calendarService.getCalendarData().subscribe({
       next: (data) => {
         console.log('Calendar data received:', data);
-        console.log('Doctors:', data.doctors);
-        console.log('Patients:', data.patients);
         this.consultations = data.consultations || [];
-        this.doctors = data.doctors || [];
-        this.patients = data.patients || [];
         this.updateCalendarEvents();
         this.loading = false;
       },
@@ -136,7 +156,14 @@ export class CalenderComponent implements OnInit {
       this.selectedConsultation = consultation;
       this.modalTitle = 'Modifier le rendez-vous';
       
-      // Remplir le formulaire
+      // Remplir le formulaire (le patient peut ne pas être dans la page chargée)
+      if (!this.patients.some(p => p.id === consultation.patient_id)) {
+        const [prenom, ...nom] = consultation.patient_nom.split(' ');
+        this.patients = [
+          { id: consultation.patient_id, prenom, nom: nom.join(' '), nom_complet: consultation.patient_nom },
+          ...this.patients
+        ];
+      }
       this.selectedPatientId = consultation.patient_id;
       this.selectedDoctorId = consultation.doctor_id;
       const startDate = new Date(consultation.start_time);
@@ -67,33 +67,26 @@ export class CalendarComponent implements OnInit {
         this.consultations = [];
 
         // Vérifier si la réponse contient des données
-        if (!response || !response.consultations_by_date) {
+        if (!response || !response.consultations) {
           console.warn('Aucune consultation trouvée dans la réponse');
           this.loading = false;
           return;
         }
 
-        Object.entries(response.consultations_by_date).forEach(
-          ([date, dayConsultations]: any) => {
-            if (Array.isArray(dayConsultations)) {
-              dayConsultations.forEach((c: any) => {
-                console.log('Consultation individuelle:', c); // Debug détaillé
-
-                this.consultations.push({
-                  id: c.id,
-                  patient_id: c.patient_id,
-                  patient_nom: c.patient_nom || c.patient_name || `Patient ${c.patient_id}`,
-                  patient_email: c.patient_email || c.email || '',
-                  patient_telephone: c.patient_telephone || c.phone || c.telephone || '',
-                  date,
-                  heure: c.heure || c.hour || '00:00',
-                  motif: c.motif || c.reason || 'Consultation',
-                  statut: c.statut || c.status || 'En attente'
-                });
-              });
-            }
-          }
-        );
+        // `date` est le jour local calculé par le serveur, l'heure est convertie en heure locale
+        response.consultations.forEach((c: any) => {
+          this.consultations.push({
+            id: c.id,
+            patient_id: c.patient_id,
+            patient_nom: c.patient_nom || c.patient_name || `Patient ${c.patient_id}`,
+            patient_email: c.patient_email || c.email || '',
+            patient_telephone: c.patient_telephone || c.phone || c.telephone || '',
+            date: c.date,
+            heure: new Date(c.start_time).toTimeString().slice(0, 5),
+            motif: c.motif || c.reason || 'Consultation',
+            statut: c.statut || c.status || 'En attente'
+          });
+        });
 
         console.log('Consultations traitées:', this.consultations); // Debug
 